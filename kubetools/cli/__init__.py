@@ -1,3 +1,5 @@
+from fnmatch import fnmatch
+
 import click
 
 from kubernetes import config
@@ -89,25 +91,49 @@ def print_contexts(ctx, param, value):
     ctx.exit()
 
 
-def ensure_context(ctx, param, value):
+def ensure_contexts(ctx, param, value):
+    '''
+    Resolve the (possibly repeated) --context option, where each value is either a
+    context name or a glob pattern, to a list of context names.
+    '''
+
     context_names, active_context_name = _get_context_names()
 
-    if value:
-        if value not in context_names:
-            raise click.BadParameter(f'{value}; available contexts: {context_names}')
-    else:
-        click.echo(f'Using active context: {click.style(active_context_name, bold=True)}')
-        value = active_context_name
+    if not value:
+        # Written to stderr so command output (eg show --format json) can be piped
+        click.echo(
+            f'Using active context: {click.style(active_context_name, bold=True)}',
+            err=True,
+        )
+        return [active_context_name]
+
+    contexts = []
+
+    for pattern in value:
+        matched_context_names = [name for name in context_names if fnmatch(name, pattern)]
+        if not matched_context_names:
+            raise click.BadParameter(f'{pattern}; available contexts: {context_names}')
+
+        for name in matched_context_names:
+            if name not in contexts:
+                contexts.append(name)
+
+    if len(contexts) > 1:
+        click.echo(f'Using contexts: {click.style(", ".join(contexts), bold=True)}', err=True)
 
-    return value
+    return contexts
 
 
 @click.group(cls=SpecialHelpOrder)
 @click.option(
-    '--context',
-    callback=ensure_context,
+    'kube_contexts', '--context',
+    multiple=True,
+    callback=ensure_contexts,
     envvar='KUBETOOLS_CONTEXT',
-    help='The name of the Kubernetes context to use.',
+    help=(
+        'The name (or glob pattern) of the Kubernetes context to use, may be given '
+        'multiple times to run against several clusters at once.'
+    ),
 )
 @click.option(
     '--contexts',
@@ -120,12 +146,13 @@ def ensure_context(ctx, param, value):
 @click.option('--debug', is_flag=True, help='Show debug logs.')
 @click.version_option(version=__version__, message='%(prog)s: v%(version)s')
 @click.pass_context
-def cli_bootstrap(ctx, context, debug):
+def cli_bootstrap(ctx, kube_contexts, debug):
     '''
     Kubetools client - deploy apps to Kubernetes.
     '''
 
-    ctx.meta['kube_context'] = context
+    ctx.meta['kube_contexts'] = kube_contexts
+    ctx.meta['kube_context'] = kube_contexts[0]
 
     setup_logging(debug)
     get_settings()
@@ -1,8 +1,12 @@
 import json
 import os
 
+from time import monotonic
+
 import click
 
+from tabulate import tabulate
+
 from kubetools.cli import cli_bootstrap
 from kubetools.deploy.build import Build
 from kubetools.deploy.commands.cleanup import (
@@ -25,7 +29,15 @@ from kubetools.deploy.commands.restart import (
     get_restart_objects,
     log_restart_changes,
 )
-from kubetools.kubernetes.api import get_object_name
+from kubetools.deploy.terminations import check_pending_terminations
+from kubetools.deploy.util import run_concurrently
+from kubetools.exceptions import KubeBuildError
+from kubetools.kubernetes.api import (
+    format_error,
+    get_object_name,
+    is_kubetools_object,
+    iter_namespace_metadata,
+)
 
 
 def _dry_deploy_object_loop(object_type, objects):
@@ -57,6 +69,180 @@ def _dry_deploy_loop(build, services, deployments, jobs):
             _dry_deploy_object_loop(object_type, objects)
 
 
+def _parse_namespaces(ctx, param, value):
+    namespaces = []
+
+    for namespace in value.split(','):
+        namespace = namespace.strip()
+        if namespace and namespace not in namespaces:
+            namespaces.append(namespace)
+
+    if not namespaces:
+        raise click.BadParameter('At least one namespace is required.')
+
+    return namespaces
+
+
+def _make_build(context, namespace, timeout=None, log_prefix_bits=None):
+    return Build(
+        env=context,
+        namespace=namespace,
+        timeout=timeout,
+        log_prefix=f'[{"/".join(log_prefix_bits)}] ' if log_prefix_bits else None,
+    )
+
+
+def _make_builds(ctx, namespaces, timeout=None):
+    '''
+    Make a build for every target Kubernetes context and namespace. When there is
+    more than one, log lines are prefixed to tell them apart.
+    '''
+
+    contexts = ctx.meta['kube_contexts']
+    builds = []
+
+    for context in contexts:
+        for namespace in namespaces:
+            log_prefix_bits = []
+            if len(contexts) > 1:
+                log_prefix_bits.append(context)
+            if len(namespaces) > 1:
+                log_prefix_bits.append(namespace)
+
+            builds.append(_make_build(context, namespace, timeout, log_prefix_bits))
+
+    return builds
+
+
+def _make_all_namespaces_builds(ctx, timeout=None):
+    '''
+    Make a build for every kubetools managed namespace in each target Kubernetes
+    context, found by the managed-by annotation.
+    '''
+
+    contexts = ctx.meta['kube_contexts']
+    builds = []
+
+    for context in contexts:
+        for namespace in iter_namespace_metadata(context):
+            if not is_kubetools_object(namespace):
+                continue
+
+            namespace_name = get_object_name(namespace)
+            log_prefix_bits = [namespace_name]
+            if len(contexts) > 1:
+                log_prefix_bits.insert(0, context)
+
+            builds.append(_make_build(context, namespace_name, timeout, log_prefix_bits))
+
+    return builds
+
+
+def _plan_builds(builds, get_objects, parallelism=None):
+    '''
+    Get the objects to act on for each build, fetching from every target at once
+    (or parallelism targets at a time).
+    '''
+
+    return dict(zip(
+        builds,
+        run_concurrently(get_objects, builds, parallelism=parallelism or len(builds)),
+    ))
+
+
+def _print_builds_summary(action, build_results):
+    click.echo(click.style(f'--> {action} summary', bold=True))
+    click.echo(tabulate(
+        [
+            (
+                build.env,
+                build.namespace,
+                click.style('OK', 'green') if error is None else click.style(
+                    f'FAILED: {format_error(error)}', 'red',
+                ),
+                f'{duration:.0f}s',
+            )
+            for build, error, duration in build_results
+        ],
+        headers=('Context', 'Namespace', 'Status', 'Time'),
+        tablefmt='simple',
+    ))
+    click.echo()
+
+
+def _run_builds(action, builds, function, parallelism=None):
+    '''
+    Run function for each build. Several builds are run concurrently (all at once or
+    parallelism at a time), followed by a summary, failing once they have all
+    finished if any of them failed.
+
+    Each build's deadline starts as it begins executing.
+    '''
+
+    if len(builds) == 1:
+        builds[0].start_deadline()
+        function(builds[0])
+        return
+
+    def run_build(build):
+        start = monotonic()
+        error = None
+        build.start_deadline()
+
+        # Any failure (including API errors, eg a 403 or 422 from one cluster) is
+        # recorded against its target so the others finish and are summarised.
+        try:
+            function(build)
+        except Exception as e:
+            build.log_error(f'{action} failed: {format_error(e)}')
+            error = e
+
+        return build, error, monotonic() - start
+
+    build_results = run_concurrently(
+        run_build, builds,
+        parallelism=parallelism or len(builds),
+    )
+    _print_builds_summary(action, build_results)
+
+    failed_targets = [
+        f'{build.env}/{build.namespace}'
+        for build, error, _ in build_results
+        if error
+    ]
+    if failed_targets:
+        raise KubeBuildError(f'{action} failed for: {", ".join(failed_targets)}')
+
+
+def _check_pending_terminations(ctx, wait, deadline=None):
+    '''
+    Report namespaces left terminating (by this or earlier cleanups) that are stuck,
+    failing if we were asked to wait for them (until deadline).
+    '''
+
+    stuck_namespaces = []
+
+    for context in ctx.meta['kube_contexts']:
+        for namespace, age, issues in check_pending_terminations(
+            context,
+            wait=wait,
+            deadline=deadline,
+        ):
+            stuck_namespaces.append(f'{context}/{namespace}')
+
+            click.echo(click.style(
+                f'--> Namespace {namespace} ({context}) still terminating after {age:.0f}s',
+                'yellow',
+            ))
+            for reason, message in issues:
+                click.echo(f'    {reason}: {message}')
+
+    if wait and stuck_namespaces:
+        raise KubeBuildError(
+            f'Namespaces still terminating: {", ".join(stuck_namespaces)}',
+        )
+
+
 def _validate_key_value_argument(ctx, param, value):
     key_values = {}
 
@@ -78,6 +264,24 @@ def _validate_key_value_argument(ctx, param, value):
     default=False,
     help='Instead of writing objects to Kubernetes, just print them and exit.',
 )
+@click.option(
+    '--server-dry-run',
+    is_flag=True,
+    default=False,
+    help='Validate every object with a server-side apply dry run, without persisting.',
+)
+@click.option(
+    '--server-side',
+    is_flag=True,
+    default=False,
+    help='Create and update objects with server-side apply.',
+)
+@click.option(
+    '--force-conflicts',
+    is_flag=True,
+    default=False,
+    help='With server-side apply, take over fields owned by other field managers.',
+)
 @click.option(
     '--replicas',
     type=int,
@@ -123,7 +327,18 @@ def _validate_key_value_argument(ctx, param, value):
     default=True,
     help='Delete jobs after they complete.',
 )
-@click.argument('namespace')
+@click.option(
+    '--parallelism',
+    type=click.IntRange(min=1),
+    default=1,
+    help='Number of services/deployments to roll out at once within each stage.',
+)
+@click.option(
+    '--timeout',
+    type=click.IntRange(min=1),
+    help='Overall time limit in seconds for every wait, rather than a limit per object.',
+)
+@click.argument('namespaces', metavar='NAMESPACE[,NAMESPACE...]', callback=_parse_namespaces)
 @click.argument(
     'app_dirs',
     nargs=-1,
@@ -133,6 +348,9 @@ def _validate_key_value_argument(ctx, param, value):
 def deploy(
     ctx,
     dry,
+    server_dry_run,
+    server_side,
+    force_conflicts,
     replicas,
     default_registry,
     yes,
@@ -141,64 +359,87 @@ def deploy(
     file,
     ignore_git_changes,
     delete_completed_jobs,
-    namespace,
+    parallelism,
+    timeout,
+    namespaces,
     app_dirs,
 ):
     '''
     Deploy an app, or apps, to Kubernetes.
+
+    Give several comma separated namespaces to deploy to all of them at once, images
+    are built and checked once and each namespace is then deployed concurrently.
     '''
 
     if not app_dirs:
         app_dirs = (os.getcwd(),)
 
-    build = Build(
-        env=ctx.meta['kube_context'],
-        namespace=namespace,
-    )
+    builds = _make_builds(ctx, namespaces, timeout=timeout)
 
     if file:
         custom_config_file = click.format_filename(file)
     else:
         custom_config_file = None
 
-    namespace, services, deployments, jobs = get_deploy_objects(
-        build, app_dirs,
-        replicas=replicas,
-        default_registry=default_registry,
-        extra_envvars=envvars,
-        extra_annotations=annotations,
-        ignore_git_changes=ignore_git_changes,
-        custom_config_file=custom_config_file,
-    )
+    # Generate objects for each target, sharing git checks + image builds
+    deploy_object_cache = {}
+    build_to_objects = {
+        build: get_deploy_objects(
+            build, app_dirs,
+            replicas=replicas,
+            default_registry=default_registry,
+            extra_envvars=envvars,
+            extra_annotations=annotations,
+            ignore_git_changes=ignore_git_changes,
+            custom_config_file=custom_config_file,
+            cache=deploy_object_cache,
+        )
+        for build in builds
+    }
 
-    if not any((namespace, services, deployments, jobs)):
+    builds = [build for build in builds if any(build_to_objects[build])]
+    if not builds:
         click.echo('Nothing to do!')
         return
 
     if dry:
-        return _dry_deploy_loop(build, namespace, services, deployments, jobs)
+        for build in builds:
+            _, services, deployments, jobs = build_to_objects[build]
+            _dry_deploy_loop(build, services, deployments, jobs)
+        return
 
-    log_deploy_changes(
-        build, namespace, services, deployments, jobs,
-        message='Executing changes:' if yes else 'Proposed changes:',
-        name_formatter=lambda name: click.style(name, bold=True),
-    )
+    for build in builds:
+        namespace, services, deployments, jobs = build_to_objects[build]
+        log_deploy_changes(
+            build, namespace, services, deployments, jobs,
+            message='Executing changes:' if yes or server_dry_run else 'Proposed changes:',
+            name_formatter=lambda name: click.style(name, bold=True),
+        )
 
-    if not yes:
+    if not yes and not server_dry_run:
         click.confirm(click.style((
             'Are you sure you wish to CREATE and UPDATE the above resources? '
             'This cannot be undone.'
         )), abort=True)
         click.echo()
 
-    execute_deploy(
-        build,
-        namespace,
-        services,
-        deployments,
-        jobs,
-        delete_completed_jobs=delete_completed_jobs,
-    )
+    def deploy_build(build):
+        namespace, services, deployments, jobs = build_to_objects[build]
+
+        execute_deploy(
+            build,
+            namespace,
+            services,
+            deployments,
+            jobs,
+            delete_completed_jobs=delete_completed_jobs,
+            parallelism=parallelism,
+            server_side_apply=server_side,
+            force_conflicts=force_conflicts,
+            dry_run=server_dry_run,
+        )
+
+    _run_builds('Deploy', builds, deploy_build)
 
 
 @cli_bootstrap.command(help_priority=1)
@@ -220,32 +461,37 @@ def deploy(
     default=False,
     help='Run a cleanup immediately after removal.',
 )
+@click.option(
+    '--timeout',
+    type=click.IntRange(min=1),
+    help='Overall time limit in seconds for every wait, rather than a limit per object.',
+)
 @click.argument('namespace')
 @click.argument('app_or_project_names', nargs=-1)
 @click.pass_context
-def remove(ctx, yes, force, do_cleanup, namespace, app_or_project_names):
+def remove(ctx, yes, force, do_cleanup, timeout, namespace, app_or_project_names):
     '''
     Removes one or more apps from a given namespace.
     '''
 
-    build = Build(
-        env=ctx.meta['kube_context'],
-        namespace=namespace,
-    )
-
-    services_to_delete, deployments_to_delete, jobs_to_delete = (
-        get_remove_objects(build, app_or_project_names, force=force)
+    builds = _make_builds(ctx, [namespace], timeout=timeout)
+    build_to_objects = _plan_builds(
+        builds,
+        lambda build: get_remove_objects(build, app_or_project_names, force=force),
     )
 
-    if not any((services_to_delete, deployments_to_delete, jobs_to_delete)):
+    builds = [build for build in builds if any(build_to_objects[build])]
+    if not builds:
         click.echo('Nothing to do 👍!')
         return
 
-    log_remove_changes(
-        build, services_to_delete, deployments_to_delete, jobs_to_delete,
-        message='Executing changes:' if yes else 'Proposed changes:',
-        name_formatter=lambda name: click.style(name, bold=True),
-    )
+    for build in builds:
+        services_to_delete, deployments_to_delete, jobs_to_delete = build_to_objects[build]
+        log_remove_changes(
+            build, services_to_delete, deployments_to_delete, jobs_to_delete,
+            message='Executing changes:' if yes else 'Proposed changes:',
+            name_formatter=lambda name: click.style(name, bold=True),
+        )
 
     if not yes:
         click.confirm(click.style(
@@ -253,15 +499,13 @@ def remove(ctx, yes, force, do_cleanup, namespace, app_or_project_names):
         ), abort=True)
         click.echo()
 
-    execute_remove(
-        build,
-        services_to_delete,
-        deployments_to_delete,
-        jobs_to_delete,
+    _run_builds(
+        'Remove', builds,
+        lambda build: execute_remove(build, *build_to_objects[build]),
     )
 
     if do_cleanup:
-        ctx.invoke(cleanup, yes=yes, namespace=namespace)
+        ctx.invoke(cleanup, yes=yes, timeout=timeout, namespace=namespace)
 
 
 @cli_bootstrap.command(help_priority=2)
@@ -271,30 +515,75 @@ def remove(ctx, yes, force, do_cleanup, namespace, app_or_project_names):
     default=False,
     help='Flag to auto-yes remove confirmation step.',
 )
-@click.argument('namespace')
+@click.option(
+    '--timeout',
+    type=click.IntRange(min=1),
+    help='Overall time limit in seconds for every wait, rather than a limit per object.',
+)
+@click.option(
+    '--all-namespaces',
+    is_flag=True,
+    default=False,
+    help='Clean up every kubetools managed namespace instead of a single one.',
+)
+@click.option(
+    '--parallelism',
+    type=click.IntRange(min=1),
+    default=8,
+    help='Number of namespaces to clean up at once (with --all-namespaces).',
+)
+@click.option(
+    '--wait',
+    is_flag=True,
+    default=False,
+    help=(
+        'Wait for deleted namespaces (and any left terminating by earlier cleanups) '
+        'to be fully removed, rather than leaving them terminating in the background.'
+    ),
+)
+@click.argument('namespace', required=False)
 @click.pass_context
-def cleanup(ctx, yes, namespace):
+def cleanup(ctx, yes, timeout, all_namespaces, parallelism, wait, namespace):
     '''
     Cleans up a namespace by removing orphaned objects.
     Will delete the namespace if it's empty after cleanup.
     '''
 
-    build = Build(
-        env=ctx.meta['kube_context'],
-        namespace=namespace,
-    )
+    if all_namespaces == bool(namespace):
+        raise click.UsageError('Provide either a namespace or --all-namespaces.')
+
+    if all_namespaces:
+        builds = _make_all_namespaces_builds(ctx, timeout=timeout)
+    else:
+        builds = _make_builds(ctx, [namespace], timeout=timeout)
 
-    namespace_to_delete, replica_sets_to_delete, pods_to_delete = get_cleanup_objects(build)
+    build_to_objects = _plan_builds(builds, get_cleanup_objects, parallelism=parallelism)
 
-    if not any((namespace_to_delete, replica_sets_to_delete, pods_to_delete)):
+    builds = [build for build in builds if any(build_to_objects[build])]
+    if not builds:
         click.echo('Nothing to do 👍!')
+        _check_pending_terminations(
+            ctx, wait,
+            deadline=monotonic() + timeout if timeout else None,
+        )
         return
 
-    log_cleanup_changes(
-        build, namespace_to_delete, replica_sets_to_delete, pods_to_delete,
-        message='Executing changes:' if yes else 'Proposed changes:',
-        name_formatter=lambda name: click.style(name, bold=True),
-    )
+    for build in builds:
+        namespace_to_delete, replica_sets_to_delete, pods_to_delete = build_to_objects[build]
+        log_cleanup_changes(
+            build, namespace_to_delete, replica_sets_to_delete, pods_to_delete,
+            message='Executing changes:' if yes else 'Proposed changes:',
+            name_formatter=lambda name: click.style(name, bold=True),
+        )
+
+    if len(builds) > 1:
+        namespaces_to_delete = sum(len(build_to_objects[build][0]) for build in builds)
+        click.echo(click.style(
+            f'--> {len(builds)} namespaces to clean up '
+            f'({namespaces_to_delete} will be deleted entirely)',
+            bold=True,
+        ))
+        click.echo()
 
     if not yes:
         click.confirm(click.style(
@@ -302,13 +591,16 @@ def cleanup(ctx, yes, namespace):
         ), abort=True)
         click.echo()
 
-    execute_cleanup(
-        build,
-        namespace_to_delete,
-        replica_sets_to_delete,
-        pods_to_delete,
+    _run_builds(
+        'Cleanup', builds,
+        lambda build: execute_cleanup(build, *build_to_objects[build], wait=wait),
+        parallelism=parallelism,
     )
 
+    # Waiting on terminations shares the budget of the cleanup that just ran
+    deadlines = [build.deadline for build in builds if build.deadline]
+    _check_pending_terminations(ctx, wait, deadline=min(deadlines) if deadlines else None)
+
 
 @cli_bootstrap.command()
 @click.option(
@@ -323,41 +615,70 @@ def cleanup(ctx, yes, namespace):
     default=False,
     help='Force kubetools to remove objects it does not own.',
 )
+@click.option(
+    '--delete-pods',
+    is_flag=True,
+    default=False,
+    help=(
+        'Restart by deleting each pod in turn and waiting for the deployment to recover, '
+        'instead of a rolling restart.'
+    ),
+)
+@click.option(
+    '--parallelism',
+    type=click.IntRange(min=1),
+    default=4,
+    help='Number of deployments to restart at once (rolling restarts only).',
+)
+@click.option(
+    '--timeout',
+    type=click.IntRange(min=1),
+    help='Overall time limit in seconds for every wait, rather than a limit per object.',
+)
 @click.argument('namespace')
 @click.argument('app_or_project_names', nargs=-1)
 @click.pass_context
-def restart(ctx, yes, force, namespace, app_or_project_names):
+def restart(
+    ctx, yes, force, delete_pods, parallelism, timeout,
+    namespace, app_or_project_names,
+):
     '''
     Restarts one or more apps in a given namespace.
     '''
 
-    build = Build(
-        env=ctx.meta['kube_context'],
-        namespace=namespace,
-    )
-
-    deployments_and_pods_to_delete = get_restart_objects(
-        build, app_or_project_names,
-        force=force,
+    builds = _make_builds(ctx, [namespace], timeout=timeout)
+    build_to_deployments_and_pods = _plan_builds(
+        builds,
+        lambda build: get_restart_objects(build, app_or_project_names, force=force),
     )
 
-    if not deployments_and_pods_to_delete:
+    builds = [build for build in builds if build_to_deployments_and_pods[build]]
+    if not builds:
         click.echo('Nothing to do 👍!')
         return
 
-    log_restart_changes(
-        build, deployments_and_pods_to_delete,
-        message='Executing changes:' if yes else 'Proposed changes:',
-        name_formatter=lambda name: click.style(name, bold=True),
-    )
+    for build in builds:
+        log_restart_changes(
+            build, build_to_deployments_and_pods[build],
+            message='Executing changes:' if yes else 'Proposed changes:',
+            name_formatter=lambda name: click.style(name, bold=True),
+        )
 
     if not yes:
-        click.confirm(click.style(
-            'Are you sure you wish to DELETE the above resources? This cannot be undone.',
-        ), abort=True)
+        if delete_pods:
+            message = 'Are you sure you wish to DELETE the above resources? This cannot be undone.'
+        else:
+            message = 'Are you sure you wish to RESTART the above resources?'
+
+        click.confirm(click.style(message), abort=True)
         click.echo()
 
-    execute_restart(
-        build,
-        deployments_and_pods_to_delete,
+    _run_builds(
+        'Restart', builds,
+        lambda build: execute_restart(
+            build,
+            build_to_deployments_and_pods[build],
+            delete_pods=delete_pods,
+            parallelism=parallelism,
+        ),
     )
@@ -1,3 +1,10 @@
+import json
+
+from collections import defaultdict
+from datetime import datetime
+from queue import Queue
+from threading import Event, Thread
+
 import click
 
 from tabulate import tabulate
@@ -10,15 +17,16 @@ from kubetools.constants import (
     PROJECT_NAME_LABEL_KEY,
     ROLE_LABEL_KEY,
 )
+from kubetools.deploy.util import run_concurrently
+from kubetools.exceptions import KubeCLIError
 from kubetools.kubernetes.api import (
+    follow_namespace_objects,
+    format_error,
     get_object_annotations_dict,
     get_object_labels_dict,
     get_object_name,
     is_kubetools_object,
-    list_deployments,
-    list_jobs,
-    list_replica_sets,
-    list_services,
+    iter_table_rows,
 )
 
 from . import cli_bootstrap
@@ -31,33 +39,75 @@ def _get_service_meta(service):
     return ''.join(meta_items)
 
 
-def _print_items(items, header_to_getter=None):
-    header_to_getter = header_to_getter or {}
-
-    headers = ['Name', 'Role', 'Project']
-    headers.extend(header_to_getter.keys())
-    headers = [click.style(header, bold=True) for header in headers]
+def _make_rows(items, header_to_getter, name=None, with_namespace=False):
+    '''
+    Build table rows from an iterable of objects, only keeping the rows so objects
+    can be streamed from the API. Returns the number of objects seen and the rows
+    for those matching name (when given).
+    '''
 
+    count = 0
     rows = []
+
     for item in items:
-        labels = get_object_labels_dict(item)
+        count += 1
 
-        row = [
-            get_object_name(item),
-            labels.get(ROLE_LABEL_KEY),
-        ]
+        if name and get_object_name(item) != name:
+            continue
 
-        if not is_kubetools_object(item):
-            row.append(click.style('NOT MANAGED BY KUBETOOLS', 'yellow'))
-        else:
-            row.append(labels.get(PROJECT_NAME_LABEL_KEY, 'unknown'))
+        rows.append(_make_row(item, header_to_getter, with_namespace=with_namespace))
+
+    return count, rows
 
-        for getter in header_to_getter.values():
-            row.append(getter(item))
 
-        rows.append(row)
+def _make_row(item, header_to_getter, with_namespace=False):
+    labels = get_object_labels_dict(item)
+
+    row = [
+        get_object_name(item),
+        labels.get(ROLE_LABEL_KEY),
+    ]
+    if with_namespace:
+        row.insert(0, item.metadata.namespace)
+
+    if not is_kubetools_object(item):
+        row.append(click.style('NOT MANAGED BY KUBETOOLS', 'yellow'))
+    else:
+        row.append(labels.get(PROJECT_NAME_LABEL_KEY, 'unknown'))
 
+    for getter in header_to_getter.values():
+        row.append(getter(item))
+
+    return row
+
+
+def _make_json_item(env, kind, item, header_to_getter):
+    labels = get_object_labels_dict(item)
+
+    return {
+        'context': env,
+        'namespace': item.metadata.namespace,
+        'kind': kind,
+        'name': get_object_name(item),
+        'role': labels.get(ROLE_LABEL_KEY),
+        'project': labels.get(PROJECT_NAME_LABEL_KEY),
+        'managed_by_kubetools': bool(is_kubetools_object(item)),
+        'columns': {
+            header: getter(item)
+            for header, getter in header_to_getter.items()
+        },
+    }
+
+
+def _print_rows(title, rows, header_to_getter, with_namespace=False):
+    headers = ['Namespace'] if with_namespace else []
+    headers.extend(['Name', 'Role', 'Project'])
+    headers.extend(header_to_getter.keys())
+    headers = [click.style(header, bold=True) for header in headers]
+
+    click.echo(f'--> {len(rows)} {title}')
     click.echo(tabulate(rows, headers=headers, tablefmt='simple'))
+    click.echo()
 
 
 def _get_node_ports(item):
@@ -98,76 +148,366 @@ def _get_command(item):
     return get_object_annotations_dict(item).get('description')
 
 
-@cli_bootstrap.command(help_priority=3)
-@click.argument('namespace')
-@click.argument('app', required=False)
-@click.pass_context
-def show(ctx, namespace, app):
-    '''
-    Show running apps in a given namespace.
-    '''
+def _get_table_node_ports(row):
+    # Printed as eg "80:30080/TCP,443/TCP"
+    ports = row.cells.get('Port(s)') or ''
+    return ', '.join(port.split('/')[0] for port in ports.split(',') if port)
 
-    exists = False
 
-    env = ctx.meta['kube_context']
+def _get_table_ready_status(row):
+    # Deployments print ready/desired, replica sets separate Ready and Current columns
+    if 'Current' in row.cells:
+        return f'{row.cells.get("Ready")}/{row.cells["Current"]}'
+    return row.cells.get('Ready')
 
-    if app:
-        click.echo(f'--> Filtering by app={app}')
 
-    services = list_services(env, namespace)
+def _get_table_completion_status(row):
+    return row.cells.get('Completions')
 
-    if services:
-        exists = True
 
-        if app:
-            services = [s for s in services if get_object_name(s) == app]
+SERVICE_GETTERS = {
+    'Port(:nodePort)': _get_node_ports,
+}
 
-        click.echo(f'--> {len(services)} Services')
-        _print_items(services, {
-            'Port(:nodePort)': _get_node_ports,
-        })
-        click.echo()
+DEPLOYMENT_GETTERS = {
+    'Ready': _get_ready_status,
+    'Version': _get_version_info,
+}
 
-    deployments = list_deployments(env, namespace)
+REPLICA_SET_GETTERS = {
+    'Ready': _get_ready_status,
+    'Version': _get_version_info,
+}
 
-    if deployments:
-        exists = True
+JOB_GETTERS = {
+    'Completions': _get_completion_status,
+    'Command': _get_command,
+}
 
-        if app:
-            deployments = [d for d in deployments if get_object_name(d) == app]
+TABLE_SERVICE_GETTERS = {
+    'Port(:nodePort)': _get_table_node_ports,
+}
+
+TABLE_DEPLOYMENT_GETTERS = {
+    'Ready': _get_table_ready_status,
+    'Version': _get_version_info,
+}
+
+TABLE_REPLICA_SET_GETTERS = {
+    'Ready': _get_table_ready_status,
+    'Version': _get_version_info,
+}
 
-        click.echo(f'--> {len(deployments)} Deployments')
+TABLE_JOB_GETTERS = {
+    'Completions': _get_table_completion_status,
+    'Command': _get_command,
+}
+
+
+def _get_kind_to_view(app=None, table_rows=False):
+    '''
+    Get the kinds of object shown, mapped to their title, column getters, label
+    selector and name to match (when filtering by app). With table_rows the getters
+    read server-side Table rows rather than full objects.
+    '''
 
-        _print_items(deployments, {
-            'Ready': _get_ready_status,
-            'Version': _get_version_info,
-        })
-        click.echo()
+    kind_to_view = {
+        'service': (
+            'Services',
+            TABLE_SERVICE_GETTERS if table_rows else SERVICE_GETTERS,
+            None, app,
+        ),
+        'deployment': (
+            'Deployments',
+            TABLE_DEPLOYMENT_GETTERS if table_rows else DEPLOYMENT_GETTERS,
+            None, app,
+        ),
+    }
 
     if app:
-        replica_sets = list_replica_sets(env, namespace)
-        replica_sets = [
-            r for r in replica_sets
-            if r.metadata.labels.get(NAME_LABEL_KEY) == app
-        ]
-
-        click.echo(f'--> {len(replica_sets)} Replica sets')
-        _print_items(replica_sets, {
-            'Ready': _get_ready_status,
-            'Version': _get_version_info,
-        })
-        click.echo()
+        kind_to_view['replica_set'] = (
+            'Replica sets',
+            TABLE_REPLICA_SET_GETTERS if table_rows else REPLICA_SET_GETTERS,
+            f'{NAME_LABEL_KEY}={app}', None,
+        )
     else:
-        jobs = list_jobs(env, namespace)
-        if jobs:
-            exists = True
-
-            click.echo(f'--> {len(jobs)} Jobs')
-            _print_items(jobs, {
-                'Completions': _get_completion_status,
-                'Command': _get_command,
-            })
+        kind_to_view['job'] = (
+            'Jobs',
+            TABLE_JOB_GETTERS if table_rows else JOB_GETTERS,
+            None, None,
+        )
+
+    return kind_to_view
+
+
+def _show_namespaces(envs, namespace, app=None, output_format='table'):
+    '''
+    Show the objects in a namespace (or every namespace when namespace is None) of
+    each context, fetching every kind in every context at once.
+    '''
+
+    kind_to_view = _get_kind_to_view(app, table_rows=True)
+    targets = [(env, kind) for env in envs for kind in kind_to_view]
+
+    def get_items(target):
+        env, kind = target
+        return list(iter_table_rows(
+            env, namespace, kind,
+            label_selector=kind_to_view[kind][2],
+        ))
+
+    target_to_items = dict(zip(
+        targets,
+        run_concurrently(get_items, targets, parallelism=len(targets)),
+    ))
+
+    if output_format == 'json':
+        click.echo(json.dumps([
+            _make_json_item(env, kind, item, kind_to_view[kind][1])
+            for env, kind in targets
+            for item in target_to_items[(env, kind)]
+            if not kind_to_view[kind][3] or get_object_name(item) == kind_to_view[kind][3]
+        ], indent=4))
+        return
+
+    with_namespace = namespace is None
+
+    for env in envs:
+        if len(envs) > 1:
+            click.echo(click.style(f'==> Context: {env}', bold=True))
             click.echo()
 
-    if not exists:
-        click.echo('Nothing to be found here 👀!')
+        exists = False
+
+        for kind, (title, getters, _, name) in kind_to_view.items():
+            count, rows = _make_rows(
+                target_to_items[(env, kind)], getters,
+                name=name,
+                with_namespace=with_namespace,
+            )
+
+            # Replica sets are always listed when filtering by app
+            if count or kind == 'replica_set':
+                exists = exists or bool(count)
+                _print_rows(title, rows, getters, with_namespace=with_namespace)
+
+        if not exists:
+            click.echo('Nothing to be found here 👀!')
+
+
+class NamespaceWatchView(object):
+    '''
+    A live view of the objects shown for a namespace (in one or more contexts). Each
+    kind is listed once and then followed with the watch API in a thread; events
+    update an in-memory table of rows and only rows that actually changed are
+    printed, so the cost tracks the rate of change rather than the namespace size.
+    '''
+
+    def __init__(self, envs, namespace, app=None):
+        self.envs = envs
+        self.namespace = namespace
+        self.app = app
+
+        self.kind_to_view = _get_kind_to_view(app)
+
+        self.events = Queue()
+        self.stop_event = Event()
+        # (env, kind) -> name -> row
+        self.rows = defaultdict(dict)
+
+    def _start_followers(self):
+        for env in self.envs:
+            for kind, (_, _, label_selector, _) in self.kind_to_view.items():
+                Thread(
+                    target=follow_namespace_objects,
+                    args=(
+                        env, self.namespace, kind,
+                        lambda items, env=env, kind=kind: self.events.put(
+                            (env, kind, None, items),
+                        ),
+                        lambda event_type, obj, env=env, kind=kind: self.events.put(
+                            (env, kind, event_type, obj),
+                        ),
+                        self.stop_event,
+                    ),
+                    kwargs={
+                        'handle_error': lambda e, env=env, kind=kind: self.events.put(
+                            (env, kind, 'ERROR', e),
+                        ),
+                        'label_selector': label_selector,
+                    },
+                    daemon=True,
+                ).start()
+
+    def _get_new_rows(self, kind, items):
+        _, getters, _, name = self.kind_to_view[kind]
+        return {
+            get_object_name(item): _make_row(item, getters)
+            for item in items
+            if not name or get_object_name(item) == name
+        }
+
+    def _apply(self, env, kind, event_type, data):
+        '''
+        Apply a (re-)list (event_type None) or watch event to the rows, returning a
+        list of (change, row) for the rows that changed.
+        '''
+
+        rows = self.rows[(env, kind)]
+
+        if event_type is None:
+            new_rows = self._get_new_rows(kind, data)
+            removed_names = set(rows) - set(new_rows)
+        elif event_type == 'DELETED':
+            new_rows = {}
+            removed_names = {get_object_name(data)} & set(rows)
+        else:
+            new_rows = self._get_new_rows(kind, [data])
+            removed_names = set()
+
+        changes = [('DELETED', rows.pop(name)) for name in sorted(removed_names)]
+
+        for name, row in new_rows.items():
+            if rows.get(name) == row:
+                continue
+
+            changes.append(('MODIFIED' if name in rows else 'ADDED', row))
+            rows[name] = row
+
+        return changes
+
+    def _print_tables(self):
+        for env in self.envs:
+            if len(self.envs) > 1:
+                click.echo(click.style(f'==> Context: {env}', bold=True))
+                click.echo()
+
+            for kind, (title, getters, _, _) in self.kind_to_view.items():
+                _print_rows(title, list(self.rows[(env, kind)].values()), getters)
+
+    def _print_change(self, env, kind, change, row):
+        bits = [datetime.now().strftime('%H:%M:%S')]
+        if len(self.envs) > 1:
+            bits.append(env)
+
+        bits.append(self.kind_to_view[kind][0])
+        bits.append(click.style(change, {
+            'ADDED': 'green',
+            'MODIFIED': 'yellow',
+            'DELETED': 'red',
+        }[change]))
+        bits.extend('' if value is None else str(value) for value in row)
+
+        click.echo('  '.join(bits))
+
+    def _print_error(self, env, kind, error):
+        bits = [datetime.now().strftime('%H:%M:%S')]
+        if len(self.envs) > 1:
+            bits.append(env)
+
+        bits.append(self.kind_to_view[kind][0])
+        bits.append(click.style(f'ERROR (retrying): {format_error(error)}', 'red'))
+
+        click.echo('  '.join(bits))
+
+    def run(self):
+        self._start_followers()
+
+        # Wait for the initial list of every kind before printing the tables
+        pending_lists = set(
+            (env, kind)
+            for env in self.envs
+            for kind in self.kind_to_view
+        )
+
+        # Kinds whose last (re-)list failed, so each failure is only reported once
+        failing = set()
+
+        try:
+            while pending_lists:
+                env, kind, event_type, data = self.events.get()
+
+                # Without an initial list there is nothing to show, give up rather
+                # than waiting (eg forbidden by RBAC, or the API server is down).
+                if event_type == 'ERROR':
+                    raise KubeCLIError((
+                        f'Failed to list {self.kind_to_view[kind][0].lower()} '
+                        f'in {env}: {format_error(data)}'
+                    ))
+
+                self._apply(env, kind, event_type, data)
+                if event_type is None:
+                    pending_lists.discard((env, kind))
+
+            self._print_tables()
+            click.echo(click.style('--> Watching for changes (Ctrl+C to stop)', bold=True))
+
+            while True:
+                env, kind, event_type, data = self.events.get()
+
+                if event_type == 'ERROR':
+                    if (env, kind) not in failing:
+                        failing.add((env, kind))
+                        self._print_error(env, kind, data)
+                    continue
+
+                if event_type is None:
+                    failing.discard((env, kind))
+
+                for change, row in self._apply(env, kind, event_type, data):
+                    self._print_change(env, kind, change, row)
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            self.stop_event.set()
+
+
+@cli_bootstrap.command(help_priority=3)
+@click.option(
+    '-w', '--watch',
+    is_flag=True,
+    default=False,
+    help='Keep watching the namespace, printing rows as they change.',
+)
+@click.option(
+    '-A', '--all-namespaces',
+    is_flag=True,
+    default=False,
+    help='Show every namespace, the only argument is then the (optional) app.',
+)
+@click.option(
+    '--format', 'output_format',
+    type=click.Choice(('table', 'json')),
+    default='table',
+    help='Specify the output format.',
+)
+@click.argument('namespace', required=False)
+@click.argument('app', required=False)
+@click.pass_context
+def show(ctx, watch, all_namespaces, output_format, namespace, app):
+    '''
+    Show running apps in a given namespace.
+    '''
+
+    if all_namespaces:
+        if app:
+            raise click.UsageError('Only an app can be given with --all-namespaces.')
+        namespace, app = None, namespace
+    elif not namespace:
+        raise click.UsageError('Provide either a namespace or --all-namespaces.')
+
+    if watch and (all_namespaces or output_format != 'table'):
+        raise click.UsageError('--watch shows a single namespace as a table.')
+
+    if app and output_format == 'table':
+        click.echo(f'--> Filtering by app={app}')
+
+    contexts = ctx.meta['kube_contexts']
+
+    if watch:
+        NamespaceWatchView(contexts, namespace, app=app).run()
+        return
+
+    _show_namespaces(contexts, namespace, app=app, output_format=output_format)
@@ -7,3 +7,7 @@ GIT_COMMIT_ANNOTATION_KEY = 'kubetools/git_commit'
 PROJECT_NAME_LABEL_KEY = 'kubetools/project_name'
 ROLE_LABEL_KEY = 'kubetools/role'
 NAME_LABEL_KEY = 'kubetools/name'
+
+RESTARTED_AT_ANNOTATION_KEY = 'kubetools/restartedAt'
+SPEC_HASH_ANNOTATION_KEY = 'kubetools/spec_hash'
+LAST_APPLIED_ANNOTATION_KEY = 'kubetools/last_applied'
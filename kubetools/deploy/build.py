@@ -1,12 +1,21 @@
 from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
 
 import click
 
+from kubetools.kubernetes.snapshot import NamespaceSnapshot
+
 
 class Build(object):
     '''
     Build is a stub class that encapsulates the context and namespace for
-    a given build, as well as accepting log entries.
+    a given build, as well as accepting log entries. It also holds a snapshot
+    of the namespace shared between the plan, log and execute phases, and the
+    overall deadline (when a timeout is given) that every wait is bound by.
+
+    When several builds run at once (eg deploying to many namespaces) a log prefix
+    tells their output apart.
 
     The kubetools server provides it's own build class, which also handles things
     like aborting builds via Redis and keeps them saved in the database.
@@ -14,9 +23,29 @@ class Build(object):
 
     in_stage = False
 
-    def __init__(self, env, namespace):
+    # Objects may be deployed concurrently within a stage, so make sure log lines
+    # from different threads are never interleaved.
+    log_lock = Lock()
+
+    def __init__(self, env, namespace, timeout=None, log_prefix=None):
         self.env = env
         self.namespace = namespace
+        self.log_prefix = log_prefix
+        self.snapshot = NamespaceSnapshot(env, namespace)
+
+        self.timeout = timeout
+        # Monotonic timestamp by which the whole build must complete, set once
+        # execution starts (see start_deadline).
+        self.deadline = None
+
+    def start_deadline(self):
+        '''
+        Start the overall deadline, when a timeout is given. Called as execution
+        begins so planning (eg image builds) and confirmation prompts do not count.
+        '''
+
+        if self.timeout:
+            self.deadline = monotonic() + self.timeout
 
     def log_info(self, text, extra_detail=None, formatter=lambda s: s):
         '''
@@ -32,7 +61,14 @@ class Build(object):
         if formatter:
             text = formatter(text)
 
-        click.echo(text)
+        self._echo(text)
+
+    def _echo(self, text=''):
+        if text and self.log_prefix:
+            text = f'{self.log_prefix}{text}'
+
+        with self.log_lock:
+            click.echo(text)
 
     def log_warning(self, *args, **kwargs):
         kwargs['formatter'] = lambda s: click.style(s, 'yellow')
@@ -44,9 +80,9 @@ class Build(object):
 
     @contextmanager
     def stage(self, stage_name):
-        click.echo(f'--> {stage_name}')
+        self._echo(f'--> {stage_name}')
         old_in_stage = self.in_stage
         self.in_stage = True
         yield
         self.in_stage = old_in_stage
-        click.echo()
+        self._echo()
@@ -1,14 +1,14 @@
+from kubetools.deploy.terminations import record_pending_termination
 from kubetools.deploy.util import delete_objects, log_actions
 from kubetools.kubernetes.api import (
     delete_namespace,
-    delete_pod,
-    delete_replica_set,
+    delete_pods,
+    delete_replica_sets,
     get_object_name,
     is_kubetools_object,
-    list_namespaces,
-    list_pods,
-    list_replica_sets,
+    object_exists_with_uid,
 )
+from kubetools.kubernetes.ownership import OwnershipGraph
 
 
 # Cleanup
@@ -17,56 +17,55 @@ from kubetools.kubernetes.api import (
 # If the cleanup removes all remaining objects, the namespace will be deleted too.
 
 def get_cleanup_objects(build):
-    replica_sets = list_replica_sets(build.env, build.namespace)
-    replica_set_names = set(get_object_name(replica_set) for replica_set in replica_sets)
-    replica_sets_to_delete = []
-    replica_set_names_to_delete = set()
-    replica_set_names_already_deleted = set()
-
-    for replica_set in replica_sets:
-        if not is_kubetools_object(replica_set):
-            continue
-
-        if not replica_set.metadata.owner_references:
-            replica_set_names_to_delete.add(get_object_name(replica_set))
-            replica_sets_to_delete.append(replica_set)
-
-        if replica_set.metadata.deletion_timestamp:
-            replica_set_names_already_deleted.add(get_object_name(replica_set))
-
-    pods = list_pods(build.env, build.namespace)
-    pod_names = set(get_object_name(pod) for pod in pods)
-    pods_to_delete = []
-    pod_names_to_delete = set()
-    pod_names_already_deleted = set()
-
-    for pod in pods:
-        if not pod.metadata.owner_references:
-            pods_to_delete.append(pod)
-            pod_names_to_delete.add(get_object_name(pod))
-
-        elif len(pod.metadata.owner_references) == 1:
-            owner = pod.metadata.owner_references[0]
-            if owner.name in replica_set_names_to_delete:
-                pods_to_delete.append(pod)
-                pod_names_to_delete.add(get_object_name(pod))
-
-        if pod.metadata.deletion_timestamp:
-            pod_names_already_deleted.add(get_object_name(pod))
-
-    namespaces = list_namespaces(build.env)
-    current_namespace = None
-    for namespace in namespaces:
-        if namespace.metadata.name == build.namespace:
-            current_namespace = namespace
-
-    namespace_to_delete = []
-    remaining_pods = pod_names - pod_names_to_delete - pod_names_already_deleted
-    remaining_replicasets = (
-        replica_set_names - replica_set_names_to_delete - replica_set_names_already_deleted
+    # Objects are fetched as metadata only and indexed by owner in a single pass
+    graph = OwnershipGraph({
+        kind: build.snapshot.iter_objects(kind, metadata_only=True)
+        for kind in ('deployment', 'job', 'replica_set', 'pod')
+    })
+
+    # Only replica sets without any owner are removed: an owning deployment missing
+    # from the graph may have been created after the deployments were listed.
+    replica_sets_to_delete = [
+        replica_set for replica_set in graph.iter_objects('replica_set')
+        if is_kubetools_object(replica_set)
+        and not replica_set.metadata.owner_references
+    ]
+    removed_keys = set(
+        ('replica_set', get_object_name(replica_set))
+        for replica_set in replica_sets_to_delete
     )
 
-    if len(remaining_pods) == 0 and len(remaining_replicasets) == 0:
+    # Many pods usually share a missing owner, so each owner is only read once
+    owner_key_to_missing = {}
+
+    def confirm_owner_missing(owner_kind, owner):
+        owner_key = (owner_kind, owner.name, owner.uid)
+        if owner_key not in owner_key_to_missing:
+            owner_key_to_missing[owner_key] = not object_exists_with_uid(
+                build.env, build.namespace, owner_kind, owner.name,
+                uid=owner.uid,
+            )
+        return owner_key_to_missing[owner_key]
+
+    pods_to_delete = [
+        pod for pod in graph.iter_objects('pod')
+        if graph.is_orphan(
+            'pod', get_object_name(pod),
+            removed_keys=removed_keys,
+            confirm_missing=confirm_owner_missing,
+        )
+    ]
+    removed_keys.update(('pod', get_object_name(pod)) for pod in pods_to_delete)
+
+    namespace_to_delete = []
+    current_namespace = build.snapshot.get_namespace()
+
+    if current_namespace and not any(
+        (kind, get_object_name(obj)) not in removed_keys
+        and not obj.metadata.deletion_timestamp
+        for kind in ('replica_set', 'pod')
+        for obj in graph.iter_objects(kind)
+    ):
         namespace_to_delete = [current_namespace]
 
     return namespace_to_delete, replica_sets_to_delete, pods_to_delete
@@ -83,12 +82,27 @@ def log_cleanup_changes(
         log_actions(build, 'DELETE', 'namespace', namespace, name_formatter)
 
 
-def execute_cleanup(build, namespace, replica_sets, pods):
+def execute_cleanup(build, namespace, replica_sets, pods, wait=True):
+    '''
+    Delete the cleanup objects. Without wait the namespace is left terminating in
+    the background and recorded as pending, see check_pending_terminations.
+    '''
+
     with build.stage('Delete replica sets'):
-        delete_objects(build, replica_sets, delete_replica_set)
+        delete_objects(build, 'replica_set', replica_sets, delete_replica_sets)
 
     with build.stage('Delete pods'):
-        delete_objects(build, pods, delete_pod)
+        delete_objects(build, 'pod', pods, delete_pods)
 
     with build.stage('Delete namespace'):
-        delete_objects(build, namespace, delete_namespace)
+        for namespace_obj in namespace:
+            build.log_info(f'Delete: {get_object_name(namespace_obj)}')
+            delete_namespace(
+                build.env, build.namespace, namespace_obj,
+                wait=wait,
+                deadline=build.deadline,
+            )
+            if not wait:
+                record_pending_termination(build.env, get_object_name(namespace_obj))
+                build.log_info('Namespace terminating in the background')
+            build.snapshot.remove_object('namespace', get_object_name(namespace_obj))
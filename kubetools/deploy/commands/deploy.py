@@ -1,3 +1,5 @@
+import json
+
 from os import path
 
 from kubetools.config import load_kubetools_config
@@ -6,31 +8,39 @@ from kubetools.constants import (
     GIT_COMMIT_ANNOTATION_KEY,
     GIT_TAG_ANNOTATION_KEY,
     ROLE_LABEL_KEY,
+    SPEC_HASH_ANNOTATION_KEY,
+)
+from kubetools.deploy.image import (
+    ensure_docker_images,
+    get_container_contexts_from_config,
+)
+from kubetools.deploy.util import (
+    delete_objects,
+    log_actions,
+    run_concurrently,
+    run_shell_command,
 )
-from kubetools.deploy.image import ensure_docker_images
-from kubetools.deploy.util import log_actions, run_shell_command
 from kubetools.exceptions import KubeBuildError
 from kubetools.kubernetes.api import (
-    create_deployment,
+    apply_deployment,
+    apply_namespace,
+    apply_service,
     create_job,
-    create_namespace,
-    create_service,
-    delete_job,
-    deployment_exists,
+    delete_jobs,
+    get_object_annotations_dict,
     get_object_name,
-    list_deployments,
-    list_namespaces,
-    list_services,
-    namespace_exists,
-    service_exists,
-    update_deployment,
-    update_namespace,
-    update_service,
+    server_side_apply_deployment,
+    server_side_apply_namespace,
+    server_side_apply_service,
+    wait_for_deployment,
+    wait_for_namespaces_removed,
 )
 from kubetools.kubernetes.config import (
     generate_kubernetes_configs_for_project,
     generate_namespace_config,
 )
+from kubetools.kubernetes.config.util import add_spec_hash_annotation
+from kubetools.kubernetes.rollout import is_deployment_rolled_out
 
 
 def _is_git_committed(app_dir):
@@ -87,7 +97,22 @@ def get_deploy_objects(
     extra_annotations=None,
     ignore_git_changes=False,
     custom_config_file=False,
+    cache=None,
 ):
+    '''
+    Generate the namespace, services, deployments and jobs to deploy the apps to the
+    build's namespace. When deploying the same apps to several namespaces, pass the
+    same cache dict to each call so git checks and image builds only happen once.
+    '''
+
+    if cache is None:
+        cache = {}
+
+    def cached(key, function):
+        if key not in cache:
+            cache[key] = function()
+        return cache[key]
+
     all_services = []
     all_deployments = []
     all_jobs = []
@@ -110,10 +135,17 @@ def get_deploy_objects(
 
     for app_dir in app_dirs:
         if path.exists(path.join(app_dir, '.git')):
-            if not _is_git_committed(app_dir) and not ignore_git_changes:
+            is_git_committed = cached(
+                ('git_committed', app_dir),
+                lambda: _is_git_committed(app_dir),
+            )
+            if not is_git_committed and not ignore_git_changes:
                 raise KubeBuildError(f'{app_dir} contains uncommitted changes, refusing to deploy!')
 
-            commit_hash, git_annotations = _get_git_info(app_dir)
+            commit_hash, git_annotations = cached(
+                ('git_info', app_dir),
+                lambda: _get_git_info(app_dir),
+            )
             annotations.update(git_annotations)
         else:
             raise KubeBuildError(f'{app_dir} is not a valid git repository!')
@@ -126,10 +158,19 @@ def get_deploy_objects(
             custom_config_file=custom_config_file,
         )
 
-        context_to_image = ensure_docker_images(
-            kubetools_config, build, app_dir,
-            commit_hash=commit_hash,
-            default_registry=default_registry,
+        # The config may differ per namespace, so images are cached by the build
+        # contexts they are made from.
+        build_contexts = json.dumps(
+            get_container_contexts_from_config(kubetools_config),
+            sort_keys=True,
+        )
+        context_to_image = cached(
+            ('images', app_dir, commit_hash, default_registry, build_contexts),
+            lambda: ensure_docker_images(
+                kubetools_config, build, app_dir,
+                commit_hash=commit_hash,
+                default_registry=default_registry,
+            ),
         )
 
         services, deployments, jobs = generate_kubernetes_configs_for_project(
@@ -144,38 +185,78 @@ def get_deploy_objects(
         all_deployments.extend(deployments)
         all_jobs.extend(jobs)
 
-    existing_deployments = {
-        get_object_name(deployment): deployment
-        for deployment in list_deployments(build.env, build.namespace)
-    }
-
     # If we haven't been provided an explicit number of replicas, default to using
     # anything that exists live when available.
     if replicas is None:
         for deployment in all_deployments:
-            existing_deployment = existing_deployments.get(get_object_name(deployment))
+            existing_deployment = build.snapshot.get_object(
+                'deployment', get_object_name(deployment),
+            )
             if existing_deployment:
                 deployment['spec']['replicas'] = existing_deployment.spec.replicas
 
+    # Stamp each object with a hash of its final spec so unchanged objects can be
+    # skipped (jobs are always run).
+    for obj in [namespace] + all_services + all_deployments:
+        add_spec_hash_annotation(obj)
+
     return namespace, all_services, all_deployments, all_jobs
 
 
+def _get_unchanged_object(build, kind, obj):
+    '''
+    Get the live object if it already has the same spec hash as the one we are
+    about to deploy, in which case there is no need to write it.
+    '''
+
+    if kind == 'namespace':
+        existing_obj = build.snapshot.get_namespace()
+    else:
+        existing_obj = build.snapshot.get_object(kind, get_object_name(obj))
+
+    if not existing_obj:
+        return
+
+    spec_hash = get_object_annotations_dict(obj).get(SPEC_HASH_ANNOTATION_KEY)
+    existing_spec_hash = get_object_annotations_dict(existing_obj).get(
+        SPEC_HASH_ANNOTATION_KEY,
+    )
+    if spec_hash and spec_hash == existing_spec_hash:
+        return existing_obj
+
+
+def _is_unchanged(build, kind, obj):
+    '''
+    Check whether there is no need to write or wait on an object. The spec hash is
+    written before a deployment is rolled out, so deployments must also be rolled
+    out: a rerun after a failed or timed out rollout waits on them again.
+    '''
+
+    existing_obj = _get_unchanged_object(build, kind, obj)
+    if not existing_obj:
+        return False
+
+    if kind == 'deployment':
+        return is_deployment_rolled_out(existing_obj)
+    return True
+
+
 def log_deploy_changes(
     build, namespace, services, deployments, jobs,
     message='Executing changes:',
     name_formatter=lambda name: name,
 ):
-    existing_namespace_names = set(
-        get_object_name(namespace)
-        for namespace in list_namespaces(build.env)
-    )
+    existing_namespace_names = set()
+    if build.snapshot.get_namespace():
+        existing_namespace_names.add(build.namespace)
+
     existing_service_names = set(
         get_object_name(service)
-        for service in list_services(build.env, build.namespace)
+        for service in build.snapshot.get_objects('service')
     )
     existing_deployment_names = set(
         get_object_name(deployment)
-        for deployment in list_deployments(build.env, build.namespace)
+        for deployment in build.snapshot.get_objects('deployment')
     )
 
     deploy_service_names = set(
@@ -188,11 +269,29 @@ def log_deploy_changes(
 
     new_namespace = deploy_namespace_name - existing_namespace_names
 
+    unchanged_service_names = set(
+        get_object_name(service) for service in services
+        if _is_unchanged(build, 'service', service)
+    )
+    unchanged_deployment_names = set(
+        get_object_name(deployment) for deployment in deployments
+        if _is_unchanged(build, 'deployment', deployment)
+    )
+
     new_services = deploy_service_names - existing_service_names
-    update_services = deploy_service_names - new_services
+    update_services = deploy_service_names - new_services - unchanged_service_names
+
+    # Written already but not rolled out, these are only waited on
+    wait_deployment_names = set(
+        get_object_name(deployment) for deployment in deployments
+        if _get_unchanged_object(build, 'deployment', deployment)
+    ) - unchanged_deployment_names
 
     new_deployments = deploy_deployment_names - existing_deployment_names
-    update_deployments = deploy_deployment_names - new_deployments
+    update_deployments = (
+        deploy_deployment_names - new_deployments
+        - unchanged_deployment_names - wait_deployment_names
+    )
 
     with build.stage(message):
         log_actions(build, 'CREATE', 'namespace', new_namespace, name_formatter)
@@ -200,9 +299,153 @@ def log_deploy_changes(
         log_actions(build, 'CREATE', 'deployment', new_deployments, name_formatter)
         log_actions(build, 'UPDATE', 'service', update_services, name_formatter)
         log_actions(build, 'UPDATE', 'deployment', update_deployments, name_formatter)
+        log_actions(build, 'WAIT', 'deployment', wait_deployment_names, name_formatter)
+        log_actions(build, 'UNCHANGED', 'service', unchanged_service_names, name_formatter)
+        log_actions(
+            build, 'UNCHANGED', 'deployment', unchanged_deployment_names, name_formatter,
+        )
+
+
+def _apply_object(
+    build, kind, obj,
+    apply_function,
+    server_side_apply_function,
+    server_side_apply=False,
+    force_conflicts=False,
+    dry_run=False,
+):
+    '''
+    Create or update an object, either optimistically (patch/create with fallback)
+    or with a single server-side apply. Returns the object as stored by Kubernetes,
+    or None for a dry run.
+    '''
+
+    name = get_object_name(obj)
+
+    if server_side_apply or dry_run:
+        k8s_object = server_side_apply_function(
+            obj,
+            force=force_conflicts,
+            dry_run=dry_run,
+        )
+        action = 'Apply'
+    else:
+        if kind == 'namespace':
+            existing_obj = build.snapshot.get_namespace()
+        else:
+            existing_obj = build.snapshot.get_object(kind, name)
+
+        k8s_object, created = apply_function(
+            obj,
+            exists=existing_obj is not None,
+            existing_obj=existing_obj,
+        )
+        action = 'Create' if created else 'Update'
+
+    if dry_run:
+        build.log_info(f'{action} {kind} (dry run): {name}')
+        return
+
+    build.snapshot.set_object(kind, k8s_object)
+    build.log_info(f'{action} {kind}: {name}')
+    return k8s_object
+
+
+def _apply_namespace(build, namespace, **apply_kwargs):
+    _apply_object(
+        build, 'namespace', namespace,
+        lambda obj, **kwargs: apply_namespace(build.env, obj, **kwargs),
+        lambda obj, **kwargs: server_side_apply_namespace(build.env, obj, **kwargs),
+        **apply_kwargs,
+    )
+
 
+def _apply_service(build, service, **apply_kwargs):
+    _apply_object(
+        build, 'service', service,
+        lambda obj, **kwargs: apply_service(build.env, build.namespace, obj, **kwargs),
+        lambda obj, **kwargs: server_side_apply_service(
+            build.env, build.namespace, obj, **kwargs,
+        ),
+        **apply_kwargs,
+    )
+
+
+def _apply_deployment(build, deployment, **apply_kwargs):
+    k8s_deployment = None
+    if not apply_kwargs.get('dry_run'):
+        k8s_deployment = _get_unchanged_object(build, 'deployment', deployment)
+
+    if k8s_deployment:
+        # Already written by an earlier deploy whose rollout did not complete
+        build.log_info(f'Unchanged deployment: {get_object_name(deployment)}')
+    else:
+        k8s_deployment = _apply_object(
+            build, 'deployment', deployment,
+            lambda obj, **kwargs: apply_deployment(
+                build.env, build.namespace, obj, **kwargs,
+            ),
+            lambda obj, **kwargs: server_side_apply_deployment(
+                build.env, build.namespace, obj, **kwargs,
+            ),
+            **apply_kwargs,
+        )
+
+    if k8s_deployment:
+        wait_for_deployment(
+            build.env, build.namespace, k8s_deployment,
+            deadline=build.deadline,
+        )
+        build.log_info(f'Rolled out deployment: {get_object_name(deployment)}')
+
+
+def execute_deploy(
+    build, namespace, services, deployments, jobs,
+    delete_completed_jobs=True,
+    parallelism=1,
+    server_side_apply=False,
+    force_conflicts=False,
+    dry_run=False,
+):
+    '''
+    Roll out the deploy objects stage by stage. With server_side_apply each object
+    is written by a single server-side apply request (force_conflicts takes over
+    fields owned by other managers); dry_run validates every object server side
+    without persisting anything or waiting.
+    '''
+
+    apply_kwargs = {
+        'server_side_apply': server_side_apply,
+        'force_conflicts': force_conflicts,
+        'dry_run': dry_run,
+    }
+
+    # A namespace left terminating (eg by a cleanup that did not wait) must be fully
+    # removed before we can deploy into it again.
+    existing_namespace = build.snapshot.get_namespace()
+    if (
+        namespace and not dry_run
+        and existing_namespace and existing_namespace.metadata.deletion_timestamp
+    ):
+        with build.stage('Wait for terminating namespace to be removed'):
+            wait_for_namespaces_removed(
+                build.env, [build.namespace],
+                deadline=build.deadline,
+            )
+            build.snapshot.invalidate()
+
+    # Skip anything whose live spec hash matches, there's nothing to write or wait for
+    if namespace and _is_unchanged(build, 'namespace', namespace):
+        namespace = None
+    services = [
+        service for service in services
+        if not _is_unchanged(build, 'service', service)
+    ]
+    deployments = [
+        deployment for deployment in deployments
+        if not _is_unchanged(build, 'deployment', deployment)
+    ]
 
-def execute_deploy(build, namespace, services, deployments, jobs, delete_completed_jobs=True):
     # Split services + deployments into app (main) and dependencies
     depend_services = []
     main_services = []
@@ -221,80 +464,83 @@ def execute_deploy(build, namespace, services, deployments, jobs, delete_complet
         else:
             depend_deployments.append(deployment)
 
+    def run_stage(function, objects):
+        # Each stage acts as a barrier: every object within it is rolled out
+        # (concurrently, up to parallelism) before we move on to the next.
+        run_concurrently(
+            lambda obj: function(build, obj, **apply_kwargs),
+            objects,
+            parallelism=parallelism,
+        )
+
     # Now execute the deploy process
     if namespace:
         with build.stage('Create and/or update namespace'):
-            if namespace_exists(build.env, namespace):
-                build.log_info(f'Update namespace: {get_object_name(namespace)}')
-                update_namespace(build.env, namespace)
-            else:
-                build.log_info(f'Create namespace: {get_object_name(namespace)}')
-                create_namespace(build.env, namespace)
+            _apply_namespace(build, namespace, **apply_kwargs)
 
     if depend_services:
         with build.stage('Create and/or update dependency services'):
-            for service in depend_services:
-                if service_exists(build.env, build.namespace, service):
-                    build.log_info(f'Update service: {get_object_name(service)}')
-                    update_service(build.env, build.namespace, service)
-                else:
-                    build.log_info(f'Create service: {get_object_name(service)}')
-                    create_service(build.env, build.namespace, service)
+            run_stage(_apply_service, depend_services)
 
     if depend_deployments:
         with build.stage('Create and/or update dependency deployments'):
-            for deployment in depend_deployments:
-                if deployment_exists(build.env, build.namespace, deployment):
-                    build.log_info(f'Update deployment: {get_object_name(deployment)}')
-                    update_deployment(build.env, build.namespace, deployment)
-                else:
-                    build.log_info(f'Create deployment: {get_object_name(deployment)}')
-                    create_deployment(build.env, build.namespace, deployment)
+            run_stage(_apply_deployment, depend_deployments)
 
     noexist_main_services = []
     exist_main_services = []
     for service in main_services:
-        if not service_exists(build.env, build.namespace, service):
+        if not build.snapshot.exists('service', get_object_name(service)):
             noexist_main_services.append(service)
         else:
             exist_main_services.append(service)
 
     if noexist_main_services:
         with build.stage('Create any app services that do not exist'):
-            for service in noexist_main_services:
-                build.log_info(f'Create service: {get_object_name(service)}')
-                create_service(build.env, build.namespace, service)
+            run_stage(_apply_service, noexist_main_services)
 
     noexist_main_deployments = []
     exist_main_deployments = []
     for deployment in main_deployments:
-        if not deployment_exists(build.env, build.namespace, deployment):
+        if not build.snapshot.exists('deployment', get_object_name(deployment)):
             noexist_main_deployments.append(deployment)
         else:
             exist_main_deployments.append(deployment)
 
     if noexist_main_deployments:
         with build.stage('Create any app deployments that do not exist'):
-            for deployment in noexist_main_deployments:
-                build.log_info(f'Create deployment: {get_object_name(deployment)}')
-                create_deployment(build.env, build.namespace, deployment)
+            run_stage(_apply_deployment, noexist_main_deployments)
 
     if jobs:
         with build.stage('Execute upgrades'):
-            for job in jobs:
-                build.log_info(f'Create job: {get_object_name(job)}')
-                create_job(build.env, build.namespace, job)
+            completed_jobs = []
+            try:
+                for job in jobs:
+                    job_name = get_object_name(job)
+
+                    if dry_run:
+                        create_job(build.env, build.namespace, job, dry_run=True)
+                        build.log_info(f'Create job (dry run): {job_name}')
+                        continue
+
+                    build.log_info(f'Create job: {job_name}')
+                    k8s_job = create_job(
+                        build.env, build.namespace, job,
+                        log_function=lambda line, job_name=job_name: build.log_info(
+                            f'{job_name}: {line}',
+                        ),
+                        deadline=build.deadline,
+                    )
+                    build.snapshot.set_object('job', k8s_job)
+                    completed_jobs.append(job)
+            finally:
+                # Remove every job that completed in one go, even if a later one failed
                 if delete_completed_jobs:
-                    delete_job(build.env, build.namespace, job)
+                    delete_objects(build, 'job', completed_jobs, delete_jobs)
 
     if exist_main_deployments:
         with build.stage('Update existing app deployments'):
-            for deployment in exist_main_deployments:
-                build.log_info(f'Update deployment: {get_object_name(deployment)}')
-                update_deployment(build.env, build.namespace, deployment)
+            run_stage(_apply_deployment, exist_main_deployments)
 
     if exist_main_services:
         with build.stage('Update existing app services'):
-            for service in exist_main_services:
-                build.log_info(f'Update service: {get_object_name(service)}')
-                update_service(build.env, build.namespace, service)
+            run_stage(_apply_service, exist_main_services)
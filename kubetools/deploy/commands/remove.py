@@ -1,11 +1,8 @@
 from kubetools.deploy.util import delete_objects, get_app_objects, log_actions
 from kubetools.kubernetes.api import (
-    delete_deployment,
-    delete_job,
-    delete_service,
-    list_deployments,
-    list_jobs,
-    list_services,
+    delete_deployments,
+    delete_jobs,
+    delete_services,
 )
 
 
@@ -13,23 +10,28 @@ from kubetools.kubernetes.api import (
 # Handles removal of deployments, services and jobs in a namespace
 
 def get_remove_objects(build, app_names=None, force=False):
+    # We only need names/labels/annotations to remove objects, so skip fetching
+    # and deserializing the full objects.
     services_to_delete = get_app_objects(
         build,
         app_names,
-        list_services,
+        'service',
         force=force,
+        metadata_only=True,
     )
     deployments_to_delete = get_app_objects(
         build,
         app_names,
-        list_deployments,
+        'deployment',
         force=force,
+        metadata_only=True,
     )
     jobs_to_delete = get_app_objects(
         build,
         app_names,
-        list_jobs,
+        'job',
         force=force,
+        metadata_only=True,
     )
 
     return services_to_delete, deployments_to_delete, jobs_to_delete
@@ -49,12 +51,12 @@ def log_remove_changes(
 def execute_remove(build, services, deployments, jobs):
     if services:
         with build.stage('Delete services'):
-            delete_objects(build, services, delete_service)
+            delete_objects(build, 'service', services, delete_services)
 
     if deployments:
         with build.stage('Delete deployments'):
-            delete_objects(build, deployments, delete_deployment)
+            delete_objects(build, 'deployment', deployments, delete_deployments)
 
     if jobs:
         with build.stage('Delete jobs'):
-            delete_objects(build, jobs, delete_job)
+            delete_objects(build, 'job', jobs, delete_jobs)
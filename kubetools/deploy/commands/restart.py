@@ -1,69 +1,47 @@
-from collections import defaultdict
-
-from kubetools.deploy.util import get_app_objects, log_actions
+from kubetools.deploy.util import get_app_objects, log_actions, run_concurrently
 from kubetools.kubernetes.api import (
     delete_pod,
     get_object_name,
-    list_deployments,
-    list_pods,
-    list_replica_sets,
+    restart_deployment,
     wait_for_deployment,
 )
+from kubetools.kubernetes.ownership import OwnershipGraph
 
 
 # Restart
-# Handles restarting a deployment by deleting each pod and waiting for recovery
+# Handles restarting deployments, either by a rolling restart (updating an annotation
+# on the pod template) or by deleting each pod in turn and waiting for recovery.
 
 def get_restart_objects(build, app_names=None, force=False):
     deployments = get_app_objects(
         build,
         app_names,
-        list_deployments,
+        'deployment',
         force=force,
+        metadata_only=True,
     )
-    name_to_deployment = {
-        get_object_name(deployment): deployment
-        for deployment in deployments
-    }
 
-    replica_sets = list_replica_sets(build.env, build.namespace)
-    replica_set_names_to_deployment = {}
+    graph = OwnershipGraph({
+        'deployment': deployments,
+        'replica_set': build.snapshot.iter_objects('replica_set', metadata_only=True),
+        'pod': build.snapshot.iter_objects('pod', metadata_only=True),
+    })
 
-    for replica_set in replica_sets:
+    for replica_set in graph.iter_objects('replica_set'):
         if not replica_set.metadata.owner_references:
             build.log_warning((
                 'Found replicaSet with no owner (needs cleanup): '
                 f'{replica_set.metadata.name}'
             ))
-            continue
 
-        if len(replica_set.metadata.owner_references) > 1:
-            build.log_error((
-                'Found replicaSet with more than one owner: '
-                f'{replica_set.metadata.name}'
-            ))
-            continue
+    deployments_and_pods = []
 
-        owner_name = replica_set.metadata.owner_references[0].name
-        if owner_name in name_to_deployment:
-            replica_set_names_to_deployment[get_object_name(replica_set)] = (
-                name_to_deployment[owner_name]
-            )
+    for deployment in deployments:
+        pods = graph.get_descendants('deployment', get_object_name(deployment), 'pod')
+        if pods:
+            deployments_and_pods.append((deployment, pods))
 
-    pods = list_pods(build.env, build.namespace)
-    deployment_name_to_pods = defaultdict(list)
-
-    for pod in pods:
-        if pod.metadata.owner_references and len(pod.metadata.owner_references) == 1:
-            owner = pod.metadata.owner_references[0]
-            deployment = replica_set_names_to_deployment.get(owner.name)
-            if deployment:
-                deployment_name_to_pods[get_object_name(deployment)].append(pod)
-
-    return [
-        (name_to_deployment[name], pods)
-        for name, pods in deployment_name_to_pods.items()
-    ]
+    return deployments_and_pods
 
 
 def log_restart_changes(
@@ -76,10 +54,37 @@ def log_restart_changes(
         log_actions(build, 'RESTART', 'deployment', deployments, name_formatter)
 
 
-def execute_restart(build, deployments_and_pods):
-    for deployment, pods in deployments_and_pods:
-        with build.stage(f'Restart pods for {get_object_name(deployment)}'):
-            for pod in pods:
-                build.log_info(f'Delete pod: {get_object_name(pod)}')
-                delete_pod(build.env, build.namespace, pod)
-                wait_for_deployment(build.env, build.namespace, deployment)
+def _restart_deployment(build, deployment):
+    build.log_info(f'Restart deployment: {get_object_name(deployment)}')
+    k8s_deployment = restart_deployment(
+        build.env, build.namespace, deployment,
+        deadline=build.deadline,
+    )
+    build.snapshot.set_object('deployment', k8s_deployment)
+    build.log_info(f'Restarted deployment: {get_object_name(deployment)}')
+
+
+def _restart_deployment_pods(build, deployment, pods):
+    with build.stage(f'Restart pods for {get_object_name(deployment)}'):
+        for pod in pods:
+            build.log_info(f'Delete pod: {get_object_name(pod)}')
+            delete_pod(build.env, build.namespace, pod, deadline=build.deadline)
+            build.snapshot.remove_object('pod', get_object_name(pod))
+            wait_for_deployment(
+                build.env, build.namespace, deployment,
+                deadline=build.deadline,
+            )
+
+
+def execute_restart(build, deployments_and_pods, delete_pods=False, parallelism=1):
+    if delete_pods:
+        for deployment, pods in deployments_and_pods:
+            _restart_deployment_pods(build, deployment, pods)
+        return
+
+    with build.stage('Rolling restart deployments'):
+        run_concurrently(
+            lambda deployment: _restart_deployment(build, deployment),
+            [deployment for deployment, _ in deployments_and_pods],
+            parallelism=parallelism,
+        )
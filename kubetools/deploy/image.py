@@ -44,7 +44,7 @@ def has_app_commit_image(registry, app_name, context_name, commit_hash):
     return True
 
 
-def _get_container_contexts_from_config(app_config):
+def get_container_contexts_from_config(app_config):
     context_name_to_build = {
         key: context['build']
         for key, context in app_config.get('containerContexts', {}).items()
@@ -87,7 +87,7 @@ def _ensure_docker_images(
 ):
     project_name = kubetools_config['name']
 
-    context_name_to_build = _get_container_contexts_from_config(kubetools_config)
+    context_name_to_build = get_container_contexts_from_config(kubetools_config)
     context_name_to_registry = {
         context_name: build_context.get('registry', default_registry)
         for context_name, build_context in context_name_to_build.items()
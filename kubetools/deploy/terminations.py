@@ -0,0 +1,120 @@
+import json
+
+from os import makedirs, path, replace
+from threading import Lock
+from time import time
+
+from kubetools.exceptions import KubeTimeoutError
+from kubetools.kubernetes.api import get_namespace, wait_for_namespaces_removed
+from kubetools.kubernetes.rollout import get_namespace_termination_issues
+from kubetools.kubernetes.wait import get_wait_timeout
+from kubetools.log import logger
+from kubetools.settings import get_settings_directory
+
+# Namespaces deleted without waiting, by Kubernetes context, so later commands can
+# check on (and report) any that never finish terminating.
+PENDING_TERMINATIONS_FILENAME = 'pending_terminations.json'
+
+# Builds for many namespaces may record terminations at once
+_pending_terminations_lock = Lock()
+
+
+def _get_pending_terminations_filename():
+    return path.join(get_settings_directory(), PENDING_TERMINATIONS_FILENAME)
+
+
+def _read_pending_terminations():
+    filename = _get_pending_terminations_filename()
+
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.warning(f'Ignoring invalid pending terminations file {filename}: {e}')
+        return {}
+
+
+def _write_pending_terminations(env_to_pending):
+    filename = _get_pending_terminations_filename()
+    makedirs(path.dirname(filename), exist_ok=True)
+
+    # Write then move so an interrupted command never leaves a partial file
+    with open(f'{filename}.tmp', 'w') as f:
+        json.dump(env_to_pending, f, indent=4, sort_keys=True)
+    replace(f'{filename}.tmp', filename)
+
+
+def record_pending_termination(env, namespace):
+    with _pending_terminations_lock:
+        env_to_pending = _read_pending_terminations()
+        env_to_pending.setdefault(env, {})[namespace] = time()
+        _write_pending_terminations(env_to_pending)
+
+
+def get_pending_terminations(env):
+    '''
+    Get a dict of namespace name -> deleted at timestamp for a Kubernetes context.
+    '''
+
+    with _pending_terminations_lock:
+        return dict(_read_pending_terminations().get(env, {}))
+
+
+def forget_pending_terminations(env, namespaces):
+    with _pending_terminations_lock:
+        env_to_pending = _read_pending_terminations()
+        pending = env_to_pending.get(env, {})
+
+        for namespace in namespaces:
+            pending.pop(namespace, None)
+
+        if not pending:
+            env_to_pending.pop(env, None)
+
+        _write_pending_terminations(env_to_pending)
+
+
+def check_pending_terminations(env, wait=False, deadline=None):
+    '''
+    Check on the namespaces recorded as terminating in a Kubernetes context,
+    forgetting those that are gone. With wait, first wait (until deadline) for them
+    all to be removed.
+
+    Returns a list of (namespace, age, issues) tuples for namespaces that are stuck:
+    still present after waiting, reporting a termination problem (eg finalizers
+    remaining) or terminating for longer than the default wait timeout.
+    '''
+
+    pending = get_pending_terminations(env)
+    if not pending:
+        return []
+
+    if wait:
+        try:
+            wait_for_namespaces_removed(env, list(pending.keys()), deadline=deadline)
+        except KubeTimeoutError:
+            pass
+
+    stuck = []
+    removed_namespaces = []
+
+    for namespace, deleted_at in sorted(pending.items()):
+        namespace_obj = get_namespace(env, namespace)
+
+        # Gone, or since recreated (ie not terminating)
+        if not namespace_obj or not namespace_obj.metadata.deletion_timestamp:
+            removed_namespaces.append(namespace)
+            continue
+
+        age = time() - deleted_at
+        issues = get_namespace_termination_issues(namespace_obj)
+
+        if wait or issues or age > get_wait_timeout():
+            stuck.append((namespace, age, issues))
+
+    if removed_namespaces:
+        forget_pending_terminations(env, removed_namespaces)
+
+    return stuck
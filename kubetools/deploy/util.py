@@ -1,15 +1,16 @@
 import os
 
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import CalledProcessError, check_output, STDOUT
 
 from kubetools.constants import NAME_LABEL_KEY, PROJECT_NAME_LABEL_KEY
-from kubetools.exceptions import KubeBuildError
+from kubetools.exceptions import KubeBuildError, KubeTimeoutError
 from kubetools.kubernetes.api import (
-    get_object_labels_dict,
     get_object_name,
     is_kubetools_object,
 )
 from kubetools.log import logger
+from kubetools.settings import get_settings
 
 
 def run_shell_command(*command, **kwargs):
@@ -36,6 +37,35 @@ def run_shell_command(*command, **kwargs):
         ))
 
 
+def run_concurrently(function, items, parallelism=1):
+    '''
+    Call function with each item using up to parallelism threads and wait for all of
+    them to finish. If any call fails the first exception is raised once every other
+    call has completed, so nothing is left running in the background. Should every
+    failure be a timeout, they are combined into one listing everything pending.
+    '''
+
+    items = list(items)
+
+    if parallelism <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(items))) as executor:
+        futures = [executor.submit(function, item) for item in items]
+
+    exceptions = [future.exception() for future in futures if future.exception()]
+
+    timeout_errors = [e for e in exceptions if isinstance(e, KubeTimeoutError)]
+    if len(timeout_errors) > 1 and len(timeout_errors) == len(exceptions):
+        pending = [description for e in timeout_errors for description in e.pending]
+        raise KubeTimeoutError(f'Timeout waiting for: {", ".join(pending)}', pending=pending)
+
+    if exceptions:
+        raise exceptions[0]
+
+    return [future.result() for future in futures]
+
+
 def log_actions(build, action, object_type, names, name_formatter):
     for name in names:
         if not isinstance(name, str):
@@ -43,17 +73,53 @@ def log_actions(build, action, object_type, names, name_formatter):
         build.log_info(f'{action} {object_type} {name_formatter(name)}')
 
 
-def delete_objects(build, objects, delete_function):
+def delete_objects(build, kind, objects, delete_function):
+    '''
+    Delete objects of one kind using a bulk delete function (eg delete_pods) which
+    removes them all at once and waits for the whole set to disappear.
+    '''
+
+    if not objects:
+        return
+
     for obj in objects:
         build.log_info(f'Delete: {get_object_name(obj)}')
-        delete_function(build.env, build.namespace, obj)
+
+    delete_function(build.env, build.namespace, objects, deadline=build.deadline)
+
+    for obj in objects:
+        build.snapshot.remove_object(kind, get_object_name(obj))
 
 
 def get_app_objects(
-    build, app_or_project_names, list_objects_function,
+    build, app_or_project_names, kind,
     force=False,
+    metadata_only=False,
 ):
-    objects = list_objects_function(build.env, build.namespace)
+    if app_or_project_names:
+        # Select objects by name *or* project name label on the server, one query
+        # per label/value pair, and merge the results.
+        label_selectors = [
+            (label_key, name)
+            for name in app_or_project_names
+            for label_key in (NAME_LABEL_KEY, PROJECT_NAME_LABEL_KEY)
+        ]
+        object_lists = run_concurrently(
+            lambda label_selector: build.snapshot.get_objects_by_label(
+                kind, *label_selector,
+                metadata_only=metadata_only,
+            ),
+            label_selectors,
+            parallelism=int(get_settings().KUBE_CONNECTION_POOL_SIZE),
+        )
+
+        name_to_object = {}
+        for objects in object_lists:
+            for obj in objects:
+                name_to_object.setdefault(get_object_name(obj), obj)
+        objects = list(name_to_object.values())
+    else:
+        objects = build.snapshot.get_objects(kind, metadata_only=metadata_only)
 
     def filter_object(obj):
         if not is_kubetools_object(obj):
@@ -66,25 +132,4 @@ def get_app_objects(
             return force is True
         return True
 
-    objects = list(filter(filter_object, objects))
-
-    if app_or_project_names:
-        matched_object_names = set()
-
-        def filter_object_names(obj):
-            labels = get_object_labels_dict(obj)
-            app_name = labels.get(NAME_LABEL_KEY)
-            if app_name in app_or_project_names:
-                matched_object_names.add(app_name)
-                return True
-
-            project_name = labels.get(PROJECT_NAME_LABEL_KEY)
-            if project_name in app_or_project_names:
-                matched_object_names.add(project_name)
-                return True
-
-            return False
-
-        objects = list(filter(filter_object_names, objects))
-
-    return objects
+    return list(filter(filter_object, objects))
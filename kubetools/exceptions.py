@@ -35,6 +35,18 @@ class KubeBuildError(KubeError):
     type = 'build'
 
 
+class KubeRolloutError(KubeBuildError):
+    def __init__(self, message, reason=None):
+        super(KubeRolloutError, self).__init__(message)
+        self.reason = reason  # eg ImagePullBackOff, ProgressDeadlineExceeded
+
+
+class KubeTimeoutError(KubeBuildError):
+    def __init__(self, message, pending=None):
+        super(KubeTimeoutError, self).__init__(message)
+        self.pending = pending or []  # descriptions of what we were still waiting for
+
+
 # Local/dev errors
 #
 
@@ -1,18 +1,62 @@
-from time import sleep
+import json
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Event, Lock, Thread
+from types import SimpleNamespace
 
 from kubernetes import client, config
 from kubernetes.client.rest import ApiException
+from urllib3.exceptions import HTTPError
 
-from kubetools.constants import MANAGED_BY_ANNOTATION_KEY
-from kubetools.exceptions import KubeBuildError
+from kubetools.constants import MANAGED_BY_ANNOTATION_KEY, RESTARTED_AT_ANNOTATION_KEY
+from kubetools.exceptions import KubeRolloutError
+from kubetools.log import logger
 from kubetools.settings import get_settings
 
+from .patch import (
+    add_last_applied_annotation,
+    get_last_applied,
+    make_three_way_merge_patch,
+)
+from .rollout import (
+    get_deployment_failure,
+    get_job_failure,
+    get_new_replica_set,
+    get_pod_failure,
+    is_deployment_rolled_out,
+    is_job_complete,
+    POD_TEMPLATE_HASH_LABEL_KEY,
+)
+from .throttle import throttle_request
+from .wait import follow_objects, wait_for_object_state, wait_for_objects_removed
+
+# Asks the API server to return only object metadata from list calls
+METADATA_ACCEPT_HEADER = 'application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1'
+TABLE_ACCEPT_HEADER = 'application/json;as=Table;g=meta.k8s.io;v=v1'
+
+MERGE_PATCH_CONTENT_TYPE = 'application/merge-patch+json'
+
+# Server-side apply: the body is a YAML (or JSON) object and the fields we set are
+# tracked against our field manager name.
+APPLY_PATCH_CONTENT_TYPE = 'application/apply-patch+yaml'
+# Objects without shared labels are waited on one by one (with a name field
+# selector) up to this many, beyond which we follow the whole kind.
+WAIT_BY_NAME_MAX_OBJECTS = 10
+
+FIELD_MANAGER = 'kubetools'
+
 
 def get_object_labels_dict(obj):
+    if isinstance(obj, dict):
+        return obj['metadata'].get('labels') or {}
     return obj.metadata.labels or {}
 
 
 def get_object_annotations_dict(obj):
+    if isinstance(obj, dict):
+        return obj['metadata'].get('annotations') or {}
     return obj.metadata.annotations or {}
 
 
@@ -22,30 +66,259 @@ def get_object_name(obj):
     return obj.metadata.name
 
 
+def format_error(error):
+    # API errors stringify to the full response (headers and body), keep it short
+    if isinstance(error, ApiException):
+        return f'{error.status} {error.reason}'
+    return f'{error}'
+
+
 def is_kubetools_object(obj):
     if get_object_annotations_dict(obj).get(MANAGED_BY_ANNOTATION_KEY) == 'kubetools':
         return True
 
 
-def _get_api_client(env):
-    return config.new_client_from_config(context=env)
+class PartialObjectMetadata(object):
+    '''
+    Lightweight stand-in for a Kubernetes object where only the metadata has been
+    fetched. Exposes the same ``obj.metadata`` attributes as the client models for
+    the fields kubetools reads, without running the OpenAPI deserializer.
+    '''
+
+    def __init__(self, data):
+        metadata = data.get('metadata') or {}
+
+        owner_references = [
+            SimpleNamespace(
+                api_version=owner.get('apiVersion'),
+                kind=owner.get('kind'),
+                name=owner.get('name'),
+                uid=owner.get('uid'),
+                controller=owner.get('controller'),
+            )
+            for owner in metadata.get('ownerReferences') or []
+        ]
+
+        self.metadata = SimpleNamespace(
+            name=metadata.get('name'),
+            namespace=metadata.get('namespace'),
+            uid=metadata.get('uid'),
+            labels=metadata.get('labels'),
+            annotations=metadata.get('annotations'),
+            owner_references=owner_references or None,
+            deletion_timestamp=metadata.get('deletionTimestamp'),
+            creation_timestamp=metadata.get('creationTimestamp'),
+            resource_version=metadata.get('resourceVersion'),
+            generation=metadata.get('generation'),
+        )
+
+
+class TableRow(PartialObjectMetadata):
+    '''
+    A row of the server-side Table representation of an object (as printed by
+    kubectl): the object's metadata plus the printed values keyed by column name.
+    '''
 
+    def __init__(self, data, cells):
+        super(TableRow, self).__init__(data)
+        self.cells = cells
 
-def _get_k8s_core_api(env):
-    api_client = _get_api_client(env)
+
+# Process wide API clients, keyed by context name (and any default headers). Each
+# client owns a urllib3 connection pool which is shared by every API call made
+# against that context.
+_api_clients = {}
+_api_clients_lock = Lock()
+
+
+def _make_api_client(env):
+    settings = get_settings()
+
+    configuration = client.Configuration()
+    config.load_kube_config(context=env, client_configuration=configuration)
+    configuration.connection_pool_maxsize = int(settings.KUBE_CONNECTION_POOL_SIZE)
+
+    api_client = client.ApiClient(configuration=configuration)
+    api_client.rest_client.request = throttle_request(api_client.rest_client.request)
+    return api_client
+
+
+def _get_api_client(env, headers=None):
+    key = (env, tuple(sorted((headers or {}).items())))
+
+    with _api_clients_lock:
+        api_client = _api_clients.get(key)
+        if api_client is None:
+            api_client = _api_clients[key] = _make_api_client(env)
+
+            # Default headers take precedence over those set by the generated API
+            # methods, so this is how we request alternative representations.
+            for header_name, header_value in (headers or {}).items():
+                api_client.set_default_header(header_name, header_value)
+
+    return api_client
+
+
+def reset_api_clients(env=None):
+    '''
+    Drop the pooled API client for a context (or all contexts when env is None) so
+    the next API call reloads the kubeconfig, eg after credentials have changed.
+    '''
+
+    with _api_clients_lock:
+        for key in list(_api_clients.keys()):
+            if env is None or key[0] == env:
+                _api_clients.pop(key).close()
+
+
+def _get_k8s_core_api(env, headers=None):
+    api_client = _get_api_client(env, headers=headers)
     return client.CoreV1Api(api_client=api_client)
 
 
-def _get_k8s_apps_api(env):
-    api_client = _get_api_client(env)
+def _get_k8s_apps_api(env, headers=None):
+    api_client = _get_api_client(env, headers=headers)
     return client.AppsV1Api(api_client=api_client)
 
 
-def _get_k8s_batch_api(env):
-    api_client = _get_api_client(env)
+def _get_k8s_batch_api(env, headers=None):
+    api_client = _get_api_client(env, headers=headers)
     return client.BatchV1Api(api_client=api_client)
 
 
+def _get_k8s_api_for_kind(env, kind, headers=None):
+    if kind in ('service', 'pod'):
+        return _get_k8s_core_api(env, headers=headers)
+    if kind in ('deployment', 'replica_set'):
+        return _get_k8s_apps_api(env, headers=headers)
+    if kind == 'job':
+        return _get_k8s_batch_api(env, headers=headers)
+    raise ValueError(f'Unknown object kind: {kind}')
+
+
+def _get_list_function(env, kind, all_namespaces=False, headers=None):
+    api = _get_k8s_api_for_kind(env, kind, headers=headers)
+
+    if all_namespaces:
+        return getattr(api, f'list_{kind}_for_all_namespaces')
+    return getattr(api, f'list_namespaced_{kind}')
+
+
+def follow_namespace_objects(
+    env, namespace, kind, handle_items, handle_event, stop_event,
+    handle_error=None,
+    label_selector=None,
+):
+    '''
+    Follow one kind of object in a namespace, see wait.follow_objects. Blocks until
+    stop_event is set, so is usually run in a thread.
+    '''
+
+    kwargs = {'label_selector': label_selector} if label_selector else {}
+
+    follow_objects(
+        _get_list_function(env, kind),
+        handle_items, handle_event, stop_event,
+        handle_error=handle_error,
+        namespace=namespace,
+        **kwargs,
+    )
+
+
+def _iter_list(list_function, **kwargs):
+    '''
+    Yield the items of a list API call page by page, following the continue token
+    so that only a single page is held in memory at once.
+    '''
+
+    page_size = int(get_settings().KUBE_LIST_PAGE_SIZE)
+    continue_token = None
+
+    while True:
+        object_list = list_function(limit=page_size, _continue=continue_token, **kwargs)
+        yield from object_list.items
+
+        continue_token = object_list.metadata._continue
+        if not continue_token:
+            return
+
+
+def _iter_metadata_list(list_function, **kwargs):
+    '''
+    Like _iter_list, but for API clients requesting the metadata only representation,
+    yielding PartialObjectMetadata objects.
+    '''
+
+    page_size = int(get_settings().KUBE_LIST_PAGE_SIZE)
+    continue_token = None
+
+    while True:
+        response = list_function(
+            limit=page_size,
+            _continue=continue_token,
+            _preload_content=False,
+            **kwargs,
+        )
+        object_list = json.loads(response.data)
+
+        for item in object_list.get('items') or []:
+            yield PartialObjectMetadata(item)
+
+        continue_token = (object_list.get('metadata') or {}).get('continue')
+        if not continue_token:
+            return
+
+
+def _iter_table_list(list_function, **kwargs):
+    '''
+    Like _iter_list, but for API clients requesting the Table representation,
+    yielding TableRow objects.
+    '''
+
+    page_size = int(get_settings().KUBE_LIST_PAGE_SIZE)
+    continue_token = None
+    column_names = []
+
+    while True:
+        response = list_function(
+            limit=page_size,
+            _continue=continue_token,
+            _preload_content=False,
+            **kwargs,
+        )
+        table = json.loads(response.data)
+
+        if table.get('columnDefinitions'):
+            column_names = [column['name'] for column in table['columnDefinitions']]
+
+        for row in table.get('rows') or []:
+            yield TableRow(row.get('object') or {}, dict(zip(column_names, row['cells'])))
+
+        continue_token = (table.get('metadata') or {}).get('continue')
+        if not continue_token:
+            return
+
+
+def iter_table_rows(env, namespace, kind, label_selector=None):
+    '''
+    Yield the objects of a kind in a namespace (or every namespace when namespace is
+    None) as server-side Table rows, which are far cheaper to fetch and decode than
+    full objects when only a few printed columns are needed.
+    '''
+
+    list_function = _get_list_function(
+        env, kind,
+        all_namespaces=namespace is None,
+        headers={'Accept': TABLE_ACCEPT_HEADER},
+    )
+
+    kwargs = {'namespace': namespace} if namespace else {}
+    if label_selector:
+        kwargs['label_selector'] = label_selector
+
+    return _iter_table_list(list_function, **kwargs)
+
+
 def _object_exists(api, method, namespace, obj):
     try:
         if namespace:
@@ -64,27 +337,251 @@ def _object_exists(api, method, namespace, obj):
     return True
 
 
-def _wait_for(function, name='object'):
-    settings = get_settings()
+def _apply_object(create_function, patch_function, exists=None):
+    '''
+    Create or patch an object in a single API call in the common case. Whichever
+    operation the exists hint (eg from a snapshot) suggests is tried first, falling
+    back to the other should the object have been created (409) or removed (404)
+    in the meantime. With no hint we assume the object exists, as updates are the
+    most common case.
 
-    sleeps = 0
-    while True:
-        if function():
-            return
+    Returns a tuple of (k8s_object, created).
+    '''
 
-        sleep(settings.WAIT_SLEEP_TIME)
-        sleeps += 1
+    if exists is False:
+        try:
+            return create_function(), True
+        except ApiException as e:
+            if e.status != 409:
+                raise
+        return patch_function(), False
 
-        if sleeps > settings.WAIT_MAX_SLEEPS:
-            raise KubeBuildError(f'Timeout waiting for {name} to be ready')
+    try:
+        return patch_function(), False
+    except ApiException as e:
+        if e.status != 404:
+            raise
+    return create_function(), True
+
+
+def _patch_object(env, get_api, method, namespace, obj, existing_obj=None):
+    '''
+    Patch an object. Given the live object we send only the fields that need to
+    change, as a JSON merge patch computed from a three-way diff of the generated
+    object, the live object and the last applied state. Without it the whole object
+    is sent as a strategic merge patch.
+    '''
+
+    kwargs = {'name': get_object_name(obj)}
+    if namespace:
+        kwargs['namespace'] = namespace
+
+    if existing_obj is None:
+        api = get_api(env)
+        kwargs['body'] = obj
+    else:
+        current = _get_api_client(env).sanitize_for_serialization(existing_obj)
+        patch = make_three_way_merge_patch(get_last_applied(current), obj, current)
+        if not patch:
+            return existing_obj
+
+        api = get_api(env, headers={'Content-Type': MERGE_PATCH_CONTENT_TYPE})
+        kwargs['body'] = patch
+
+    return getattr(api, method)(**kwargs)
+
+
+def _server_side_apply_object(
+    env, get_api, method, namespace, obj,
+    force=False,
+    dry_run=False,
+):
+    '''
+    Create or update an object with a single, idempotent server-side apply request.
+    Fields owned by another manager cause a 409 conflict unless force is set; with
+    dry_run the request is fully validated but nothing is persisted.
+    '''
+
+    api = get_api(env, headers={'Content-Type': APPLY_PATCH_CONTENT_TYPE})
+
+    kwargs = {
+        'name': get_object_name(obj),
+        'body': obj,
+        'field_manager': FIELD_MANAGER,
+    }
+    if namespace:
+        kwargs['namespace'] = namespace
+    if force:
+        kwargs['force'] = True
+    if dry_run:
+        kwargs['dry_run'] = 'All'
+
+    return getattr(api, method)(**kwargs)
+
+
+def _wait_for_object(api, method, namespace, obj, deadline=None):
+    return wait_for_object_state(
+        getattr(api, method), get_object_name(obj),
+        lambda o: o is not None,
+        namespace=namespace,
+        deadline=deadline,
+    )
 
 
-def _wait_for_object(*args):
-    return _wait_for(lambda: _object_exists(*args) is True)
+def _wait_for_no_object(api, method, namespace, obj, deadline=None):
+    return wait_for_object_state(
+        getattr(api, method), get_object_name(obj),
+        lambda o: o is None,
+        namespace=namespace,
+        description=f'{get_object_name(obj)} to be removed',
+        deadline=deadline,
+    )
+
+
+def _get_common_label_selector(objects):
+    '''
+    Get a label selector from the labels shared by all of the given objects, which
+    matches them (and possibly others), or None if they share no labels.
+    '''
 
+    common_labels = None
+    for obj in objects:
+        labels = set(get_object_labels_dict(obj).items())
+        common_labels = labels if common_labels is None else common_labels & labels
 
-def _wait_for_no_object(*args):
-    return _wait_for(lambda: _object_exists(*args) is False)
+    if common_labels:
+        return ','.join(f'{key}={value}' for key, value in sorted(common_labels))
+
+
+def _get_collection_label_selector(metadata_list_function, namespace, objects):
+    '''
+    Find a label selector matching exactly the given objects (and nothing else) in
+    the namespace, built from the labels they all share. Returns None if there is
+    no such selector.
+    '''
+
+    label_selector = _get_common_label_selector(objects)
+    if not label_selector:
+        return None
+
+    matched_names = set(
+        get_object_name(obj)
+        for obj in _iter_metadata_list(
+            metadata_list_function,
+            namespace=namespace,
+            label_selector=label_selector,
+        )
+    )
+
+    if matched_names == set(get_object_name(obj) for obj in objects):
+        return label_selector
+
+
+def _delete_object(api, method, namespace, obj):
+    try:
+        getattr(api, method)(
+            name=get_object_name(obj),
+            namespace=namespace,
+        )
+    except ApiException as e:
+        if e.status != 404:
+            raise
+
+
+def _delete_objects(env, get_api, kind, namespace, objects, deadline=None):
+    '''
+    Delete a set of namespaced objects of one kind and wait (with a single watch)
+    for all of them to disappear. Where a label selector matches exactly the set
+    of objects we use one deletecollection call, otherwise the objects are deleted
+    individually and concurrently.
+    '''
+
+    if not objects:
+        return
+
+    api = get_api(env)
+    label_selector = None
+
+    delete_collection_method = f'delete_collection_namespaced_{kind}'
+    if len(objects) > 1 and hasattr(api, delete_collection_method):
+        metadata_api = get_api(env, headers={'Accept': METADATA_ACCEPT_HEADER})
+        label_selector = _get_collection_label_selector(
+            getattr(metadata_api, f'list_namespaced_{kind}'),
+            namespace,
+            objects,
+        )
+
+    if label_selector:
+        # This is racy: an object created with the same labels between the list
+        # above and this call is deleted too (deletecollection can't be limited to
+        # the listed objects). We accept that, the selector is made of labels shared
+        # by every object we were asked to delete, so a new match would be another
+        # object of the same app/replica set, and the window is a single request.
+        getattr(api, delete_collection_method)(
+            namespace=namespace,
+            label_selector=label_selector,
+        )
+    else:
+        parallelism = min(int(get_settings().KUBE_CONNECTION_POOL_SIZE), len(objects))
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            futures = [
+                executor.submit(
+                    _delete_object,
+                    api, f'delete_namespaced_{kind}', namespace, obj,
+                )
+                for obj in objects
+            ]
+
+        for future in futures:
+            future.result()
+
+    # Narrow the wait as far as possible rather than following every object of the
+    # kind in the namespace: by the shared labels, or by name for a few objects.
+    if not label_selector:
+        label_selector = _get_common_label_selector(objects)
+
+    if not label_selector and len(objects) <= WAIT_BY_NAME_MAX_OBJECTS:
+        # The deletes are already issued, so waiting on each in turn takes as long
+        # as the slowest one.
+        for obj in objects:
+            _wait_for_no_object(
+                api, f'list_namespaced_{kind}', namespace, obj,
+                deadline=deadline,
+            )
+        return
+
+    wait_for_objects_removed(
+        getattr(api, f'list_namespaced_{kind}'),
+        [get_object_name(obj) for obj in objects],
+        namespace=namespace,
+        label_selector=label_selector,
+        deadline=deadline,
+    )
+
+
+def object_exists_with_uid(env, namespace, kind, name, uid=None):
+    '''
+    Read an object directly, rather than trusting a possibly stale listing, and check
+    it exists and (when uid is given) is the same object rather than a replacement.
+    '''
+
+    api = _get_k8s_api_for_kind(env, kind)
+
+    try:
+        response = getattr(api, f'read_namespaced_{kind}')(
+            name=name,
+            namespace=namespace,
+            _preload_content=False,
+        )
+    except ApiException as e:
+        if e.status == 404:
+            return False
+        raise
+
+    if not uid:
+        return True
+
+    return json.loads(response.data)['metadata'].get('uid') == uid
 
 
 def namespace_exists(env, namespace_obj):
@@ -92,18 +589,37 @@ def namespace_exists(env, namespace_obj):
     return _object_exists(k8s_core_api, 'read_namespace', None, namespace_obj)
 
 
-def list_namespaces(env):
+def get_namespace(env, name):
     k8s_core_api = _get_k8s_core_api(env)
-    return k8s_core_api.list_namespace().items
+    try:
+        return k8s_core_api.read_namespace(name=name)
+    except ApiException as e:
+        if e.status == 404:
+            return None
+        raise
 
 
-def create_namespace(env, namespace_obj):
+def iter_namespaces(env, label_selector=None):
+    k8s_core_api = _get_k8s_core_api(env)
+    return _iter_list(k8s_core_api.list_namespace, label_selector=label_selector)
+
+
+def list_namespaces(env, label_selector=None):
+    return list(iter_namespaces(env, label_selector=label_selector))
+
+
+def iter_namespace_metadata(env, label_selector=None):
+    k8s_core_api = _get_k8s_core_api(env, headers={'Accept': METADATA_ACCEPT_HEADER})
+    return _iter_metadata_list(k8s_core_api.list_namespace, label_selector=label_selector)
+
+
+def create_namespace(env, namespace_obj, deadline=None):
     k8s_core_api = _get_k8s_core_api(env)
     k8s_namespace = k8s_core_api.create_namespace(
         body=namespace_obj,
     )
 
-    _wait_for_object(k8s_core_api, 'read_namespace', None, namespace_obj)
+    _wait_for_object(k8s_core_api, 'list_namespace', None, namespace_obj, deadline=deadline)
     return k8s_namespace
 
 
@@ -117,58 +633,146 @@ def update_namespace(env, namespace_obj):
     return k8s_namespace
 
 
-def delete_namespace(env, namespace, namespace_obj):
+def apply_namespace(env, namespace_obj, exists=None, existing_obj=None):
+    namespace_obj = add_last_applied_annotation(namespace_obj)
+    k8s_core_api = _get_k8s_core_api(env)
+
+    return _apply_object(
+        lambda: k8s_core_api.create_namespace(body=namespace_obj),
+        lambda: _patch_object(
+            env, _get_k8s_core_api, 'patch_namespace', None, namespace_obj,
+            existing_obj=existing_obj,
+        ),
+        exists=exists,
+    )
+
+
+def server_side_apply_namespace(env, namespace_obj, force=False, dry_run=False):
+    return _server_side_apply_object(
+        env, _get_k8s_core_api, 'patch_namespace', None, namespace_obj,
+        force=force,
+        dry_run=dry_run,
+    )
+
+
+def delete_namespace(env, namespace, namespace_obj, wait=True, deadline=None):
+    '''
+    Delete a namespace. Without wait the delete propagates in the background and we
+    return immediately, leaving the namespace terminating.
+    '''
+
     k8s_core_api = _get_k8s_core_api(env)
+
+    if not wait:
+        k8s_core_api.delete_namespace(
+            name=get_object_name(namespace_obj),
+            propagation_policy='Background',
+        )
+        return
+
     k8s_core_api.delete_namespace(
         name=get_object_name(namespace_obj),
     )
 
-    _wait_for_no_object(k8s_core_api, 'read_namespace', None, namespace_obj)
+    _wait_for_no_object(k8s_core_api, 'list_namespace', None, namespace_obj, deadline=deadline)
 
 
-def list_pods(env, namespace):
+def wait_for_namespaces_removed(env, names, deadline=None):
     k8s_core_api = _get_k8s_core_api(env)
-    return k8s_core_api.list_namespaced_pod(namespace=namespace).items
+    wait_for_objects_removed(k8s_core_api.list_namespace, names, deadline=deadline)
 
 
-def delete_pod(env, namespace, pod):
+def iter_pods(env, namespace, label_selector=None):
     k8s_core_api = _get_k8s_core_api(env)
-    k8s_core_api.delete_namespaced_pod(
-        name=get_object_name(pod),
+    return _iter_list(
+        k8s_core_api.list_namespaced_pod,
         namespace=namespace,
+        label_selector=label_selector,
     )
 
-    _wait_for_no_object(k8s_core_api, 'read_namespaced_pod', namespace, pod)
 
+def list_pods(env, namespace, label_selector=None):
+    return list(iter_pods(env, namespace, label_selector=label_selector))
 
-def list_replica_sets(env, namespace):
-    k8s_apps_api = _get_k8s_apps_api(env)
-    return k8s_apps_api.list_namespaced_replica_set(namespace=namespace).items
+
+def iter_pod_metadata(env, namespace, label_selector=None):
+    k8s_core_api = _get_k8s_core_api(env, headers={'Accept': METADATA_ACCEPT_HEADER})
+    return _iter_metadata_list(
+        k8s_core_api.list_namespaced_pod,
+        namespace=namespace,
+        label_selector=label_selector,
+    )
+
+
+def delete_pod(env, namespace, pod, deadline=None):
+    delete_pods(env, namespace, [pod], deadline=deadline)
 
 
-def delete_replica_set(env, namespace, replica_set):
+def delete_pods(env, namespace, pods, deadline=None):
+    _delete_objects(env, _get_k8s_core_api, 'pod', namespace, pods, deadline=deadline)
+
+
+def iter_replica_sets(env, namespace, label_selector=None):
     k8s_apps_api = _get_k8s_apps_api(env)
-    k8s_apps_api.delete_namespaced_replica_set(
-        name=get_object_name(replica_set),
+    return _iter_list(
+        k8s_apps_api.list_namespaced_replica_set,
         namespace=namespace,
+        label_selector=label_selector,
     )
 
-    _wait_for_no_object(k8s_apps_api, 'read_namespaced_replica_set', namespace, replica_set)
 
+def list_replica_sets(env, namespace, label_selector=None):
+    return list(iter_replica_sets(env, namespace, label_selector=label_selector))
+
+
+def iter_replica_set_metadata(env, namespace, label_selector=None):
+    k8s_apps_api = _get_k8s_apps_api(env, headers={'Accept': METADATA_ACCEPT_HEADER})
+    return _iter_metadata_list(
+        k8s_apps_api.list_namespaced_replica_set,
+        namespace=namespace,
+        label_selector=label_selector,
+    )
 
-def list_services(env, namespace):
-    k8s_core_api = _get_k8s_core_api(env)
-    return k8s_core_api.list_namespaced_service(namespace=namespace).items
 
+def delete_replica_set(env, namespace, replica_set, deadline=None):
+    delete_replica_sets(env, namespace, [replica_set], deadline=deadline)
 
-def delete_service(env, namespace, service):
+
+def delete_replica_sets(env, namespace, replica_sets, deadline=None):
+    _delete_objects(
+        env, _get_k8s_apps_api, 'replica_set', namespace, replica_sets,
+        deadline=deadline,
+    )
+
+
+def iter_services(env, namespace, label_selector=None):
     k8s_core_api = _get_k8s_core_api(env)
-    k8s_core_api.delete_namespaced_service(
-        name=get_object_name(service),
+    return _iter_list(
+        k8s_core_api.list_namespaced_service,
         namespace=namespace,
+        label_selector=label_selector,
     )
 
-    _wait_for_no_object(k8s_core_api, 'read_namespaced_service', namespace, service)
+
+def list_services(env, namespace, label_selector=None):
+    return list(iter_services(env, namespace, label_selector=label_selector))
+
+
+def iter_service_metadata(env, namespace, label_selector=None):
+    k8s_core_api = _get_k8s_core_api(env, headers={'Accept': METADATA_ACCEPT_HEADER})
+    return _iter_metadata_list(
+        k8s_core_api.list_namespaced_service,
+        namespace=namespace,
+        label_selector=label_selector,
+    )
+
+
+def delete_service(env, namespace, service, deadline=None):
+    delete_services(env, namespace, [service], deadline=deadline)
+
+
+def delete_services(env, namespace, services, deadline=None):
+    _delete_objects(env, _get_k8s_core_api, 'service', namespace, services, deadline=deadline)
 
 
 def service_exists(env, namespace, service):
@@ -176,14 +780,17 @@ def service_exists(env, namespace, service):
     return _object_exists(k8s_core_api, 'read_namespaced_service', namespace, service)
 
 
-def create_service(env, namespace, service):
+def create_service(env, namespace, service, deadline=None):
     k8s_core_api = _get_k8s_core_api(env)
     k8s_service = k8s_core_api.create_namespaced_service(
         body=service,
         namespace=namespace,
     )
 
-    _wait_for_object(k8s_core_api, 'read_namespaced_service', namespace, service)
+    _wait_for_object(
+        k8s_core_api, 'list_namespaced_service', namespace, service,
+        deadline=deadline,
+    )
     return k8s_service
 
 
@@ -198,19 +805,59 @@ def update_service(env, namespace, service):
     return k8s_service
 
 
-def list_deployments(env, namespace):
-    k8s_apps_api = _get_k8s_apps_api(env)
-    return k8s_apps_api.list_namespaced_deployment(namespace=namespace).items
+def apply_service(env, namespace, service, exists=None, existing_obj=None):
+    service = add_last_applied_annotation(service)
+    k8s_core_api = _get_k8s_core_api(env)
+
+    return _apply_object(
+        lambda: k8s_core_api.create_namespaced_service(
+            body=service,
+            namespace=namespace,
+        ),
+        lambda: _patch_object(
+            env, _get_k8s_core_api, 'patch_namespaced_service', namespace, service,
+            existing_obj=existing_obj,
+        ),
+        exists=exists,
+    )
+
+
+def server_side_apply_service(env, namespace, service, force=False, dry_run=False):
+    return _server_side_apply_object(
+        env, _get_k8s_core_api, 'patch_namespaced_service', namespace, service,
+        force=force,
+        dry_run=dry_run,
+    )
 
 
-def delete_deployment(env, namespace, deployment):
+def iter_deployments(env, namespace, label_selector=None):
     k8s_apps_api = _get_k8s_apps_api(env)
-    k8s_apps_api.delete_namespaced_deployment(
-        name=get_object_name(deployment),
+    return _iter_list(
+        k8s_apps_api.list_namespaced_deployment,
+        namespace=namespace,
+        label_selector=label_selector,
+    )
+
+
+def list_deployments(env, namespace, label_selector=None):
+    return list(iter_deployments(env, namespace, label_selector=label_selector))
+
+
+def iter_deployment_metadata(env, namespace, label_selector=None):
+    k8s_apps_api = _get_k8s_apps_api(env, headers={'Accept': METADATA_ACCEPT_HEADER})
+    return _iter_metadata_list(
+        k8s_apps_api.list_namespaced_deployment,
         namespace=namespace,
+        label_selector=label_selector,
     )
 
-    _wait_for_no_object(k8s_apps_api, 'read_namespaced_deployment', namespace, deployment)
+
+def delete_deployment(env, namespace, deployment, deadline=None):
+    delete_deployments(env, namespace, [deployment], deadline=deadline)
+
+
+def delete_deployments(env, namespace, deployments, deadline=None):
+    _delete_objects(env, _get_k8s_apps_api, 'deployment', namespace, deployments, deadline=deadline)
 
 
 def deployment_exists(env, namespace, deployment):
@@ -218,18 +865,18 @@ def deployment_exists(env, namespace, deployment):
     return _object_exists(k8s_apps_api, 'read_namespaced_deployment', namespace, deployment)
 
 
-def create_deployment(env, namespace, deployment):
+def create_deployment(env, namespace, deployment, deadline=None):
     k8s_apps_api = _get_k8s_apps_api(env)
     k8s_deployment = k8s_apps_api.create_namespaced_deployment(
         body=deployment,
         namespace=namespace,
     )
 
-    wait_for_deployment(env, namespace, k8s_deployment)
+    wait_for_deployment(env, namespace, k8s_deployment, deadline=deadline)
     return k8s_deployment
 
 
-def update_deployment(env, namespace, deployment):
+def update_deployment(env, namespace, deployment, deadline=None):
     k8s_apps_api = _get_k8s_apps_api(env)
     k8s_deployment = k8s_apps_api.patch_namespaced_deployment(
         name=get_object_name(deployment),
@@ -237,61 +884,322 @@ def update_deployment(env, namespace, deployment):
         namespace=namespace,
     )
 
-    wait_for_deployment(env, namespace, k8s_deployment)
+    wait_for_deployment(env, namespace, k8s_deployment, deadline=deadline)
     return k8s_deployment
 
 
-def wait_for_deployment(env, namespace, deployment):
+def apply_deployment(env, namespace, deployment, exists=None, existing_obj=None):
+    '''
+    Create or patch a deployment without waiting for it to roll out, returns a tuple
+    of (k8s_deployment, created).
+    '''
+
+    deployment = add_last_applied_annotation(deployment)
     k8s_apps_api = _get_k8s_apps_api(env)
 
-    def check_deployment():
-        d = k8s_apps_api.read_namespaced_deployment(
-            name=get_object_name(deployment),
+    return _apply_object(
+        lambda: k8s_apps_api.create_namespaced_deployment(
+            body=deployment,
             namespace=namespace,
-        )
+        ),
+        lambda: _patch_object(
+            env, _get_k8s_apps_api, 'patch_namespaced_deployment', namespace, deployment,
+            existing_obj=existing_obj,
+        ),
+        exists=exists,
+    )
 
-        if d.status.ready_replicas == d.status.replicas:
-            return True
 
-    _wait_for(check_deployment, get_object_name(deployment))
+def server_side_apply_deployment(env, namespace, deployment, force=False, dry_run=False):
+    '''
+    Server-side apply a deployment without waiting for it to roll out.
+    '''
+
+    return _server_side_apply_object(
+        env, _get_k8s_apps_api, 'patch_namespaced_deployment', namespace, deployment,
+        force=force,
+        dry_run=dry_run,
+    )
 
 
-def list_jobs(env, namespace):
-    k8s_batch_api = _get_k8s_batch_api(env)
-    return k8s_batch_api.list_namespaced_job(namespace=namespace).items
+def restart_deployment(env, namespace, deployment, deadline=None):
+    '''
+    Trigger a rolling restart by changing an annotation on the pod template, which
+    lets the deployment controller replace pods according to its update strategy.
+    '''
+
+    k8s_apps_api = _get_k8s_apps_api(env)
+    k8s_deployment = k8s_apps_api.patch_namespaced_deployment(
+        name=get_object_name(deployment),
+        body={
+            'spec': {
+                'template': {
+                    'metadata': {
+                        'annotations': {
+                            RESTARTED_AT_ANNOTATION_KEY: f'{datetime.utcnow().isoformat()}Z',
+                        },
+                    },
+                },
+            },
+        },
+        namespace=namespace,
+    )
 
+    wait_for_deployment(env, namespace, k8s_deployment, deadline=deadline)
+    return k8s_deployment
+
+
+def _check_deployment_pods(env, namespace, deployment):
+    '''
+    Raise a KubeRolloutError if any pod of the deployment's current replica set is
+    stuck pulling its image, crash looping, etc.
+    '''
+
+    match_labels = deployment.spec.selector.match_labels or {}
+    label_selector = ','.join(f'{key}={value}' for key, value in sorted(match_labels.items()))
+
+    replica_set = get_new_replica_set(
+        deployment,
+        list_replica_sets(env, namespace, label_selector=label_selector),
+    )
+    if not replica_set:
+        return
+
+    pod_template_hash = get_object_labels_dict(replica_set).get(POD_TEMPLATE_HASH_LABEL_KEY)
+    if pod_template_hash:
+        label_selector = f'{label_selector},{POD_TEMPLATE_HASH_LABEL_KEY}={pod_template_hash}'
+
+    for pod in list_pods(env, namespace, label_selector=label_selector):
+        failure = get_pod_failure(pod)
+        if failure:
+            reason, message = failure
+            raise KubeRolloutError(
+                f'Deployment {get_object_name(deployment)} failed: {message}',
+                reason=reason,
+            )
+
+
+def wait_for_deployment(env, namespace, deployment, deadline=None):
+    k8s_apps_api = _get_k8s_apps_api(env)
+    latest_deployment = []
+
+    def check_deployment(d):
+        if not d:
+            return
+
+        latest_deployment[:] = [d]
+
+        failure = get_deployment_failure(d)
+        if failure:
+            reason, message = failure
+            raise KubeRolloutError(
+                f'Deployment {get_object_name(d)} failed: {message}',
+                reason=reason,
+            )
 
-def delete_job(env, namespace, job):
+        return is_deployment_rolled_out(d)
+
+    def check_pods():
+        if latest_deployment:
+            _check_deployment_pods(env, namespace, latest_deployment[0])
+
+    wait_for_object_state(
+        k8s_apps_api.list_namespaced_deployment,
+        get_object_name(deployment),
+        check_deployment,
+        namespace=namespace,
+        periodic_check=check_pods,
+        deadline=deadline,
+    )
+
+
+def iter_jobs(env, namespace, label_selector=None):
     k8s_batch_api = _get_k8s_batch_api(env)
-    k8s_batch_api.delete_namespaced_job(
-        name=get_object_name(job),
+    return _iter_list(
+        k8s_batch_api.list_namespaced_job,
         namespace=namespace,
+        label_selector=label_selector,
     )
 
-    _wait_for_no_object(k8s_batch_api, 'read_namespaced_job', namespace, job)
+
+def list_jobs(env, namespace, label_selector=None):
+    return list(iter_jobs(env, namespace, label_selector=label_selector))
+
+
+def iter_job_metadata(env, namespace, label_selector=None):
+    k8s_batch_api = _get_k8s_batch_api(env, headers={'Accept': METADATA_ACCEPT_HEADER})
+    return _iter_metadata_list(
+        k8s_batch_api.list_namespaced_job,
+        namespace=namespace,
+        label_selector=label_selector,
+    )
+
+
+def delete_job(env, namespace, job, deadline=None):
+    delete_jobs(env, namespace, [job], deadline=deadline)
+
+
+def delete_jobs(env, namespace, jobs, deadline=None):
+    _delete_objects(env, _get_k8s_batch_api, 'job', namespace, jobs, deadline=deadline)
 
 
-def create_job(env, namespace, job):
+def create_job(env, namespace, job, log_function=None, dry_run=False, deadline=None):
     k8s_batch_api = _get_k8s_batch_api(env)
+
+    if dry_run:
+        return k8s_batch_api.create_namespaced_job(
+            body=job,
+            namespace=namespace,
+            dry_run='All',
+        )
+
     k8s_job = k8s_batch_api.create_namespaced_job(
         body=job,
         namespace=namespace,
     )
 
-    wait_for_job(env, namespace, k8s_job)
+    wait_for_job(env, namespace, k8s_job, log_function=log_function, deadline=deadline)
     return k8s_job
 
 
-def wait_for_job(env, namespace, job):
+class JobLogStreamer(object):
+    '''
+    Follow the logs of a job's pods in a background thread, passing each line to
+    log_function and keeping the last few lines around for error reporting.
+    '''
+
+    def __init__(self, env, namespace, job_name, log_function=None):
+        self.env = env
+        self.namespace = namespace
+        self.job_name = job_name
+        self.log_function = log_function
+
+        settings = get_settings()
+        self.lines = deque(maxlen=int(settings.JOB_LOG_TAIL_LINES))
+
+        self._streamed_pod_names = set()
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+        # The log response currently being followed, closed by stop to end the read
+        self._response = None
+        self._response_lock = Lock()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stop looking for new pods, close any in-progress stream and wait for the
+        thread to finish, so nothing is logged once this returns.
+        '''
+
+        with self._response_lock:
+            self._stop_event.set()
+            if self._response:
+                # Closing alone doesn't interrupt a blocked read, shutting down the
+                # socket does (urllib3 >= 2.3, older versions wait for the next line).
+                if hasattr(self._response, 'shutdown'):
+                    self._response.shutdown()
+                self._response.close()
+                self._response.release_conn()
+
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            # Always make one final pass after being stopped so we pick up pods
+            # that completed between polls.
+            stopping = self._stop_event.is_set()
+
+            try:
+                self._stream_new_pods()
+            except (ApiException, HTTPError) as e:
+                logger.debug(f'Failed to stream logs for job {self.job_name}: {e}')
+
+            if stopping:
+                return
+
+            self._stop_event.wait(float(get_settings().WAIT_SLEEP_TIME))
+
+    def _stream_new_pods(self):
+        pods = list_pods(self.env, self.namespace, label_selector=f'job-name={self.job_name}')
+
+        for pod in sorted(pods, key=lambda pod: pod.metadata.creation_timestamp or 0):
+            pod_name = get_object_name(pod)
+            if pod_name in self._streamed_pod_names or pod.status.phase == 'Pending':
+                continue
+
+            self._streamed_pod_names.add(pod_name)
+            self._stream_pod(pod_name)
+
+    def _stream_pod(self, pod_name):
+        k8s_core_api = _get_k8s_core_api(self.env)
+
+        with self._response_lock:
+            # Once stopped (the final pass) read what has been logged so far rather
+            # than following a pod that may still be running.
+            response = self._response = k8s_core_api.read_namespaced_pod_log(
+                pod_name, self.namespace,
+                follow=not self._stop_event.is_set(),
+                _preload_content=False,
+            )
+
+        try:
+            for line in response:
+                line = line.decode(errors='replace').rstrip()
+                self.lines.append(line)
+                if self.log_function:
+                    self.log_function(line)
+        except Exception:
+            # Reading a response closed by stop fails in various ways
+            if not self._stop_event.is_set():
+                raise
+        finally:
+            with self._response_lock:
+                self._response = None
+            response.release_conn()
+
+
+def wait_for_job(env, namespace, job, log_function=None, deadline=None):
     k8s_batch_api = _get_k8s_batch_api(env)
+    job_name = get_object_name(job)
+    failures = []
+
+    def check_job(j):
+        if not j:
+            return
 
-    def check_job():
-        j = k8s_batch_api.read_namespaced_job(
-            name=get_object_name(job),
+        failure = get_job_failure(j)
+        if failure:
+            failures.append(failure)
+            return True
+
+        return is_job_complete(j)
+
+    log_streamer = JobLogStreamer(env, namespace, job_name, log_function=log_function)
+    log_streamer.start()
+
+    try:
+        wait_for_object_state(
+            k8s_batch_api.list_namespaced_job,
+            job_name,
+            check_job,
             namespace=namespace,
+            deadline=deadline,
         )
+    finally:
+        log_streamer.stop()
 
-        if j.status.succeeded == j.spec.completions:
-            return True
+    if failures:
+        reason, message = failures[0]
+        error_message = f'Job {job_name} failed: {message}'
+
+        log_lines = list(log_streamer.lines)
+        if log_lines:
+            error_message = '\n'.join([
+                error_message,
+                f'Last {len(log_lines)} log lines:',
+            ] + log_lines)
 
-    _wait_for(check_job, get_object_name(job))
+        raise KubeRolloutError(error_message, reason=reason)
@@ -1,5 +1,25 @@
+import json
+
+from copy import deepcopy
 from hashlib import sha1
 
+from kubetools.constants import (
+    GIT_BRANCH_ANNOTATION_KEY,
+    GIT_COMMIT_ANNOTATION_KEY,
+    GIT_TAG_ANNOTATION_KEY,
+    LAST_APPLIED_ANNOTATION_KEY,
+    SPEC_HASH_ANNOTATION_KEY,
+)
+
+# Annotations that change on every deploy without changing what is deployed
+SPEC_HASH_IGNORE_ANNOTATION_KEYS = (
+    GIT_BRANCH_ANNOTATION_KEY,
+    GIT_COMMIT_ANNOTATION_KEY,
+    GIT_TAG_ANNOTATION_KEY,
+    LAST_APPLIED_ANNOTATION_KEY,
+    SPEC_HASH_ANNOTATION_KEY,
+)
+
 
 def make_dns_safe_name(name):
     return name.replace('_', '-')
@@ -21,3 +41,25 @@ def copy_and_update(base, *extras):
         if extra:
             new_base.update(extra)
     return new_base
+
+
+def make_spec_hash(obj):
+    '''
+    Hash the canonical (key sorted) JSON form of a generated object, ignoring the
+    git annotations, so identical objects produce identical hashes across deploys.
+    '''
+
+    obj = deepcopy(obj)
+
+    annotations = obj.get('metadata', {}).get('annotations') or {}
+    for key in SPEC_HASH_IGNORE_ANNOTATION_KEYS:
+        annotations.pop(key, None)
+
+    data = json.dumps(obj, sort_keys=True, separators=(',', ':'))
+    return sha1(data.encode()).hexdigest()
+
+
+def add_spec_hash_annotation(obj):
+    obj['metadata'].setdefault('annotations', {})
+    obj['metadata']['annotations'][SPEC_HASH_ANNOTATION_KEY] = make_spec_hash(obj)
+    return obj
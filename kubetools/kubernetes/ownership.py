@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+from .api import get_object_name
+
+# Owner reference kinds mapped to the kind names used throughout kubetools
+OWNER_KIND_TO_KIND = {
+    'Deployment': 'deployment',
+    'ReplicaSet': 'replica_set',
+    'Job': 'job',
+    'Pod': 'pod',
+}
+
+
+class OwnershipGraph(object):
+    '''
+    An index of which objects own which within a namespace, built in a single pass
+    over each kind of (usually metadata only) object from their owner references,
+    eg deployment -> replica set -> pod and job -> pod.
+
+    Objects are keyed by (kind, name). Owners of kinds not in OWNER_KIND_TO_KIND (eg
+    a StatefulSet) are not tracked and always treated as present.
+    '''
+
+    def __init__(self, kind_to_objects=None):
+        self._key_to_object = {}
+        self._kind_to_names = defaultdict(list)
+        self._key_to_owner_references = {}
+        self._owner_key_to_child_keys = defaultdict(set)
+
+        for kind, objects in (kind_to_objects or {}).items():
+            for obj in objects:
+                self.add_object(kind, obj)
+
+    def add_object(self, kind, obj):
+        key = (kind, get_object_name(obj))
+
+        self._key_to_object[key] = obj
+        self._kind_to_names[kind].append(key[1])
+
+        owner_references = obj.metadata.owner_references or []
+        self._key_to_owner_references[key] = owner_references
+
+        for owner in owner_references:
+            owner_kind = OWNER_KIND_TO_KIND.get(owner.kind)
+            if owner_kind:
+                self._owner_key_to_child_keys[(owner_kind, owner.name)].add(key)
+
+    def get_object(self, kind, name):
+        return self._key_to_object.get((kind, name))
+
+    def iter_objects(self, kind):
+        for name in self._kind_to_names[kind]:
+            yield self._key_to_object[(kind, name)]
+
+    def _is_owner_present(self, owner):
+        owner_kind = OWNER_KIND_TO_KIND.get(owner.kind)
+        if not owner_kind:
+            return True
+
+        owner_obj = self._key_to_object.get((owner_kind, owner.name))
+        if owner_obj is None:
+            return False
+
+        # A different uid means the owner was replaced by a new object of the same name
+        return not owner.uid or owner_obj.metadata.uid in (None, owner.uid)
+
+    def get_owners(self, kind, name):
+        '''
+        Get the (kind, name) of each owner of an object that is present in the graph.
+        '''
+
+        return [
+            (OWNER_KIND_TO_KIND[owner.kind], owner.name)
+            for owner in self._key_to_owner_references.get((kind, name), [])
+            if owner.kind in OWNER_KIND_TO_KIND and self._is_owner_present(owner)
+        ]
+
+    def get_children(self, kind, name, child_kind=None):
+        return [
+            self._key_to_object[child_key]
+            for child_key in sorted(self._owner_key_to_child_keys.get((kind, name), ()))
+            if child_kind is None or child_key[0] == child_kind
+        ]
+
+    def get_descendants(self, kind, name, descendant_kind=None):
+        '''
+        Get every object owned, directly or not, by an object, eg the pods of a
+        deployment (via its replica sets).
+        '''
+
+        descendants = []
+        seen_keys = set()
+        keys_to_visit = [(kind, name)]
+
+        while keys_to_visit:
+            key = keys_to_visit.pop(0)
+
+            for child_key in sorted(self._owner_key_to_child_keys.get(key, ())):
+                if child_key in seen_keys:
+                    continue
+                seen_keys.add(child_key)
+                keys_to_visit.append(child_key)
+
+                if descendant_kind is None or child_key[0] == descendant_kind:
+                    descendants.append(self._key_to_object[child_key])
+
+        return descendants
+
+    def is_orphan(self, kind, name, removed_keys=(), confirm_missing=None):
+        '''
+        Check whether an object has no owner left: either it has no owner references
+        or every owner is missing from the graph or in removed_keys (ie about to be
+        deleted by the caller). Objects with several owners are only orphaned once
+        all are gone. An owner that is merely terminating (has a deletion timestamp)
+        still counts as present.
+
+        The graph is built from listings taken one after another, so an owner missing
+        from it may simply have been created since. If provided, confirm_missing is
+        called with the owner kind and reference to check it really is gone (eg
+        by reading it directly) before the object is considered orphaned.
+        '''
+
+        owner_references = self._key_to_owner_references.get((kind, name), [])
+
+        for owner in owner_references:
+            owner_kind = OWNER_KIND_TO_KIND.get(owner.kind)
+            if (owner_kind, owner.name) in removed_keys:
+                continue
+            if self._is_owner_present(owner):
+                return False
+            if confirm_missing and not confirm_missing(owner_kind, owner):
+                return False
+
+        return True
@@ -0,0 +1,84 @@
+import json
+
+from copy import deepcopy
+
+from kubetools.constants import LAST_APPLIED_ANNOTATION_KEY
+
+
+def add_last_applied_annotation(obj):
+    '''
+    Return a copy of a generated object annotated with its own JSON, so the next
+    update can tell which fields we set (and have since removed).
+    '''
+
+    obj = deepcopy(obj)
+    obj['metadata'].setdefault('annotations', {})
+    obj['metadata']['annotations'].pop(LAST_APPLIED_ANNOTATION_KEY, None)
+
+    last_applied = json.dumps(obj, sort_keys=True, separators=(',', ':'))
+    obj['metadata']['annotations'][LAST_APPLIED_ANNOTATION_KEY] = last_applied
+    return obj
+
+
+def get_last_applied(obj):
+    annotations = obj.get('metadata', {}).get('annotations') or {}
+    last_applied = annotations.get(LAST_APPLIED_ANNOTATION_KEY)
+    if last_applied:
+        return json.loads(last_applied)
+
+
+def _is_applied(modified, current):
+    # Server defaults add fields to the live object, so a value counts as applied if
+    # everything we set is present, rather than the two being exactly equal.
+    if isinstance(modified, dict):
+        return isinstance(current, dict) and all(
+            value is None or _is_applied(value, current.get(key))
+            for key, value in modified.items()
+        )
+
+    if isinstance(modified, list):
+        return (
+            isinstance(current, list)
+            and len(modified) == len(current)
+            and all(_is_applied(m, c) for m, c in zip(modified, current))
+        )
+
+    return modified == current
+
+
+def make_three_way_merge_patch(original, modified, current):
+    '''
+    Build a minimal JSON merge patch (RFC 7386) that turns the current (live) object
+    into the modified (generated) one. The original (last applied) object tells us
+    which fields we have since removed, and so should be deleted. Lists cannot be
+    partially patched, so are sent whole when changed.
+    '''
+
+    original = original if isinstance(original, dict) else {}
+    patch = {}
+
+    for key in original:
+        if modified.get(key) is None and current.get(key) is not None:
+            patch[key] = None
+
+    for key, value in modified.items():
+        if value is None:
+            continue
+
+        current_value = current.get(key)
+        original_value = original.get(key)
+
+        if isinstance(value, dict) and isinstance(current_value, dict):
+            nested_patch = make_three_way_merge_patch(original_value, value, current_value)
+            if nested_patch:
+                patch[key] = nested_patch
+
+        # Lists changed since the last apply are always sent, as a removed key within
+        # a list item would still look applied against the live object.
+        elif isinstance(value, list) and original_value is not None and value != original_value:
+            patch[key] = value
+
+        elif not _is_applied(value, current_value):
+            patch[key] = value
+
+    return patch
@@ -0,0 +1,140 @@
+# Container waiting reasons that mean a rollout will not succeed without a change
+POD_FAILURE_REASONS = (
+    'ErrImagePull',
+    'ImagePullBackOff',
+    'InvalidImageName',
+    'CrashLoopBackOff',
+    'CreateContainerConfigError',
+)
+
+# Namespace conditions set by the namespace controller when termination is blocked
+NAMESPACE_TERMINATION_CONDITION_TYPES = (
+    'NamespaceDeletionDiscoveryFailure',
+    'NamespaceDeletionGroupVersionParsingFailure',
+    'NamespaceDeletionContentFailure',
+    'NamespaceContentRemaining',
+    'NamespaceFinalizersRemaining',
+)
+
+DEPLOYMENT_REVISION_ANNOTATION_KEY = 'deployment.kubernetes.io/revision'
+POD_TEMPLATE_HASH_LABEL_KEY = 'pod-template-hash'
+
+
+def get_condition(obj, condition_type):
+    for condition in obj.status.conditions or []:
+        if condition.type == condition_type:
+            return condition
+
+
+def get_deployment_failure(deployment):
+    '''
+    Returns a (reason, message) tuple if the deployment has given up progressing.
+    '''
+
+    condition = get_condition(deployment, 'Progressing')
+    if condition and condition.reason == 'ProgressDeadlineExceeded':
+        return condition.reason, condition.message
+
+
+def is_deployment_rolled_out(deployment):
+    '''
+    Check whether a deployment has finished rolling out, following the same rules
+    as ``kubectl rollout status``: the controller must have seen the latest spec
+    and every desired replica must be updated and available, with no old replicas
+    left terminating.
+    '''
+
+    status = deployment.status
+    if not status or (status.observed_generation or 0) < (deployment.metadata.generation or 0):
+        return False
+
+    updated_replicas = status.updated_replicas or 0
+    desired_replicas = deployment.spec.replicas
+
+    if desired_replicas is not None and updated_replicas < desired_replicas:
+        return False
+
+    if (status.replicas or 0) > updated_replicas:
+        return False
+
+    if (status.available_replicas or 0) < updated_replicas:
+        return False
+
+    return True
+
+
+def get_pod_failure(pod):
+    '''
+    Returns a (reason, message) tuple if any container in the pod is stuck in a
+    state that will not recover on its own (bad image, crash loop, etc).
+    '''
+
+    container_statuses = (
+        (pod.status.init_container_statuses or [])
+        + (pod.status.container_statuses or [])
+    )
+
+    for status in container_statuses:
+        waiting = status.state and status.state.waiting
+        if waiting and waiting.reason in POD_FAILURE_REASONS:
+            return waiting.reason, (
+                f'container {status.name} in pod {pod.metadata.name} is in '
+                f'{waiting.reason}: {waiting.message}'
+            )
+
+
+def get_new_replica_set(deployment, replica_sets):
+    '''
+    Find the replica set for the current revision of a deployment.
+    '''
+
+    revision = (deployment.metadata.annotations or {}).get(DEPLOYMENT_REVISION_ANNOTATION_KEY)
+    if not revision:
+        return
+
+    for replica_set in replica_sets:
+        owner_uids = set(
+            owner.uid for owner in replica_set.metadata.owner_references or []
+        )
+        replica_set_revision = (replica_set.metadata.annotations or {}).get(
+            DEPLOYMENT_REVISION_ANNOTATION_KEY,
+        )
+
+        if deployment.metadata.uid in owner_uids and replica_set_revision == revision:
+            return replica_set
+
+
+def get_job_failure(job):
+    '''
+    Returns a (reason, message) tuple if the job has failed (eg exceeded its
+    backoff limit or deadline).
+    '''
+
+    condition = get_condition(job, 'Failed')
+    if condition and condition.status == 'True':
+        return condition.reason, condition.message
+
+
+def is_job_complete(job):
+    condition = get_condition(job, 'Complete')
+    if condition and condition.status == 'True':
+        return True
+
+    completions = job.spec.completions or 1
+    return (job.status.succeeded or 0) >= completions
+
+
+def get_namespace_termination_issues(namespace):
+    '''
+    Returns a list of (reason, message) tuples explaining what is holding up the
+    termination of a namespace (eg remaining finalizers or content).
+    '''
+
+    issues = []
+
+    for condition_type in NAMESPACE_TERMINATION_CONDITION_TYPES:
+        condition = get_condition(namespace, condition_type)
+        if condition and condition.status == 'True':
+            issues.append((condition.reason, condition.message))
+
+    return issues
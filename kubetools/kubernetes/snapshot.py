@@ -0,0 +1,186 @@
+from collections import defaultdict
+from threading import RLock
+
+from .api import (
+    get_namespace,
+    get_object_labels_dict,
+    get_object_name,
+    iter_deployment_metadata,
+    iter_deployments,
+    iter_job_metadata,
+    iter_jobs,
+    iter_pod_metadata,
+    iter_pods,
+    iter_replica_set_metadata,
+    iter_replica_sets,
+    iter_service_metadata,
+    iter_services,
+)
+
+
+class NamespaceSnapshot(object):
+    '''
+    An in-memory view of the objects in a single namespace. Each kind of object is
+    listed at most once (on first use) and indexed by name and label. Writes made
+    during a build should be fed back via ``set_object``/``remove_object`` so later
+    phases see the new state without going back to the API.
+
+    Reads can ask for ``metadata_only`` objects (names, labels, annotations, owners)
+    which are far cheaper to fetch; a kind loaded this way is re-listed in full
+    the first time full objects are requested.
+    '''
+
+    kind_to_iter_function = {
+        'service': iter_services,
+        'deployment': iter_deployments,
+        'replica_set': iter_replica_sets,
+        'pod': iter_pods,
+        'job': iter_jobs,
+    }
+
+    kind_to_iter_metadata_function = {
+        'service': iter_service_metadata,
+        'deployment': iter_deployment_metadata,
+        'replica_set': iter_replica_set_metadata,
+        'pod': iter_pod_metadata,
+        'job': iter_job_metadata,
+    }
+
+    def __init__(self, env, namespace):
+        self.env = env
+        self.namespace = namespace
+
+        self._lock = RLock()
+        self._namespace_object = None
+        self._namespace_loaded = False
+        self._kind_to_objects = {}
+        self._kind_to_label_index = {}
+        self._metadata_only_kinds = set()
+
+    def _add_to_label_index(self, kind, obj):
+        label_index = self._kind_to_label_index[kind]
+        for key, value in get_object_labels_dict(obj).items():
+            label_index[(key, value)].add(get_object_name(obj))
+
+    def _remove_from_label_index(self, kind, obj):
+        label_index = self._kind_to_label_index[kind]
+        for key, value in get_object_labels_dict(obj).items():
+            label_index[(key, value)].discard(get_object_name(obj))
+
+    def _get_iter_function(self, kind, metadata_only):
+        if metadata_only:
+            return self.kind_to_iter_metadata_function[kind]
+        return self.kind_to_iter_function[kind]
+
+    def _is_loaded(self, kind, metadata_only=False):
+        if kind not in self._kind_to_objects:
+            return False
+        return metadata_only or kind not in self._metadata_only_kinds
+
+    def _get_name_to_object(self, kind, metadata_only=False):
+        with self._lock:
+            if not self._is_loaded(kind, metadata_only):
+                iter_function = self._get_iter_function(kind, metadata_only)
+                self._kind_to_objects[kind] = {}
+                self._kind_to_label_index[kind] = defaultdict(set)
+
+                if metadata_only:
+                    self._metadata_only_kinds.add(kind)
+                else:
+                    self._metadata_only_kinds.discard(kind)
+
+                for obj in iter_function(self.env, self.namespace):
+                    self._kind_to_objects[kind][get_object_name(obj)] = obj
+                    self._add_to_label_index(kind, obj)
+
+            return self._kind_to_objects[kind]
+
+    def get_namespace(self):
+        with self._lock:
+            if not self._namespace_loaded:
+                self._namespace_object = get_namespace(self.env, self.namespace)
+                self._namespace_loaded = True
+            return self._namespace_object
+
+    def get_objects(self, kind, metadata_only=False):
+        with self._lock:
+            return list(self._get_name_to_object(kind, metadata_only).values())
+
+    def iter_objects(self, kind, metadata_only=False):
+        '''
+        Iterate objects of a kind. If the kind has already been loaded this reads
+        from the snapshot, otherwise objects are streamed page by page from the API
+        without being kept in memory.
+        '''
+
+        with self._lock:
+            if self._is_loaded(kind, metadata_only):
+                return iter(list(self._kind_to_objects[kind].values()))
+
+        iter_function = self._get_iter_function(kind, metadata_only)
+        return iter_function(self.env, self.namespace)
+
+    def get_object(self, kind, name, metadata_only=False):
+        with self._lock:
+            return self._get_name_to_object(kind, metadata_only).get(name)
+
+    def exists(self, kind, name):
+        return self.get_object(kind, name) is not None
+
+    def get_objects_by_label(self, kind, key, value, metadata_only=False):
+        '''
+        Get objects of a kind with a given label. When the kind has already been
+        listed this uses the label index, otherwise the label selector is sent to
+        the API server so only matching objects are fetched (and not cached).
+        '''
+
+        with self._lock:
+            if self._is_loaded(kind, metadata_only):
+                name_to_object = self._kind_to_objects[kind]
+                names = self._kind_to_label_index[kind].get((key, value), ())
+                return [name_to_object[name] for name in sorted(names)]
+
+        iter_function = self._get_iter_function(kind, metadata_only)
+        return list(iter_function(self.env, self.namespace, label_selector=f'{key}={value}'))
+
+    def set_object(self, kind, obj):
+        with self._lock:
+            if kind == 'namespace':
+                self._namespace_object = obj
+                self._namespace_loaded = True
+                return
+
+            # Only track objects for kinds we have already loaded, otherwise the
+            # first read would see a partial listing.
+            if kind not in self._kind_to_objects:
+                return
+
+            self.remove_object(kind, get_object_name(obj))
+            self._kind_to_objects[kind][get_object_name(obj)] = obj
+            self._add_to_label_index(kind, obj)
+
+    def remove_object(self, kind, name):
+        with self._lock:
+            if kind == 'namespace':
+                self._namespace_object = None
+                self._namespace_loaded = True
+                return
+
+            if kind not in self._kind_to_objects:
+                return
+
+            obj = self._kind_to_objects[kind].pop(name, None)
+            if obj is not None:
+                self._remove_from_label_index(kind, obj)
+
+    def invalidate(self, kind=None):
+        with self._lock:
+            if kind is None or kind == 'namespace':
+                self._namespace_object = None
+                self._namespace_loaded = False
+
+            for kind_name in list(self._kind_to_objects.keys()):
+                if kind is None or kind == kind_name:
+                    self._kind_to_objects.pop(kind_name)
+                    self._kind_to_label_index.pop(kind_name)
+                    self._metadata_only_kinds.discard(kind_name)
@@ -0,0 +1,147 @@
+from functools import wraps
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+
+from kubernetes.client.rest import ApiException
+
+from kubetools.log import logger
+from kubetools.settings import get_settings
+
+# Throttled (429) or unavailable (5xx) responses that read requests are retried on
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Requests that are safe to repeat whatever happened to the first attempt
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class TokenBucket(object):
+    '''
+    A token bucket rate limiter: allows bursts of up to burst requests, refilled at
+    qps tokens per second. Thread safe, acquire blocks until a token is available.
+    '''
+
+    def __init__(self, qps, burst):
+        self.qps = float(qps)
+        self.burst = max(int(burst), 1)
+
+        self._lock = Lock()
+        self._tokens = float(self.burst)
+        self._last_refill = monotonic()
+
+    def acquire(self):
+        if self.qps <= 0:
+            return
+
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                float(self.burst),
+                self._tokens + (now - self._last_refill) * self.qps,
+            )
+            self._last_refill = now
+
+            # Take the token now (going negative if needed) and wait for it outside
+            # of the lock, which queues concurrent callers fairly.
+            self._tokens -= 1
+            wait_time = -self._tokens / self.qps if self._tokens < 0 else 0
+
+        if wait_time > 0:
+            sleep(wait_time)
+
+
+_rate_limiter = None
+_rate_limiter_lock = Lock()
+
+
+def get_rate_limiter():
+    '''
+    Get the rate limiter shared by every API client in this process.
+    '''
+
+    global _rate_limiter
+
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            settings = get_settings()
+            _rate_limiter = TokenBucket(settings.KUBE_QPS, settings.KUBE_BURST)
+
+    return _rate_limiter
+
+
+def _get_retry_after(headers):
+    retry_after = (headers or {}).get('Retry-After')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass  # HTTP dates are valid but not sent by the API server
+
+
+def _should_retry(method, status, headers):
+    '''
+    Whether a response should be retried. A gateway error (eg 504) does not mean a
+    write was not processed, so like client-go writes are only retried when
+    throttled (429) or when the server asks for a retry with Retry-After.
+    '''
+
+    if status not in RETRY_STATUSES:
+        return False
+
+    if method.upper() in IDEMPOTENT_METHODS or status == 429:
+        return True
+
+    return _get_retry_after(headers) is not None
+
+
+def _get_backoff(attempt, retry_after=None):
+    settings = get_settings()
+    max_backoff = float(settings.KUBE_RETRY_BACKOFF_MAX)
+
+    if retry_after is not None:
+        return min(retry_after, max_backoff)
+
+    backoff = float(settings.KUBE_RETRY_BACKOFF) * (2 ** attempt)
+    return uniform(0, min(backoff, max_backoff))
+
+
+def throttle_request(request_function):
+    '''
+    Wrap a REST client request function so every call waits on the shared rate
+    limiter, and throttled (429) or unavailable (502/503/504) responses are retried
+    with exponential backoff, honouring any Retry-After header. Writes are only
+    retried on unavailable responses that carry Retry-After, see _should_retry.
+
+    Depending on the client version these responses are either returned or raised
+    as an ApiException, so both are handled.
+    '''
+
+    @wraps(request_function)
+    def wrapper(method, url, *args, **kwargs):
+        max_retries = int(get_settings().KUBE_MAX_RETRIES)
+        attempt = 0
+
+        while True:
+            get_rate_limiter().acquire()
+
+            try:
+                response = request_function(method, url, *args, **kwargs)
+            except ApiException as e:
+                if not _should_retry(method, e.status, e.headers) or attempt >= max_retries:
+                    raise
+                status, headers = e.status, e.headers
+            else:
+                if (
+                    not _should_retry(method, response.status, response.headers)
+                    or attempt >= max_retries
+                ):
+                    return response
+                status, headers = response.status, response.headers
+                response.read()  # release the connection back to the pool
+
+            backoff = _get_backoff(attempt, _get_retry_after(headers))
+            logger.debug(f'{method} {url} returned {status}, retrying in {backoff:.2f}s')
+            sleep(backoff)
+            attempt += 1
+
+    return wrapper
@@ -0,0 +1,275 @@
+from time import monotonic, sleep
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import HTTPError
+
+from kubetools.exceptions import KubeTimeoutError
+from kubetools.log import logger
+from kubetools.settings import get_settings
+
+# Seconds each watch request made by follow_objects is held open for
+FOLLOW_WATCH_TIMEOUT = 60
+
+
+def get_wait_timeout():
+    settings = get_settings()
+    return float(settings.WAIT_SLEEP_TIME) * float(settings.WAIT_MAX_SLEEPS)
+
+
+def _list_objects(list_function, page_size=None, **kwargs):
+    '''
+    List objects, a page at a time when page_size is given, returning the items and
+    the resourceVersion of the list to watch from.
+    '''
+
+    if not page_size:
+        object_list = list_function(**kwargs)
+        return object_list.items, object_list.metadata.resource_version
+
+    items = []
+    continue_token = None
+
+    while True:
+        object_list = list_function(limit=page_size, _continue=continue_token, **kwargs)
+        items.extend(object_list.items)
+
+        continue_token = getattr(object_list.metadata, '_continue', None)
+        if not continue_token:
+            return items, object_list.metadata.resource_version
+
+
+def _watch_until(
+    list_function, check_items, check_event, description,
+    periodic_check=None,
+    get_pending=None,
+    deadline=None,
+    page_size=None,
+    **kwargs,
+):
+    '''
+    List objects once and then follow them with the watch API, resuming from the
+    last seen resourceVersion, until check_items (passed the listed items) or
+    check_event (passed each event type and object) returns True.
+
+    Should the watch break (or the resourceVersion expire) we wait one poll
+    interval and re-list before watching again.
+
+    If provided, periodic_check is called every poll interval while waiting, for
+    checks on state the watch does not cover (it may raise to abort the wait).
+
+    The wait ends at deadline (a monotonic timestamp, eg the overall deadline of a
+    build) or after the default wait timeout. On timeout get_pending, if provided,
+    is called to list what was still outstanding.
+
+    With page_size the (re-)lists are paginated, for waits over many objects.
+    '''
+
+    settings = get_settings()
+    if deadline is None:
+        deadline = monotonic() + get_wait_timeout()
+
+    resource_version = None
+
+    while True:
+        if resource_version is None:
+            items, resource_version = _list_objects(
+                list_function,
+                page_size=page_size,
+                **kwargs,
+            )
+            if check_items(items):
+                return
+
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            if get_pending:
+                pending = get_pending()
+                message = f'Timeout waiting for {description} (pending: {", ".join(pending)})'
+            else:
+                pending = [description]
+                message = f'Timeout waiting for {description}'
+
+            raise KubeTimeoutError(message, pending=pending)
+
+        timeout = remaining
+        if periodic_check:
+            timeout = min(timeout, float(settings.WAIT_SLEEP_TIME))
+
+        watcher = watch.Watch()
+        try:
+            for event in watcher.stream(
+                list_function,
+                resource_version=resource_version,
+                timeout_seconds=max(int(timeout), 1),
+                **kwargs,
+            ):
+                # Bookmark objects are left as plain dicts by the client
+                if event['type'] == 'BOOKMARK':
+                    continue
+
+                obj = event['object']
+                resource_version = obj.metadata.resource_version
+
+                if check_event(event['type'], obj):
+                    return
+
+            # The watch timed out without the check passing, resume from where
+            # we left off after any periodic check.
+            if periodic_check:
+                periodic_check()
+
+        except ApiException as e:
+            # 410 Gone means our resourceVersion is too old, re-list immediately
+            if e.status != 410:
+                logger.debug(f'Watch for {description} failed, polling: {e}')
+                sleep(float(settings.WAIT_SLEEP_TIME))
+            resource_version = None
+
+        except HTTPError as e:
+            logger.debug(f'Watch for {description} broke, polling: {e}')
+            sleep(float(settings.WAIT_SLEEP_TIME))
+            resource_version = None
+
+        finally:
+            watcher.stop()
+
+
+def wait_for_object_state(
+    list_function, name, check_function,
+    namespace=None,
+    description=None,
+    periodic_check=None,
+    deadline=None,
+):
+    '''
+    Wait for a named object to reach a state. The check function is called with
+    the current object (or None if it does not exist) and returns True once the
+    wanted state is reached.
+    '''
+
+    kwargs = {'namespace': namespace} if namespace else {}
+
+    def check_items(items):
+        return check_function(items[0] if items else None)
+
+    def check_event(event_type, obj):
+        return check_function(None if event_type == 'DELETED' else obj)
+
+    _watch_until(
+        list_function, check_items, check_event,
+        description or f'{name} to be ready',
+        periodic_check=periodic_check,
+        deadline=deadline,
+        field_selector=f'metadata.name={name}',
+        **kwargs,
+    )
+
+
+def wait_for_objects_removed(
+    list_function, names,
+    namespace=None,
+    label_selector=None,
+    deadline=None,
+):
+    '''
+    Wait for every one of the named objects to be removed, using a single watch
+    over the namespace (optionally narrowed by a label selector).
+    '''
+
+    names = set(names)
+    remaining_names = set(names)
+
+    kwargs = {'namespace': namespace} if namespace else {}
+    if label_selector:
+        kwargs['label_selector'] = label_selector
+
+    def check_items(items):
+        remaining_names.clear()
+        remaining_names.update(
+            item.metadata.name for item in items
+            if item.metadata.name in names
+        )
+        return not remaining_names
+
+    def check_event(event_type, obj):
+        if event_type == 'DELETED':
+            remaining_names.discard(obj.metadata.name)
+        return not remaining_names
+
+    _watch_until(
+        list_function, check_items, check_event,
+        f'{len(names)} objects to be removed',
+        get_pending=lambda: [f'{name} to be removed' for name in sorted(remaining_names)],
+        deadline=deadline,
+        page_size=int(get_settings().KUBE_LIST_PAGE_SIZE),
+        **kwargs,
+    )
+
+
+def follow_objects(
+    list_function, handle_items, handle_event, stop_event,
+    handle_error=None,
+    **kwargs,
+):
+    '''
+    List objects once and then follow them with the watch API until stop_event is
+    set, calling handle_items with the listed items and handle_event with each
+    event type and object.
+
+    Should the watch break (or the resourceVersion expire) objects are re-listed
+    and handle_items called again, so callers can replace their view of them.
+
+    Failed lists are retried every poll interval; handle_error, if provided, is
+    called with each list error so callers can report (or give up on) them.
+    '''
+
+    settings = get_settings()
+    resource_version = None
+
+    while not stop_event.is_set():
+        if resource_version is None:
+            try:
+                object_list = list_function(**kwargs)
+            except (ApiException, HTTPError) as e:
+                logger.debug(f'List failed, retrying: {e}')
+                if handle_error:
+                    handle_error(e)
+                stop_event.wait(float(settings.WAIT_SLEEP_TIME))
+                continue
+
+            resource_version = object_list.metadata.resource_version
+            handle_items(object_list.items)
+
+        watcher = watch.Watch()
+        try:
+            for event in watcher.stream(
+                list_function,
+                resource_version=resource_version,
+                timeout_seconds=FOLLOW_WATCH_TIMEOUT,
+                **kwargs,
+            ):
+                # Bookmark objects are left as plain dicts by the client
+                if event['type'] == 'BOOKMARK':
+                    continue
+
+                obj = event['object']
+                resource_version = obj.metadata.resource_version
+                handle_event(event['type'], obj)
+
+                if stop_event.is_set():
+                    return
+
+        except ApiException as e:
+            if e.status != 410:
+                logger.debug(f'Watch failed, re-listing: {e}')
+                stop_event.wait(float(settings.WAIT_SLEEP_TIME))
+            resource_version = None
+
+        except HTTPError as e:
+            logger.debug(f'Watch broke, re-listing: {e}')
+            stop_event.wait(float(settings.WAIT_SLEEP_TIME))
+            resource_version = None
+
+        finally:
+            watcher.stop()
@@ -21,6 +21,17 @@ class KubetoolsSettings(object):
 
     KUBETOOLS_SESSION = None  # user auth/session details (generated by the server)
 
+    KUBE_CONNECTION_POOL_SIZE = 10  # max connections kept per Kubernetes context
+    KUBE_LIST_PAGE_SIZE = 500  # max objects fetched per list request
+
+    KUBE_QPS = 20  # sustained API requests per second, shared by the whole process
+    KUBE_BURST = 40  # requests allowed in a burst above KUBE_QPS
+    KUBE_MAX_RETRIES = 5  # retries for throttled (429) or unavailable (5xx) requests
+    KUBE_RETRY_BACKOFF = 0.5  # initial retry backoff in seconds, doubled each retry
+    KUBE_RETRY_BACKOFF_MAX = 30  # max seconds to wait between retries
+
+    JOB_LOG_TAIL_LINES = 20  # job log lines included in the error when a job fails
+
     WAIT_SLEEP_TIME = 3
     WAIT_MAX_SLEEPS = 300 / WAIT_SLEEP_TIME
 
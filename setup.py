@@ -56,7 +56,8 @@ if __name__ == '__main__':
             'requests>=2,<3',
             'pyretry',
             'setuptools',
-            'kubernetes',
+            # 25.3 is the first client to serialize apply-patch+yaml (server-side apply) bodies
+            'kubernetes>=25.3',
             'tabulate<1',
         ),
         extras_require={
@@ -0,0 +1,38 @@
+from unittest import mock, TestCase
+
+import click
+
+from kubetools import cli
+
+
+CONTEXT_NAMES = ['staging-eu', 'staging-us', 'production']
+
+
+class TestEnsureContexts(TestCase):
+    def _ensure_contexts(self, value):
+        with mock.patch.object(
+            cli, '_get_context_names',
+            return_value=(CONTEXT_NAMES, 'staging-eu'),
+        ):
+            return cli.ensure_contexts(None, None, value)
+
+    def test_active_context_by_default(self):
+        self.assertEqual(self._ensure_contexts(()), ['staging-eu'])
+
+    def test_literal_context(self):
+        self.assertEqual(self._ensure_contexts(('production',)), ['production'])
+
+    def test_glob_matches_several_contexts(self):
+        self.assertEqual(self._ensure_contexts(('staging-*',)), ['staging-eu', 'staging-us'])
+
+    def test_glob_matching_nothing_is_an_error(self):
+        with self.assertRaises(click.BadParameter) as context:
+            self._ensure_contexts(('dev-*',))
+
+        self.assertIn('dev-*', str(context.exception))
+
+    def test_duplicate_contexts_are_used_once(self):
+        self.assertEqual(
+            self._ensure_contexts(('staging-us', 'staging-*', 'staging-us')),
+            ['staging-us', 'staging-eu'],
+        )
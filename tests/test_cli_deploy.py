@@ -0,0 +1,175 @@
+from types import SimpleNamespace
+from unittest import mock, TestCase
+
+import click
+
+from kubernetes.client.rest import ApiException
+
+from kubetools.cli import deploy
+from kubetools.deploy import build as build_module
+from kubetools.deploy.build import Build
+from kubetools.exceptions import KubeBuildError
+
+
+class TestRunBuilds(TestCase):
+    def test_api_errors_are_summarised(self):
+        builds = [
+            SimpleNamespace(
+                env=env,
+                namespace='preview',
+                log_error=mock.Mock(),
+                start_deadline=mock.Mock(),
+            )
+            for env in ('staging', 'production')
+        ]
+
+        def function(build):
+            if build.env == 'production':
+                raise ApiException(status=403, reason='Forbidden')
+
+        with mock.patch.object(deploy, '_print_builds_summary') as print_builds_summary:
+            with self.assertRaises(KubeBuildError) as context:
+                deploy._run_builds('Deploy', builds, function)
+
+        self.assertIn('production/preview', str(context.exception))
+        self.assertNotIn('staging', str(context.exception))
+
+        build_results = print_builds_summary.call_args[0][1]
+        self.assertEqual(
+            [(build.env, error is None) for build, error, _ in build_results],
+            [('staging', True), ('production', False)],
+        )
+        builds[1].log_error.assert_called_once_with('Deploy failed: 403 Forbidden')
+
+
+class TestBuildDeadline(TestCase):
+    def test_deadline_starts_at_execution(self):
+        with mock.patch.object(build_module, 'monotonic', return_value=100):
+            build = Build('staging', 'preview', timeout=60)
+
+        self.assertIsNone(build.deadline)
+
+        # Eg image builds and a slow confirmation before execution
+        deadlines = []
+        with mock.patch.object(build_module, 'monotonic', return_value=1000):
+            deploy._run_builds('Deploy', [build], lambda b: deadlines.append(b.deadline))
+
+        self.assertEqual(deadlines, [1060])
+
+
+def _invoke_command(command, **kwargs):
+    ctx = click.Context(command)
+    ctx.meta['kube_contexts'] = ['staging']
+
+    with ctx:
+        return ctx.invoke(command, **kwargs)
+
+
+class TestCleanupWait(TestCase):
+    def test_wait_shares_the_cleanup_deadline(self):
+        build = Build('staging', 'preview', timeout=60)
+
+        def run_builds(action, builds, function, parallelism=None):
+            build.deadline = 1060
+
+        with mock.patch.object(
+            deploy, '_make_builds', return_value=[build],
+        ), mock.patch.object(
+            deploy, '_plan_builds', return_value={build: ([], [], [mock.Mock()])},
+        ), mock.patch.object(
+            deploy, 'log_cleanup_changes',
+        ), mock.patch.object(
+            deploy, '_run_builds', side_effect=run_builds,
+        ), mock.patch.object(
+            deploy, 'check_pending_terminations', return_value=[],
+        ) as check_pending_terminations:
+            _invoke_command(
+                deploy.cleanup,
+                yes=True,
+                wait=True,
+                timeout=60,
+                namespace='preview',
+            )
+
+        check_pending_terminations.assert_called_once_with(
+            'staging',
+            wait=True,
+            deadline=1060,
+        )
+
+
+def _make_namespace(name, managed=True):
+    return SimpleNamespace(metadata=SimpleNamespace(
+        name=name,
+        annotations={'app.kubernetes.io/managed-by': 'kubetools'} if managed else None,
+    ))
+
+
+class TestCleanupAllNamespaces(TestCase):
+    def test_makes_builds_for_managed_namespaces(self):
+        context_to_namespaces = {
+            'staging': [_make_namespace('preview'), _make_namespace('kube-system', managed=False)],
+            'production': [_make_namespace('default')],
+        }
+
+        ctx = click.Context(deploy.cleanup)
+        ctx.meta['kube_contexts'] = ['staging', 'production']
+
+        with mock.patch.object(
+            deploy, 'iter_namespace_metadata',
+            side_effect=lambda context: context_to_namespaces[context],
+        ):
+            builds = deploy._make_all_namespaces_builds(ctx, timeout=60)
+
+        self.assertEqual(
+            [(build.env, build.namespace, build.log_prefix) for build in builds],
+            [
+                ('staging', 'preview', '[staging/preview] '),
+                ('production', 'default', '[production/default] '),
+            ],
+        )
+        self.assertEqual({build.timeout for build in builds}, {60})
+
+    def test_namespace_with_all_namespaces_is_rejected(self):
+        for all_namespaces, namespace in ((True, 'preview'), (False, None)):
+            with self.assertRaises(click.UsageError):
+                _invoke_command(
+                    deploy.cleanup,
+                    yes=True,
+                    all_namespaces=all_namespaces,
+                    parallelism=8,
+                    namespace=namespace,
+                )
+
+    def test_parallelism_is_passed_through(self):
+        builds = [Build('staging', namespace) for namespace in ('preview', 'review')]
+        build_to_objects = {build: ([], [], [mock.Mock()]) for build in builds}
+
+        with mock.patch.object(
+            deploy, '_make_all_namespaces_builds', return_value=builds,
+        ), mock.patch.object(
+            deploy, 'get_cleanup_objects', side_effect=lambda build: build_to_objects[build],
+        ), mock.patch.object(
+            deploy, 'log_cleanup_changes',
+        ), mock.patch.object(
+            deploy, 'execute_cleanup',
+        ) as execute_cleanup, mock.patch.object(
+            deploy, '_print_builds_summary',
+        ), mock.patch.object(
+            deploy, 'check_pending_terminations', return_value=[],
+        ), mock.patch.object(
+            deploy, 'run_concurrently', wraps=deploy.run_concurrently,
+        ) as run_concurrently:
+            _invoke_command(
+                deploy.cleanup,
+                yes=True,
+                all_namespaces=True,
+                parallelism=3,
+            )
+
+        # Both planning and executing the cleanups
+        self.assertEqual(run_concurrently.call_count, 2)
+        for call in run_concurrently.call_args_list:
+            self.assertEqual(call[1], {'parallelism': 3})
+
+        self.assertEqual(execute_cleanup.call_count, 2)
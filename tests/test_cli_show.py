@@ -0,0 +1,31 @@
+from unittest import mock, TestCase
+
+from kubernetes.client.rest import ApiException
+
+from kubetools.cli import show
+from kubetools.exceptions import KubeCLIError
+
+
+class TestNamespaceWatchView(TestCase):
+    def test_fails_when_initial_list_fails(self):
+        def follow_namespace_objects(
+            env, namespace, kind, handle_items, handle_event, stop_event,
+            handle_error=None,
+            label_selector=None,
+        ):
+            if kind == 'job':
+                handle_error(ApiException(status=403, reason='Forbidden'))
+            else:
+                handle_items([])
+
+        view = show.NamespaceWatchView(['staging'], 'preview')
+
+        with mock.patch.object(show, 'follow_namespace_objects', follow_namespace_objects):
+            with self.assertRaises(KubeCLIError) as context:
+                view.run()
+
+        self.assertEqual(
+            str(context.exception),
+            'Failed to list jobs in staging: 403 Forbidden',
+        )
+        self.assertTrue(view.stop_event.is_set())
@@ -4,8 +4,10 @@ from unittest import mock, TestCase
 import yaml
 
 from kubetools.config import load_kubetools_config
+from kubetools.constants import GIT_COMMIT_ANNOTATION_KEY, SPEC_HASH_ANNOTATION_KEY
 from kubetools.kubernetes.api import get_object_name
 from kubetools.kubernetes.config import generate_kubernetes_configs_for_project
+from kubetools.kubernetes.config.util import add_spec_hash_annotation, make_spec_hash
 
 
 def _assert_yaml_objects(objects, yaml_filename):
@@ -51,3 +53,35 @@ class TestKubernetesConfigGeneration(TestCase):
 
     def test_multiple_deployments_configs(self):
         _test_configs('multiple_deployments')
+
+
+class TestSpecHash(TestCase):
+    def _make_service(self, commit='abc1234', port=80):
+        return {
+            'metadata': {
+                'name': 'web',
+                'annotations': {GIT_COMMIT_ANNOTATION_KEY: commit},
+            },
+            'spec': {'ports': [{'port': port}]},
+        }
+
+    def test_ignores_git_annotations(self):
+        self.assertEqual(
+            make_spec_hash(self._make_service(commit='abc1234')),
+            make_spec_hash(self._make_service(commit='def5678')),
+        )
+
+    def test_changes_with_spec(self):
+        self.assertNotEqual(
+            make_spec_hash(self._make_service(port=80)),
+            make_spec_hash(self._make_service(port=8080)),
+        )
+
+    def test_stable_once_stamped(self):
+        service = self._make_service()
+        spec_hash = make_spec_hash(service)
+
+        add_spec_hash_annotation(service)
+
+        self.assertEqual(service['metadata']['annotations'][SPEC_HASH_ANNOTATION_KEY], spec_hash)
+        self.assertEqual(make_spec_hash(service), spec_hash)
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+from unittest import mock, TestCase
+
+from kubetools.deploy.commands import cleanup
+
+
+def _make_object(name, *owners, managed=True):
+    return SimpleNamespace(metadata=SimpleNamespace(
+        name=name,
+        uid=f'{name}-uid',
+        labels={},
+        annotations={'app.kubernetes.io/managed-by': 'kubetools'} if managed else {},
+        owner_references=[
+            SimpleNamespace(kind=kind, name=owner_name, uid=f'{owner_name}-uid')
+            for kind, owner_name in owners
+        ] or None,
+        deletion_timestamp=None,
+    ))
+
+
+def _make_build(kind_to_objects):
+    return SimpleNamespace(
+        env='staging',
+        namespace='preview',
+        snapshot=SimpleNamespace(
+            iter_objects=lambda kind, metadata_only=False: kind_to_objects.get(kind, []),
+            get_namespace=lambda: _make_object('preview'),
+        ),
+    )
+
+
+class TestGetCleanupObjects(TestCase):
+    def test_keeps_objects_of_deployment_missing_from_listing(self):
+        build = _make_build({
+            'replica_set': [_make_object('web-abc', ('Deployment', 'web'))],
+            'pod': [_make_object('web-abc-1', ('ReplicaSet', 'web-abc'))],
+        })
+
+        with mock.patch.object(cleanup, 'object_exists_with_uid', return_value=True):
+            namespace, replica_sets, pods = cleanup.get_cleanup_objects(build)
+
+        self.assertEqual((namespace, replica_sets, pods), ([], [], []))
+
+    def test_deletes_unowned_replica_set_and_its_pods(self):
+        build = _make_build({
+            'replica_set': [_make_object('web-abc')],
+            'pod': [
+                _make_object('web-abc-1', ('ReplicaSet', 'web-abc')),
+                _make_object('gone-1', ('Job', 'gone')),
+            ],
+        })
+
+        with mock.patch.object(
+            cleanup, 'object_exists_with_uid',
+            return_value=False,
+        ) as object_exists_with_uid:
+            namespace, replica_sets, pods = cleanup.get_cleanup_objects(build)
+
+        self.assertEqual([rs.metadata.name for rs in replica_sets], ['web-abc'])
+        self.assertEqual([pod.metadata.name for pod in pods], ['web-abc-1', 'gone-1'])
+        self.assertEqual(len(namespace), 1)
+        # Only the job missing from the listing was read directly
+        object_exists_with_uid.assert_called_once_with(
+            'staging', 'preview', 'job', 'gone',
+            uid='gone-uid',
+        )
+
+    def test_reads_each_missing_owner_once(self):
+        build = _make_build({
+            'pod': [
+                _make_object(f'web-abc-{i}', ('ReplicaSet', 'web-abc'))
+                for i in range(5)
+            ],
+        })
+
+        with mock.patch.object(
+            cleanup, 'object_exists_with_uid',
+            return_value=True,
+        ) as object_exists_with_uid:
+            _, _, pods = cleanup.get_cleanup_objects(build)
+
+        self.assertEqual(pods, [])
+        object_exists_with_uid.assert_called_once_with(
+            'staging', 'preview', 'replica_set', 'web-abc',
+            uid='web-abc-uid',
+        )
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+from unittest import mock, TestCase
+
+from kubetools.constants import SPEC_HASH_ANNOTATION_KEY
+from kubetools.deploy.commands import deploy
+
+
+def _make_live_deployment(spec_hash, rolled_out):
+    return SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='web',
+            generation=2,
+            annotations={SPEC_HASH_ANNOTATION_KEY: spec_hash},
+            labels={},
+        ),
+        spec=SimpleNamespace(replicas=2),
+        status=SimpleNamespace(
+            observed_generation=2,
+            replicas=2,
+            updated_replicas=2,
+            available_replicas=2 if rolled_out else 0,
+            conditions=None,
+        ),
+    )
+
+
+def _make_build(live_deployment):
+    return SimpleNamespace(
+        env='staging',
+        namespace='preview',
+        deadline=None,
+        log_info=mock.Mock(),
+        snapshot=SimpleNamespace(get_object=lambda kind, name: live_deployment),
+    )
+
+
+DEPLOYMENT = {'metadata': {'name': 'web', 'annotations': {SPEC_HASH_ANNOTATION_KEY: 'abc'}}}
+
+
+class TestUnchangedDeployment(TestCase):
+    def test_rolled_out_is_unchanged(self):
+        build = _make_build(_make_live_deployment('abc', rolled_out=True))
+
+        self.assertTrue(deploy._is_unchanged(build, 'deployment', DEPLOYMENT))
+
+    def test_failed_rollout_is_waited_on_without_write(self):
+        live_deployment = _make_live_deployment('abc', rolled_out=False)
+        build = _make_build(live_deployment)
+
+        self.assertFalse(deploy._is_unchanged(build, 'deployment', DEPLOYMENT))
+
+        with mock.patch.object(
+            deploy, 'apply_deployment',
+        ) as apply_deployment, mock.patch.object(
+            deploy, 'wait_for_deployment',
+        ) as wait_for_deployment:
+            deploy._apply_deployment(build, DEPLOYMENT)
+
+        apply_deployment.assert_not_called()
+        wait_for_deployment.assert_called_once_with(
+            'staging', 'preview', live_deployment,
+            deadline=None,
+        )
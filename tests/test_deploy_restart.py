@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest import mock, TestCase
+
+from kubetools.deploy.commands import restart
+
+
+def _make_object(name):
+    return SimpleNamespace(metadata=SimpleNamespace(name=name))
+
+
+@contextmanager
+def _stage(message):
+    yield
+
+
+def _make_build():
+    return SimpleNamespace(
+        env='staging',
+        namespace='preview',
+        deadline=123.0,
+        log_info=mock.Mock(),
+        stage=_stage,
+        snapshot=SimpleNamespace(set_object=mock.Mock(), remove_object=mock.Mock()),
+    )
+
+
+DEPLOYMENTS_AND_PODS = [
+    (_make_object('web'), [_make_object('web-abc-1'), _make_object('web-abc-2')]),
+    (_make_object('worker'), [_make_object('worker-def-1')]),
+]
+
+
+class TestExecuteRestart(TestCase):
+    def test_rolling_restart(self):
+        build = _make_build()
+
+        with mock.patch.object(
+            restart, 'restart_deployment',
+            side_effect=lambda env, namespace, deployment, deadline: deployment,
+        ) as restart_deployment, mock.patch.object(
+            restart, 'delete_pod',
+        ) as delete_pod:
+            restart.execute_restart(build, DEPLOYMENTS_AND_PODS, parallelism=2)
+
+        self.assertEqual(
+            sorted(call[0][2].metadata.name for call in restart_deployment.call_args_list),
+            ['web', 'worker'],
+        )
+        for call in restart_deployment.call_args_list:
+            self.assertEqual(call[0][:2], ('staging', 'preview'))
+            self.assertEqual(call[1], {'deadline': 123.0})
+
+        self.assertEqual(build.snapshot.set_object.call_count, 2)
+        delete_pod.assert_not_called()
+
+    def test_rolling_restart_passes_parallelism(self):
+        build = _make_build()
+
+        with mock.patch.object(restart, 'run_concurrently') as run_concurrently:
+            restart.execute_restart(build, DEPLOYMENTS_AND_PODS, parallelism=3)
+
+        self.assertEqual(
+            [deployment.metadata.name for deployment in run_concurrently.call_args[0][1]],
+            ['web', 'worker'],
+        )
+        self.assertEqual(run_concurrently.call_args[1], {'parallelism': 3})
+
+    def test_delete_pods_restarts_pod_by_pod(self):
+        build = _make_build()
+        calls = []
+
+        with mock.patch.object(
+            restart, 'delete_pod',
+            side_effect=lambda env, namespace, pod, deadline: calls.append(
+                ('delete', pod.metadata.name),
+            ),
+        ), mock.patch.object(
+            restart, 'wait_for_deployment',
+            side_effect=lambda env, namespace, deployment, deadline: calls.append(
+                ('wait', deployment.metadata.name),
+            ),
+        ), mock.patch.object(restart, 'restart_deployment') as restart_deployment:
+            restart.execute_restart(build, DEPLOYMENTS_AND_PODS, delete_pods=True)
+
+        # Each pod is deleted and the deployment recovers before the next
+        self.assertEqual(calls, [
+            ('delete', 'web-abc-1'),
+            ('wait', 'web'),
+            ('delete', 'web-abc-2'),
+            ('wait', 'web'),
+            ('delete', 'worker-def-1'),
+            ('wait', 'worker'),
+        ])
+        self.assertEqual(
+            [call[0][1] for call in build.snapshot.remove_object.call_args_list],
+            ['web-abc-1', 'web-abc-2', 'worker-def-1'],
+        )
+        restart_deployment.assert_not_called()
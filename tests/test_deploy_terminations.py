@@ -0,0 +1,68 @@
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest import mock, TestCase
+
+from kubetools.deploy import terminations
+
+
+def _make_namespace(terminating=True):
+    return SimpleNamespace(
+        metadata=SimpleNamespace(deletion_timestamp='now' if terminating else None),
+        status=SimpleNamespace(conditions=None),
+    )
+
+
+class TestPendingTerminations(TestCase):
+    def setUp(self):
+        settings_directory = TemporaryDirectory()
+        self.addCleanup(settings_directory.cleanup)
+
+        patcher = mock.patch.object(
+            terminations, 'get_settings_directory',
+            return_value=settings_directory.name,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_record_and_forget(self):
+        terminations.record_pending_termination('staging', 'preview-1')
+        terminations.record_pending_termination('staging', 'preview-2')
+        terminations.record_pending_termination('production', 'preview-3')
+
+        self.assertEqual(
+            set(terminations.get_pending_terminations('staging')),
+            {'preview-1', 'preview-2'},
+        )
+
+        terminations.forget_pending_terminations('staging', ['preview-1'])
+
+        self.assertEqual(set(terminations.get_pending_terminations('staging')), {'preview-2'})
+        self.assertEqual(set(terminations.get_pending_terminations('production')), {'preview-3'})
+
+    def test_check_forgets_removed_namespaces(self):
+        terminations.record_pending_termination('staging', 'gone')
+        terminations.record_pending_termination('staging', 'terminating')
+
+        def get_namespace(env, namespace):
+            return _make_namespace() if namespace == 'terminating' else None
+
+        with mock.patch.object(terminations, 'get_namespace', side_effect=get_namespace):
+            stuck = terminations.check_pending_terminations('staging')
+
+        # Only just deleted, so not stuck yet
+        self.assertEqual(stuck, [])
+        self.assertEqual(set(terminations.get_pending_terminations('staging')), {'terminating'})
+
+    def test_check_wait_reports_stuck(self):
+        terminations.record_pending_termination('staging', 'stuck')
+
+        with mock.patch.object(
+            terminations, 'wait_for_namespaces_removed',
+            side_effect=terminations.KubeTimeoutError('Timeout'),
+        ), mock.patch.object(
+            terminations, 'get_namespace',
+            return_value=_make_namespace(),
+        ):
+            stuck = terminations.check_pending_terminations('staging', wait=True)
+
+        self.assertEqual([namespace for namespace, _, _ in stuck], ['stuck'])
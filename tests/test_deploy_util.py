@@ -0,0 +1,39 @@
+from threading import Barrier
+from unittest import TestCase
+
+from kubetools.deploy.util import run_concurrently
+from kubetools.exceptions import KubeBuildError, KubeTimeoutError
+
+
+class TestRunConcurrently(TestCase):
+    def test_runs_items_concurrently(self):
+        # Would deadlock (and timeout) if the three items ran one after another
+        barrier = Barrier(3, timeout=5)
+
+        def function(item):
+            barrier.wait()
+            return item * 2
+
+        self.assertEqual(run_concurrently(function, [1, 2, 3], parallelism=3), [2, 4, 6])
+
+    def test_raises_after_all_items_complete(self):
+        completed = []
+
+        def function(item):
+            if item == 1:
+                raise KubeBuildError('bad item')
+            completed.append(item)
+
+        with self.assertRaises(KubeBuildError):
+            run_concurrently(function, [1, 2, 3], parallelism=2)
+
+        self.assertEqual(sorted(completed), [2, 3])
+
+    def test_timeouts_combined(self):
+        def function(item):
+            raise KubeTimeoutError(f'Timeout waiting for {item}', pending=[item])
+
+        with self.assertRaises(KubeTimeoutError) as context:
+            run_concurrently(function, ['web', 'worker'], parallelism=2)
+
+        self.assertEqual(context.exception.pending, ['web', 'worker'])
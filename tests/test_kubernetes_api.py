@@ -0,0 +1,396 @@
+import json
+
+from threading import Event
+from types import SimpleNamespace
+from unittest import mock, TestCase
+
+from kubernetes.client.rest import ApiException
+
+from kubetools.constants import RESTARTED_AT_ANNOTATION_KEY
+from kubetools.exceptions import KubeRolloutError
+from kubetools.kubernetes import api
+
+
+def _patch_make_api_client():
+    return mock.patch.object(
+        api, '_make_api_client',
+        side_effect=lambda env: mock.MagicMock(),
+    )
+
+
+class TestApiClientPool(TestCase):
+    def setUp(self):
+        api.reset_api_clients()
+
+    def tearDown(self):
+        api.reset_api_clients()
+
+    def test_client_reused_per_context(self):
+        with _patch_make_api_client() as make:
+            staging_client = api._get_api_client('staging')
+            self.assertIs(api._get_api_client('staging'), staging_client)
+            self.assertIsNot(api._get_api_client('production'), staging_client)
+
+        self.assertEqual(make.call_count, 2)
+
+    def test_reset_single_context(self):
+        with _patch_make_api_client():
+            staging_client = api._get_api_client('staging')
+            production_client = api._get_api_client('production')
+
+            api.reset_api_clients('staging')
+
+            staging_client.close.assert_called_once_with()
+            self.assertIsNot(api._get_api_client('staging'), staging_client)
+            self.assertIs(api._get_api_client('production'), production_client)
+
+
+class TestIterList(TestCase):
+    def test_follows_continue_token(self):
+        def make_page(items, continue_token):
+            page = mock.Mock(items=items)
+            page.metadata._continue = continue_token
+            return page
+
+        list_function = mock.Mock(side_effect=[
+            make_page([1, 2], 'next'),
+            make_page([3], None),
+        ])
+
+        with mock.patch.object(api.get_settings(), 'KUBE_LIST_PAGE_SIZE', 2):
+            items = list(api._iter_list(list_function, namespace='default'))
+
+        self.assertEqual(items, [1, 2, 3])
+        list_function.assert_has_calls([
+            mock.call(limit=2, _continue=None, namespace='default'),
+            mock.call(limit=2, _continue='next', namespace='default'),
+        ])
+
+
+class TestMetadataList(TestCase):
+    def test_yields_partial_objects(self):
+        response = mock.Mock(data=json.dumps({
+            'metadata': {},
+            'items': [{
+                'metadata': {
+                    'name': 'web-abc',
+                    'annotations': {'app.kubernetes.io/managed-by': 'kubetools'},
+                    'ownerReferences': [{'kind': 'ReplicaSet', 'name': 'web'}],
+                },
+            }],
+        }))
+        list_function = mock.Mock(return_value=response)
+
+        objects = list(api._iter_metadata_list(list_function, namespace='default'))
+
+        self.assertEqual(len(objects), 1)
+        self.assertEqual(api.get_object_name(objects[0]), 'web-abc')
+        self.assertEqual(api.get_object_labels_dict(objects[0]), {})
+        self.assertTrue(api.is_kubetools_object(objects[0]))
+        self.assertEqual(objects[0].metadata.owner_references[0].name, 'web')
+        self.assertIsNone(objects[0].metadata.deletion_timestamp)
+        self.assertEqual(list_function.call_args[1]['_preload_content'], False)
+
+
+class TestTableList(TestCase):
+    def test_yields_rows_across_pages(self):
+        list_function = mock.Mock(side_effect=[
+            mock.Mock(data=json.dumps({
+                'metadata': {'continue': 'next'},
+                'columnDefinitions': [{'name': 'Name'}, {'name': 'Ready'}],
+                'rows': [{
+                    'cells': ['web', '1/2'],
+                    'object': {'metadata': {'name': 'web', 'namespace': 'default'}},
+                }],
+            })),
+            mock.Mock(data=json.dumps({
+                'metadata': {},
+                'rows': [{
+                    'cells': ['worker', '0/1'],
+                    'object': {'metadata': {'name': 'worker', 'namespace': 'default'}},
+                }],
+            })),
+        ])
+
+        rows = list(api._iter_table_list(list_function, namespace='default'))
+
+        self.assertEqual([api.get_object_name(row) for row in rows], ['web', 'worker'])
+        self.assertEqual(rows[1].cells, {'Name': 'worker', 'Ready': '0/1'})
+        self.assertEqual(rows[0].metadata.namespace, 'default')
+        self.assertEqual(list_function.call_args[1]['_continue'], 'next')
+
+
+class TestCollectionLabelSelector(TestCase):
+    def _make_metadata_list_function(self, *names):
+        return mock.Mock(return_value=mock.Mock(data=json.dumps({
+            'metadata': {},
+            'items': [{'metadata': {'name': name}} for name in names],
+        })))
+
+    def _make_pod(self, name, labels):
+        return {'metadata': {'name': name, 'labels': labels}}
+
+    def test_selector_from_common_labels(self):
+        pods = [
+            self._make_pod('web-1', {'app': 'web', 'hash': '1'}),
+            self._make_pod('web-2', {'app': 'web', 'hash': '2'}),
+        ]
+        list_function = self._make_metadata_list_function('web-1', 'web-2')
+
+        self.assertEqual(
+            api._get_collection_label_selector(list_function, 'default', pods),
+            'app=web',
+        )
+        self.assertEqual(list_function.call_args[1]['label_selector'], 'app=web')
+
+    def test_no_selector_if_it_matches_other_objects(self):
+        pods = [
+            self._make_pod('web-1', {'app': 'web'}),
+            self._make_pod('web-2', {'app': 'web'}),
+        ]
+        list_function = self._make_metadata_list_function('web-1', 'web-2', 'web-3')
+
+        self.assertIsNone(api._get_collection_label_selector(list_function, 'default', pods))
+
+    def test_no_selector_without_common_labels(self):
+        pods = [
+            self._make_pod('web-1', {'app': 'web'}),
+            self._make_pod('db-1', {'app': 'db'}),
+        ]
+        list_function = self._make_metadata_list_function()
+
+        self.assertIsNone(api._get_collection_label_selector(list_function, 'default', pods))
+        list_function.assert_not_called()
+
+
+class TestDeleteObjectsWait(TestCase):
+    def _delete_objects(self, pods):
+        get_api = mock.Mock()
+
+        with mock.patch.object(
+            api, '_get_collection_label_selector', return_value=None,
+        ), mock.patch.object(
+            api, '_wait_for_no_object',
+        ) as wait_for_no_object, mock.patch.object(
+            api, 'wait_for_objects_removed',
+        ) as wait_for_objects_removed:
+            api._delete_objects('staging', get_api, 'pod', 'default', pods)
+
+        return wait_for_no_object, wait_for_objects_removed
+
+    def test_waits_by_shared_labels(self):
+        wait_for_no_object, wait_for_objects_removed = self._delete_objects([
+            {'metadata': {'name': 'web-1', 'labels': {'app': 'web', 'hash': '1'}}},
+            {'metadata': {'name': 'web-2', 'labels': {'app': 'web', 'hash': '2'}}},
+        ])
+
+        wait_for_no_object.assert_not_called()
+        self.assertEqual(wait_for_objects_removed.call_args[1]['label_selector'], 'app=web')
+
+    def test_waits_by_name_without_shared_labels(self):
+        wait_for_no_object, wait_for_objects_removed = self._delete_objects([
+            {'metadata': {'name': 'web-1', 'labels': {'app': 'web'}}},
+            {'metadata': {'name': 'db-1', 'labels': {'app': 'db'}}},
+        ])
+
+        wait_for_objects_removed.assert_not_called()
+        self.assertEqual(wait_for_no_object.call_count, 2)
+
+
+class TestRestartDeployment(TestCase):
+    def test_patches_pod_template_and_waits(self):
+        apps_api = mock.Mock()
+        patched_deployment = apps_api.patch_namespaced_deployment.return_value
+
+        with mock.patch.object(api, '_get_k8s_apps_api', return_value=apps_api), \
+                mock.patch.object(api, 'wait_for_deployment') as wait_for_deployment:
+            k8s_deployment = api.restart_deployment(
+                'staging', 'default', {'metadata': {'name': 'web'}},
+                deadline=123.0,
+            )
+
+        self.assertIs(k8s_deployment, patched_deployment)
+
+        kwargs = apps_api.patch_namespaced_deployment.call_args[1]
+        self.assertEqual((kwargs['name'], kwargs['namespace']), ('web', 'default'))
+        # Only the restart annotation on the pod template is changed
+        self.assertEqual(list(kwargs['body']), ['spec'])
+        self.assertEqual(list(kwargs['body']['spec']), ['template'])
+        annotations = kwargs['body']['spec']['template']['metadata']['annotations']
+        self.assertEqual(list(annotations), [RESTARTED_AT_ANNOTATION_KEY])
+        self.assertTrue(annotations[RESTARTED_AT_ANNOTATION_KEY].endswith('Z'))
+
+        # The rollout wait is on the patched deployment (its new generation)
+        wait_for_deployment.assert_called_once_with(
+            'staging', 'default', patched_deployment,
+            deadline=123.0,
+        )
+
+
+class FakeLogResponse(object):
+    '''
+    A followed pod log: yields one line then blocks, like a running pod, until
+    shut down (after which it still has a buffered line to hand out).
+    '''
+
+    def __init__(self):
+        self.first_line_read = Event()
+        self._shut_down = Event()
+        self.close = mock.Mock()
+        self.release_conn = mock.Mock()
+
+    def shutdown(self):
+        self._shut_down.set()
+
+    def __iter__(self):
+        yield b'first line\n'
+        self.first_line_read.set()
+        self._shut_down.wait(10)
+        yield b'buffered line\n'
+
+
+class TestJobLogStreamer(TestCase):
+    def test_nothing_logged_after_stop(self):
+        response = FakeLogResponse()
+        core_api = mock.Mock()
+        core_api.read_namespaced_pod_log.return_value = response
+
+        pod = SimpleNamespace(
+            metadata=SimpleNamespace(name='upgrade-abc', creation_timestamp=None),
+            status=SimpleNamespace(phase='Running'),
+        )
+        logged_lines = []
+
+        with mock.patch.object(api, '_get_k8s_core_api', return_value=core_api), \
+                mock.patch.object(api, 'list_pods', return_value=[pod]):
+            streamer = api.JobLogStreamer(
+                'staging', 'default', 'upgrade',
+                log_function=logged_lines.append,
+            )
+            streamer.start()
+            self.assertTrue(response.first_line_read.wait(10))
+
+            streamer.stop()
+            lines_at_stop = list(logged_lines)
+
+        self.assertFalse(streamer._thread.is_alive())
+        self.assertEqual(logged_lines, lines_at_stop)
+        response.close.assert_called_once_with()
+
+        # The final pass doesn't follow the (already streamed) pod again
+        core_api.read_namespaced_pod_log.assert_called_once_with(
+            'upgrade-abc', 'default',
+            follow=True,
+            _preload_content=False,
+        )
+
+
+class TestWaitForJob(TestCase):
+    def _wait_for_job(self, job_state):
+        def fake_wait(list_function, name, check_function, **kwargs):
+            self.assertTrue(check_function(job_state))
+
+        log_streamer = mock.Mock(lines=['starting upgrade', 'boom'])
+
+        with mock.patch.object(api, '_get_k8s_batch_api'), \
+                mock.patch.object(api, 'wait_for_object_state', side_effect=fake_wait), \
+                mock.patch.object(api, 'JobLogStreamer', return_value=log_streamer):
+            api.wait_for_job('staging', 'default', {'metadata': {'name': 'upgrade'}})
+
+        log_streamer.start.assert_called_once_with()
+        log_streamer.stop.assert_called_once_with()
+
+    def test_failed_job_raises_with_log_lines(self):
+        job_state = mock.Mock()
+        job_state.status.conditions = [mock.Mock(
+            type='Failed',
+            status='True',
+            reason='BackoffLimitExceeded',
+            message='backoff limit reached',
+        )]
+
+        with self.assertRaises(KubeRolloutError) as context:
+            self._wait_for_job(job_state)
+
+        self.assertEqual(context.exception.reason, 'BackoffLimitExceeded')
+        self.assertIn('boom', str(context.exception))
+
+    def test_completed_job(self):
+        job_state = mock.Mock()
+        job_state.status.conditions = []
+        job_state.status.succeeded = 1
+        job_state.spec.completions = 1
+
+        self._wait_for_job(job_state)
+
+
+class TestApplyObject(TestCase):
+    def test_patches_existing_object(self):
+        create, patch = mock.Mock(), mock.Mock(return_value='patched')
+
+        self.assertEqual(api._apply_object(create, patch, exists=True), ('patched', False))
+        create.assert_not_called()
+
+    def test_creates_new_object(self):
+        create, patch = mock.Mock(return_value='created'), mock.Mock()
+
+        self.assertEqual(api._apply_object(create, patch, exists=False), ('created', True))
+        patch.assert_not_called()
+
+    def test_falls_back_to_create_on_not_found(self):
+        create = mock.Mock(return_value='created')
+        patch = mock.Mock(side_effect=ApiException(status=404))
+
+        self.assertEqual(api._apply_object(create, patch), ('created', True))
+
+    def test_falls_back_to_patch_on_conflict(self):
+        create = mock.Mock(side_effect=ApiException(status=409))
+        patch = mock.Mock(return_value='patched')
+
+        self.assertEqual(api._apply_object(create, patch, exists=False), ('patched', False))
+
+    def test_other_errors_raised(self):
+        create = mock.Mock()
+        patch = mock.Mock(side_effect=ApiException(status=500))
+
+        with self.assertRaises(ApiException):
+            api._apply_object(create, patch, exists=True)
+
+        create.assert_not_called()
+
+
+class TestServerSideApply(TestCase):
+    def test_apply_request(self):
+        get_api = mock.Mock()
+        service = {'metadata': {'name': 'web'}}
+
+        api._server_side_apply_object(
+            'staging', get_api, 'patch_namespaced_service', 'default', service,
+            force=True,
+            dry_run=True,
+        )
+
+        get_api.assert_called_once_with(
+            'staging',
+            headers={'Content-Type': api.APPLY_PATCH_CONTENT_TYPE},
+        )
+        get_api.return_value.patch_namespaced_service.assert_called_once_with(
+            name='web',
+            body=service,
+            namespace='default',
+            field_manager='kubetools',
+            force=True,
+            dry_run='All',
+        )
+
+    def test_force_and_dry_run_unset_by_default(self):
+        get_api = mock.Mock()
+
+        api._server_side_apply_object(
+            'staging', get_api, 'patch_namespace', None, {'metadata': {'name': 'default'}},
+        )
+
+        kwargs = get_api.return_value.patch_namespace.call_args[1]
+        self.assertNotIn('force', kwargs)
+        self.assertNotIn('dry_run', kwargs)
+        self.assertNotIn('namespace', kwargs)
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+from kubetools.kubernetes.ownership import OwnershipGraph
+
+
+def _make_object(name, *owners, uid=None):
+    return SimpleNamespace(metadata=SimpleNamespace(
+        name=name,
+        uid=uid or f'{name}-uid',
+        owner_references=[
+            SimpleNamespace(kind=kind, name=owner_name, uid=f'{owner_name}-uid')
+            for kind, owner_name in owners
+        ] or None,
+    ))
+
+
+class TestOwnershipGraph(TestCase):
+    def setUp(self):
+        self.graph = OwnershipGraph({
+            'deployment': [_make_object('web')],
+            'job': [_make_object('upgrade')],
+            'replica_set': [
+                _make_object('web-1', ('Deployment', 'web')),
+                _make_object('old-1', ('Deployment', 'old')),
+                _make_object('lonely-1'),
+            ],
+            'pod': [
+                _make_object('web-1-a', ('ReplicaSet', 'web-1')),
+                _make_object('old-1-a', ('ReplicaSet', 'old-1')),
+                _make_object('upgrade-a', ('Job', 'upgrade')),
+                _make_object('stateful-0', ('StatefulSet', 'stateful')),
+                _make_object('shared', ('ReplicaSet', 'old-1'), ('Job', 'upgrade')),
+                _make_object('bare'),
+            ],
+        })
+
+    def test_get_descendants(self):
+        pods = self.graph.get_descendants('deployment', 'web', 'pod')
+
+        self.assertEqual([pod.metadata.name for pod in pods], ['web-1-a'])
+
+    def test_get_children(self):
+        children = self.graph.get_children('job', 'upgrade')
+
+        self.assertEqual(
+            [child.metadata.name for child in children],
+            ['shared', 'upgrade-a'],
+        )
+
+    def test_is_orphan(self):
+        self.assertTrue(self.graph.is_orphan('replica_set', 'old-1'))
+        self.assertTrue(self.graph.is_orphan('replica_set', 'lonely-1'))
+        self.assertTrue(self.graph.is_orphan('pod', 'bare'))
+        self.assertFalse(self.graph.is_orphan('replica_set', 'web-1'))
+        self.assertFalse(self.graph.is_orphan('pod', 'upgrade-a'))
+        # Owners of untracked kinds are assumed to exist
+        self.assertFalse(self.graph.is_orphan('pod', 'stateful-0'))
+
+    def test_is_orphan_removed_owner(self):
+        removed_keys = {('replica_set', 'old-1')}
+
+        self.assertTrue(self.graph.is_orphan('pod', 'old-1-a', removed_keys=removed_keys))
+        # Still owned by the job
+        self.assertFalse(self.graph.is_orphan('pod', 'shared', removed_keys=removed_keys))
+
+    def test_replaced_owner_is_missing(self):
+        graph = OwnershipGraph({
+            'deployment': [_make_object('web', uid='new-uid')],
+            'replica_set': [_make_object('web-1', ('Deployment', 'web'))],
+        })
+
+        self.assertTrue(graph.is_orphan('replica_set', 'web-1'))
+        self.assertEqual(graph.get_owners('replica_set', 'web-1'), [])
+
+    def test_is_orphan_confirm_missing(self):
+        confirmed = []
+
+        def confirm_missing(owner_kind, owner):
+            confirmed.append((owner_kind, owner.name))
+            return False
+
+        # The owning deployment exists after all (created after the listing)
+        self.assertFalse(self.graph.is_orphan(
+            'replica_set', 'old-1',
+            confirm_missing=confirm_missing,
+        ))
+        self.assertEqual(confirmed, [('deployment', 'old')])
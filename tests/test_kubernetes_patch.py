@@ -0,0 +1,71 @@
+from unittest import TestCase
+
+from kubetools.constants import LAST_APPLIED_ANNOTATION_KEY
+from kubetools.kubernetes.patch import (
+    add_last_applied_annotation,
+    get_last_applied,
+    make_three_way_merge_patch,
+)
+
+
+def _make_deployment(env=None, replicas=1, annotations=None):
+    container = {'name': 'web', 'image': 'web:1'}
+    if env:
+        container['env'] = env
+
+    return {
+        'metadata': {'name': 'web', 'annotations': annotations or {}},
+        'spec': {
+            'replicas': replicas,
+            'template': {'spec': {'containers': [container]}},
+        },
+    }
+
+
+class TestLastApplied(TestCase):
+    def test_round_trip(self):
+        deployment = _make_deployment()
+        annotated = add_last_applied_annotation(deployment)
+
+        self.assertNotIn(LAST_APPLIED_ANNOTATION_KEY, deployment['metadata']['annotations'])
+        self.assertEqual(get_last_applied(annotated), deployment)
+
+
+class TestThreeWayMergePatch(TestCase):
+    def test_no_patch_when_live_has_only_defaults(self):
+        modified = _make_deployment()
+        current = _make_deployment()
+        current['spec']['template']['spec']['containers'][0]['imagePullPolicy'] = 'Always'
+        current['status'] = {'replicas': 1}
+
+        self.assertEqual(make_three_way_merge_patch(modified, modified, current), {})
+
+    def test_only_changed_fields_sent(self):
+        original = _make_deployment(replicas=1)
+        modified = _make_deployment(replicas=3)
+
+        self.assertEqual(
+            make_three_way_merge_patch(original, modified, original),
+            {'spec': {'replicas': 3}},
+        )
+
+    def test_removed_fields_deleted(self):
+        original = _make_deployment(annotations={'a': '1', 'b': '2'})
+        modified = _make_deployment(annotations={'a': '1'})
+        current = _make_deployment(annotations={'a': '1', 'b': '2', 'other': 'x'})
+
+        self.assertEqual(
+            make_three_way_merge_patch(original, modified, current),
+            {'metadata': {'annotations': {'b': None}}},
+        )
+
+    def test_changed_list_sent_whole(self):
+        original = _make_deployment(env=[{'name': 'A', 'value': '1'}])
+        modified = _make_deployment()
+
+        patch = make_three_way_merge_patch(original, modified, original)
+
+        self.assertEqual(
+            patch['spec']['template']['spec']['containers'],
+            modified['spec']['template']['spec']['containers'],
+        )
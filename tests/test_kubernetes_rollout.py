@@ -0,0 +1,164 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+from kubetools.kubernetes import rollout
+
+
+def _make_pod(*container_states):
+    return SimpleNamespace(
+        metadata=SimpleNamespace(name='web-abc'),
+        status=SimpleNamespace(
+            init_container_statuses=None,
+            container_statuses=[
+                SimpleNamespace(
+                    name=f'container-{i}',
+                    state=SimpleNamespace(waiting=SimpleNamespace(
+                        reason=reason,
+                        message='nope',
+                    ) if reason else None),
+                )
+                for i, reason in enumerate(container_states)
+            ],
+        ),
+    )
+
+
+def _make_replica_set(owner_uid, revision):
+    return SimpleNamespace(metadata=SimpleNamespace(
+        annotations={rollout.DEPLOYMENT_REVISION_ANNOTATION_KEY: revision},
+        owner_references=[SimpleNamespace(uid=owner_uid)],
+    ))
+
+
+class TestGetPodFailure(TestCase):
+    def test_image_pull_failure(self):
+        reason, message = rollout.get_pod_failure(_make_pod(None, 'ImagePullBackOff'))
+
+        self.assertEqual(reason, 'ImagePullBackOff')
+        self.assertIn('container-1', message)
+
+    def test_pending_pod_is_not_failure(self):
+        self.assertIsNone(rollout.get_pod_failure(_make_pod('ContainerCreating')))
+
+
+class TestGetDeploymentFailure(TestCase):
+    def test_progress_deadline_exceeded(self):
+        deployment = SimpleNamespace(status=SimpleNamespace(conditions=[
+            SimpleNamespace(
+                type='Progressing',
+                reason='ProgressDeadlineExceeded',
+                message='too slow',
+            ),
+        ]))
+
+        self.assertEqual(
+            rollout.get_deployment_failure(deployment),
+            ('ProgressDeadlineExceeded', 'too slow'),
+        )
+
+
+def _make_deployment(generation=2, observed_generation=2, desired_replicas=2, **status):
+    status.setdefault('replicas', desired_replicas)
+    status.setdefault('updated_replicas', desired_replicas)
+    status.setdefault('available_replicas', desired_replicas)
+
+    return SimpleNamespace(
+        metadata=SimpleNamespace(generation=generation),
+        spec=SimpleNamespace(replicas=desired_replicas),
+        status=SimpleNamespace(observed_generation=observed_generation, **status),
+    )
+
+
+class TestIsDeploymentRolledOut(TestCase):
+    def test_rolled_out(self):
+        self.assertTrue(rollout.is_deployment_rolled_out(_make_deployment()))
+
+    def test_spec_not_yet_observed(self):
+        # The old replica set is fully ready but the controller hasn't seen the
+        # new spec yet, so this must not count as rolled out.
+        self.assertFalse(rollout.is_deployment_rolled_out(
+            _make_deployment(observed_generation=1),
+        ))
+
+    def test_waiting_for_updated_replicas(self):
+        self.assertFalse(rollout.is_deployment_rolled_out(
+            _make_deployment(updated_replicas=1),
+        ))
+
+    def test_waiting_for_old_replicas_to_terminate(self):
+        self.assertFalse(rollout.is_deployment_rolled_out(
+            _make_deployment(replicas=3),
+        ))
+
+    def test_waiting_for_available_replicas(self):
+        self.assertFalse(rollout.is_deployment_rolled_out(
+            _make_deployment(available_replicas=1),
+        ))
+
+
+class TestGetNewReplicaSet(TestCase):
+    def test_matches_owner_and_revision(self):
+        deployment = SimpleNamespace(metadata=SimpleNamespace(
+            uid='abc',
+            annotations={rollout.DEPLOYMENT_REVISION_ANNOTATION_KEY: '2'},
+        ))
+        old_replica_set = _make_replica_set('abc', '1')
+        other_replica_set = _make_replica_set('def', '2')
+        new_replica_set = _make_replica_set('abc', '2')
+
+        self.assertIs(
+            rollout.get_new_replica_set(
+                deployment,
+                [old_replica_set, other_replica_set, new_replica_set],
+            ),
+            new_replica_set,
+        )
+
+
+def _make_job(succeeded=None, completions=1, conditions=None):
+    return SimpleNamespace(
+        spec=SimpleNamespace(completions=completions),
+        status=SimpleNamespace(succeeded=succeeded, conditions=conditions),
+    )
+
+
+class TestJobStatus(TestCase):
+    def test_failed_condition(self):
+        job = _make_job(conditions=[SimpleNamespace(
+            type='Failed',
+            status='True',
+            reason='BackoffLimitExceeded',
+            message='Job has reached the specified backoff limit',
+        )])
+
+        self.assertEqual(rollout.get_job_failure(job)[0], 'BackoffLimitExceeded')
+        self.assertFalse(rollout.is_job_complete(job))
+
+    def test_complete(self):
+        job = _make_job(succeeded=1, completions=None)
+
+        self.assertIsNone(rollout.get_job_failure(job))
+        self.assertTrue(rollout.is_job_complete(job))
+
+
+class TestNamespaceTerminationIssues(TestCase):
+    def test_finalizers_remaining(self):
+        namespace = SimpleNamespace(status=SimpleNamespace(conditions=[
+            SimpleNamespace(
+                type='NamespaceDeletionDiscoveryFailure',
+                status='False',
+                reason='ResourcesDiscovered',
+                message='All resources successfully discovered',
+            ),
+            SimpleNamespace(
+                type='NamespaceFinalizersRemaining',
+                status='True',
+                reason='SomeFinalizersRemain',
+                message='Some content in the namespace has finalizers remaining',
+            ),
+        ]))
+
+        self.assertEqual(
+            rollout.get_namespace_termination_issues(namespace),
+            [('SomeFinalizersRemain', 'Some content in the namespace has finalizers remaining')],
+        )
@@ -0,0 +1,84 @@
+from unittest import mock, TestCase
+
+from kubetools.kubernetes.snapshot import NamespaceSnapshot
+
+
+def _make_object(name, labels=None):
+    return {
+        'metadata': {
+            'name': name,
+            'labels': labels or {},
+        },
+    }
+
+
+class TestNamespaceSnapshot(TestCase):
+    def setUp(self):
+        self.list_services = mock.Mock(return_value=[
+            _make_object('web', {'kubetools/name': 'web'}),
+            _make_object('db', {'kubetools/name': 'db'}),
+        ])
+
+        self.snapshot = NamespaceSnapshot('staging', 'default')
+        self.snapshot.kind_to_iter_function = {'service': self.list_services}
+
+    def test_lists_each_kind_once(self):
+        self.assertTrue(self.snapshot.exists('service', 'web'))
+        self.assertFalse(self.snapshot.exists('service', 'missing'))
+        self.assertEqual(len(self.snapshot.get_objects('service')), 2)
+
+        self.list_services.assert_called_once_with('staging', 'default')
+
+    def test_label_index(self):
+        self.snapshot.get_objects('service')
+
+        self.assertEqual(
+            self.snapshot.get_objects_by_label('service', 'kubetools/name', 'db'),
+            [_make_object('db', {'kubetools/name': 'db'})],
+        )
+        self.list_services.assert_called_once_with('staging', 'default')
+
+    def test_label_selector_sent_to_server_when_not_loaded(self):
+        self.snapshot.get_objects_by_label('service', 'kubetools/name', 'db')
+
+        self.list_services.assert_called_once_with(
+            'staging', 'default',
+            label_selector='kubetools/name=db',
+        )
+
+    def test_updated_from_writes(self):
+        self.snapshot.get_objects('service')
+
+        self.snapshot.set_object('service', _make_object('web', {'kubetools/name': 'new'}))
+        self.snapshot.remove_object('service', 'db')
+
+        self.assertFalse(self.snapshot.exists('service', 'db'))
+        self.assertEqual(
+            self.snapshot.get_objects_by_label('service', 'kubetools/name', 'web'),
+            [],
+        )
+        self.assertEqual(
+            len(self.snapshot.get_objects_by_label('service', 'kubetools/name', 'new')),
+            1,
+        )
+        self.list_services.assert_called_once_with('staging', 'default')
+
+    def test_invalidate(self):
+        self.snapshot.get_objects('service')
+        self.snapshot.invalidate('service')
+        self.snapshot.get_objects('service')
+
+        self.assertEqual(self.list_services.call_count, 2)
+
+    def test_metadata_only_reloaded_for_full_objects(self):
+        list_service_metadata = mock.Mock(return_value=[_make_object('web')])
+        self.snapshot.kind_to_iter_metadata_function = {'service': list_service_metadata}
+
+        self.snapshot.get_objects('service', metadata_only=True)
+        self.snapshot.get_objects('service', metadata_only=True)
+        list_service_metadata.assert_called_once_with('staging', 'default')
+        self.list_services.assert_not_called()
+
+        self.snapshot.get_objects('service')
+        self.snapshot.get_objects('service', metadata_only=True)
+        self.list_services.assert_called_once_with('staging', 'default')
@@ -0,0 +1,94 @@
+from unittest import mock, TestCase
+
+from kubernetes.client.rest import ApiException
+
+from kubetools.kubernetes import throttle
+
+
+def _make_response(status, headers=None):
+    return mock.Mock(status=status, headers=headers or {})
+
+
+class TestThrottleRequest(TestCase):
+    def setUp(self):
+        patchers = [
+            mock.patch.object(throttle, 'sleep'),
+            mock.patch.object(throttle, 'get_rate_limiter'),
+        ]
+        self.fake_sleep = patchers[0].start()
+        self.rate_limiter = patchers[1].start().return_value
+
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def test_retries_returned_throttle_response(self):
+        ok_response = _make_response(200)
+        request = mock.Mock(side_effect=[
+            _make_response(429, {'Retry-After': '2'}),
+            ok_response,
+        ])
+
+        response = throttle.throttle_request(request)('GET', '/api')
+
+        self.assertIs(response, ok_response)
+        self.fake_sleep.assert_called_once_with(2.0)
+        self.assertEqual(self.rate_limiter.acquire.call_count, 2)
+
+    def test_retries_raised_unavailable_error(self):
+        request = mock.Mock(side_effect=[ApiException(status=503), _make_response(200)])
+
+        throttle.throttle_request(request)('GET', '/api')
+
+        self.assertEqual(request.call_count, 2)
+
+    def test_other_errors_not_retried(self):
+        request = mock.Mock(side_effect=ApiException(status=404))
+
+        with self.assertRaises(ApiException):
+            throttle.throttle_request(request)('GET', '/api')
+
+        request.assert_called_once()
+
+    def test_gives_up_after_max_retries(self):
+        request = mock.Mock(return_value=_make_response(429))
+
+        with mock.patch.object(throttle.get_settings(), 'KUBE_MAX_RETRIES', 2):
+            response = throttle.throttle_request(request)('GET', '/api')
+
+        self.assertEqual(response.status, 429)
+        self.assertEqual(request.call_count, 3)
+
+    def test_write_not_retried_on_gateway_timeout(self):
+        request = mock.Mock(return_value=_make_response(504))
+
+        response = throttle.throttle_request(request)('POST', '/apis/batch/v1/jobs')
+
+        self.assertEqual(response.status, 504)
+        request.assert_called_once()
+
+    def test_write_retried_when_throttled_or_asked_to(self):
+        request = mock.Mock(side_effect=[
+            _make_response(429),
+            _make_response(503, {'Retry-After': '1'}),
+            _make_response(201),
+        ])
+
+        response = throttle.throttle_request(request)('POST', '/apis/batch/v1/jobs')
+
+        self.assertEqual(response.status, 201)
+        self.assertEqual(request.call_count, 3)
+
+
+class TestTokenBucket(TestCase):
+    def test_waits_once_burst_used(self):
+        bucket = throttle.TokenBucket(qps=10, burst=2)
+
+        with mock.patch.object(throttle, 'sleep') as fake_sleep:
+            bucket.acquire()
+            bucket.acquire()
+            fake_sleep.assert_not_called()
+
+            bucket.acquire()
+
+        fake_sleep.assert_called_once()
+        self.assertAlmostEqual(fake_sleep.call_args[0][0], 0.1, places=2)
@@ -0,0 +1,271 @@
+from threading import Event
+from types import SimpleNamespace
+from unittest import mock, TestCase
+
+from kubernetes.client.rest import ApiException
+
+from kubetools.exceptions import KubeBuildError, KubeTimeoutError
+from kubetools.kubernetes import wait
+
+
+def _make_object(name, resource_version, ready=False):
+    return SimpleNamespace(
+        ready=ready,
+        metadata=SimpleNamespace(name=name, resource_version=resource_version),
+    )
+
+
+def _make_list(items, resource_version):
+    return SimpleNamespace(
+        items=items,
+        metadata=SimpleNamespace(resource_version=resource_version),
+    )
+
+
+class FakeWatch(object):
+    def __init__(self, *event_batches):
+        self.event_batches = list(event_batches)
+        self.resource_versions = []
+
+    def __call__(self):
+        return self
+
+    def stream(self, func, resource_version=None, **kwargs):
+        self.resource_versions.append(resource_version)
+        events = self.event_batches.pop(0)
+        if isinstance(events, Exception):
+            raise events
+        return iter(events)
+
+    def stop(self):
+        pass
+
+
+def _patch_watch(fake_watch):
+    return mock.patch.object(wait.watch, 'Watch', fake_watch)
+
+
+def _patch_sleep():
+    return mock.patch.object(wait, 'sleep')
+
+
+class TestWaitForObjectState(TestCase):
+    def test_returns_without_watch_if_already_ready(self):
+        list_function = mock.Mock(return_value=_make_list(
+            [_make_object('app', '1', ready=True)], '1',
+        ))
+        fake_watch = FakeWatch()
+
+        with _patch_watch(fake_watch):
+            wait.wait_for_object_state(
+                list_function, 'app', lambda obj: obj.ready,
+                namespace='default',
+            )
+
+        list_function.assert_called_once_with(
+            field_selector='metadata.name=app',
+            namespace='default',
+        )
+        self.assertEqual(fake_watch.resource_versions, [])
+
+    def test_waits_for_watch_event(self):
+        list_function = mock.Mock(return_value=_make_list(
+            [_make_object('app', '1')], '1',
+        ))
+        fake_watch = FakeWatch([
+            {'type': 'MODIFIED', 'object': _make_object('app', '2')},
+            {'type': 'BOOKMARK', 'object': {'metadata': {'resourceVersion': '2'}}},
+            {'type': 'MODIFIED', 'object': _make_object('app', '3', ready=True)},
+        ])
+
+        with _patch_watch(fake_watch):
+            wait.wait_for_object_state(list_function, 'app', lambda obj: obj.ready)
+
+        self.assertEqual(fake_watch.resource_versions, ['1'])
+        list_function.assert_called_once()
+
+    def test_deleted_event_passes_none(self):
+        list_function = mock.Mock(return_value=_make_list(
+            [_make_object('app', '1')], '1',
+        ))
+        fake_watch = FakeWatch([
+            {'type': 'DELETED', 'object': _make_object('app', '2')},
+        ])
+
+        with _patch_watch(fake_watch):
+            wait.wait_for_object_state(list_function, 'app', lambda obj: obj is None)
+
+    def test_relists_after_expired_resource_version(self):
+        list_function = mock.Mock(side_effect=[
+            _make_list([_make_object('app', '1')], '1'),
+            _make_list([_make_object('app', '5')], '5'),
+        ])
+        fake_watch = FakeWatch(
+            ApiException(status=410),
+            [{'type': 'MODIFIED', 'object': _make_object('app', '6', ready=True)}],
+        )
+
+        with _patch_watch(fake_watch), _patch_sleep() as fake_sleep:
+            wait.wait_for_object_state(list_function, 'app', lambda obj: obj.ready)
+
+        self.assertEqual(fake_watch.resource_versions, ['1', '5'])
+        fake_sleep.assert_not_called()
+
+    def test_periodic_check_between_watches(self):
+        list_function = mock.Mock(return_value=_make_list(
+            [_make_object('app', '1')], '1',
+        ))
+        fake_watch = FakeWatch(
+            [{'type': 'MODIFIED', 'object': _make_object('app', '2')}],
+            [{'type': 'MODIFIED', 'object': _make_object('app', '3', ready=True)}],
+        )
+        periodic_check = mock.Mock()
+
+        with _patch_watch(fake_watch):
+            wait.wait_for_object_state(
+                list_function, 'app', lambda obj: obj.ready,
+                periodic_check=periodic_check,
+            )
+
+        periodic_check.assert_called_once_with()
+        self.assertEqual(fake_watch.resource_versions, ['1', '2'])
+        list_function.assert_called_once()
+
+    def test_timeout(self):
+        list_function = mock.Mock(return_value=_make_list([], '1'))
+
+        with mock.patch.object(wait, 'get_wait_timeout', return_value=0):
+            with self.assertRaises(KubeBuildError):
+                wait.wait_for_object_state(
+                    list_function, 'app', lambda obj: obj is not None,
+                )
+
+
+class TestWaitForObjectsRemoved(TestCase):
+    def test_waits_for_all_objects(self):
+        list_function = mock.Mock(return_value=_make_list([
+            _make_object('pod-a', '1'),
+            _make_object('pod-b', '1'),
+            _make_object('other', '1'),
+        ], '1'))
+        fake_watch = FakeWatch([
+            {'type': 'DELETED', 'object': _make_object('pod-a', '2')},
+            {'type': 'DELETED', 'object': _make_object('other', '3')},
+            {'type': 'DELETED', 'object': _make_object('pod-b', '4')},
+            {'type': 'ADDED', 'object': _make_object('never-reached', '5')},
+        ])
+
+        with _patch_watch(fake_watch):
+            wait.wait_for_objects_removed(
+                list_function, ['pod-a', 'pod-b'],
+                namespace='default',
+                label_selector='app=web',
+            )
+
+        # The initial list is paginated
+        list_function.assert_called_once_with(
+            limit=500,
+            _continue=None,
+            namespace='default',
+            label_selector='app=web',
+        )
+
+    def test_initial_list_follows_pages(self):
+        first_page = _make_list([_make_object('pod-a', '1')], '1')
+        first_page.metadata._continue = 'next'
+        list_function = mock.Mock(side_effect=[
+            first_page,
+            _make_list([_make_object('pod-b', '1')], '1'),
+        ])
+        fake_watch = FakeWatch([
+            {'type': 'DELETED', 'object': _make_object('pod-a', '2')},
+            {'type': 'DELETED', 'object': _make_object('pod-b', '3')},
+        ])
+
+        with _patch_watch(fake_watch):
+            wait.wait_for_objects_removed(list_function, ['pod-a', 'pod-b'])
+
+        self.assertEqual(list_function.call_args[1]['_continue'], 'next')
+        self.assertEqual(fake_watch.resource_versions, ['1'])
+
+    def test_deadline_reports_pending_objects(self):
+        list_function = mock.Mock(return_value=_make_list([
+            _make_object('pod-a', '1'),
+            _make_object('pod-b', '1'),
+        ], '1'))
+
+        with self.assertRaises(KubeTimeoutError) as context:
+            wait.wait_for_objects_removed(
+                list_function, ['pod-a', 'pod-b', 'pod-c'],
+                deadline=wait.monotonic() - 1,
+            )
+
+        self.assertEqual(
+            context.exception.pending,
+            ['pod-a to be removed', 'pod-b to be removed'],
+        )
+
+    def test_returns_if_already_removed(self):
+        list_function = mock.Mock(return_value=_make_list([_make_object('other', '1')], '1'))
+        fake_watch = FakeWatch()
+
+        with _patch_watch(fake_watch):
+            wait.wait_for_objects_removed(list_function, ['pod-a'])
+
+        self.assertEqual(fake_watch.resource_versions, [])
+
+
+class TestFollowObjects(TestCase):
+    def test_relists_after_expired_watch(self):
+        list_function = mock.Mock(side_effect=[
+            _make_list([_make_object('app', '1')], '1'),
+            _make_list([_make_object('app', '5')], '5'),
+        ])
+        stop_event = Event()
+
+        def handle_event(event_type, obj):
+            events.append((event_type, obj.metadata.resource_version))
+            if obj.metadata.resource_version == '6':
+                stop_event.set()
+
+        lists = []
+        events = []
+        fake_watch = FakeWatch(
+            [{'type': 'MODIFIED', 'object': _make_object('app', '2')}],
+            ApiException(status=410),
+            [
+                {'type': 'BOOKMARK', 'object': {'metadata': {'resourceVersion': '5'}}},
+                {'type': 'DELETED', 'object': _make_object('app', '6')},
+            ],
+        )
+
+        with _patch_watch(fake_watch):
+            wait.follow_objects(
+                list_function,
+                lambda items: lists.append([item.metadata.name for item in items]),
+                handle_event,
+                stop_event,
+                namespace='default',
+            )
+
+        self.assertEqual(lists, [['app'], ['app']])
+        self.assertEqual(events, [('MODIFIED', '2'), ('DELETED', '6')])
+        self.assertEqual(fake_watch.resource_versions, ['1', '2', '5'])
+
+    def test_reports_list_errors(self):
+        stop_event = Event()
+        errors = []
+
+        def handle_error(e):
+            errors.append(e.status)
+            stop_event.set()
+
+        list_function = mock.Mock(side_effect=ApiException(status=403))
+
+        wait.follow_objects(
+            list_function, mock.Mock(), mock.Mock(), stop_event,
+            handle_error=handle_error,
+            namespace='default',
+        )
+
+        self.assertEqual(errors, [403])